@@ -0,0 +1,102 @@
+"""Measures the variance reduction of common random numbers.
+
+Compares two bike distributions that differ by a few moved bikes, as in the
+moveOneBike optimizer, and reports how many replications each random
+number scheme needs to estimate the revenue difference to a given
+confidence interval half-width.
+
+Run from the project root directory:
+`python -m simcode.benchmarks.bench_crn`
+"""
+
+# Standard libs.
+import argparse
+import logging
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.confidence as confidence
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+import simcode.src.nycbike as nycbike
+import simcode.src.randomness as randomness
+
+
+def revenueDifferences(scheme, distributions, numPairs, tripDataDir):
+    """Returns samples of the revenue difference between two distributions.
+
+    Args:
+        scheme: 'independent' (separate seeds), 'common' (common random
+            numbers) or 'antithetic' (common random numbers in antithetic
+            pairs, each sample being the mean difference of a pair).
+        distributions: Pair of initial bike distributions.
+        numPairs: Number of samples.
+        tripDataDir: Directory of the trip statistics.
+    """
+    def revenue(distribution, seed, randomMode, antithetic=False):
+        return nycbike.BikeSharingSimulation().run(
+            initialDistribution=distribution, rngSeed=seed,
+            randomMode=randomMode, antithetic=antithetic,
+            tripDataDir=tripDataDir)['Revenue']
+
+    samples = []
+    for i in range(numPairs):
+        if scheme == 'independent':
+            samples.append(
+                revenue(distributions[1], 2 * i + 1, randomness.BATCHED)
+                - revenue(distributions[0], 2 * i, randomness.BATCHED))
+            continue
+        difference = (revenue(distributions[1], i, randomness.COMMON)
+                      - revenue(distributions[0], i, randomness.COMMON))
+        if scheme == 'antithetic':
+            difference = (difference + revenue(
+                distributions[1], i, randomness.COMMON, True) - revenue(
+                distributions[0], i, randomness.COMMON, True)) / 2.0
+        samples.append(difference)
+    return samples
+
+
+def main():
+    """Parses command-line args and runs the benchmark."""
+    parser = argparse.ArgumentParser(
+        description='Common random numbers benchmark')
+    parser.add_argument('--tripDataDir', dest='tripDataDir', action='store',
+        default=load_trip_stats.TRIP_DATA_DIR,
+        help='Directory of the trip statistics.')
+    parser.add_argument('--numPairs', dest='numPairs', action='store',
+        default=20, help='Number of samples of the difference per scheme.')
+    parser.add_argument('--numBikesMoved', dest='numBikesMoved',
+        action='store', default=1,
+        help='Number of bikes moved between the two distributions.')
+    parser.add_argument('--halfWidth', dest='halfWidth', action='store',
+        default=100, help='Target 95%% confidence interval half-width.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    # Move bikes from the first to the second station.
+    numStations = load_trip_stats.loadTripStatistics(
+        args.tripDataDir)[0].shape[0]
+    simulation = nycbike.BikeSharingSimulation()
+    first = simulation.almostUniformWithTotalSum(
+        numStations, nycbike.NUM_BIKES)
+    second = first.copy()
+    second[0] -= int(args.numBikesMoved)
+    second[1] += int(args.numBikesMoved)
+
+    print('%-12s %12s %12s %12s' % (
+        'scheme', 'mean diff', 'std', 'replications'))
+    for scheme in ('independent', 'common', 'antithetic'):
+        samples = revenueDifferences(
+            scheme, (first, second), int(args.numPairs), args.tripDataDir)
+        interval = confidence.confidenceInterval(samples)
+        # Scenario runs needed so that the half-width reaches the target.
+        runsPerSample = 4 if scheme == 'antithetic' else 2
+        numReplications = runsPerSample * int(np.ceil(
+            (1.96 * interval['std'] / float(args.halfWidth)) ** 2))
+        print('%-12s %12.1f %12.1f %12d' % (
+            scheme, interval['mean'], interval['std'], numReplications))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Benchmarks FEL backends on event streams recorded from the simulation.
+
+Run from the project root directory:
+`python -m simcode.benchmarks.bench_fel`
+"""
+
+# Standard libs.
+import argparse
+import logging
+import time
+
+# App libs.
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+import simcode.src.fel as fel
+import simcode.src.nycbike as nycbike
+
+
+# Recorded FEL operations.
+PUSH = 0
+POP = 1
+FIRST = 2
+
+
+class RecordingFEL(fel.HeapFEL):
+    """Heap FEL that records every operation applied to it."""
+
+    def __init__(self):
+        fel.HeapFEL.__init__(self)
+        self.operations = []
+
+    def push(self, entry):
+        self.operations.append((PUSH, entry[0], entry[1]))
+        fel.HeapFEL.push(self, entry)
+
+    def pop(self):
+        self.operations.append((POP, None, None))
+        return fel.HeapFEL.pop(self)
+
+    def first(self):
+        self.operations.append((FIRST, None, None))
+        return fel.HeapFEL.first(self)
+
+
+def recordEventStream(tripDataDir, scaleArrivalRate, mergedArrivals):
+    """Runs the simulation once and returns the recorded FEL operations."""
+    recorder = RecordingFEL()
+    nycbike.BikeSharingSimulation().run(
+        scaleArrivalRate=scaleArrivalRate, rngSeed=0,
+        tripDataDir=tripDataDir, mergedArrivals=mergedArrivals,
+        felBackend=recorder)
+    return recorder.operations
+
+
+def replay(operations, backend):
+    """Replays FEL operations against a backend.
+
+    Returns:
+        Tuple of (operations per second, maximum FEL size).
+    """
+    eventList = fel.makeFEL(backend)
+    push, pop, first = eventList.push, eventList.pop, eventList.first
+    maxSize = 0
+    startTime = time.time()
+    for seq, (operation, timestamp, priority) in enumerate(operations):
+        if operation == PUSH:
+            push((timestamp, priority, seq, None, None))
+        elif operation == POP:
+            pop()
+        else:
+            first()
+    duration = time.time() - startTime
+    # Count the maximum size in a separate pass so it is not timed.
+    size = 0
+    for operation, _, _ in operations:
+        size += 1 if operation == PUSH else -1 if operation == POP else 0
+        maxSize = max(maxSize, size)
+    return len(operations) / duration, maxSize
+
+
+def main():
+    """Parses command-line args and runs the benchmarks."""
+    parser = argparse.ArgumentParser(description='FEL backend benchmark')
+    parser.add_argument('--tripDataDir', dest='tripDataDir', action='store',
+        default=load_trip_stats.TRIP_DATA_DIR,
+        help='Directory of the trip statistics.')
+    parser.add_argument('--scaleArrivalRate', dest='scaleArrivalRate',
+        action='store', default=5, help='Scale factor for arrival rate.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    print('%-16s %-9s %10s %8s %14s' % (
+        'arrivals', 'backend', 'operations', 'maxSize', 'operations/sec'))
+    for mergedArrivals in (False, True):
+        operations = recordEventStream(
+            args.tripDataDir, float(args.scaleArrivalRate), mergedArrivals)
+        for backend in (fel.HEAP, fel.CALENDAR, fel.BUCKET):
+            operationsPerSec, maxSize = replay(operations, backend)
+            print('%-16s %-9s %10d %8d %14.0f' % (
+                'merged stream' if mergedArrivals else 'per-station FEL',
+                backend, len(operations), maxSize, operationsPerSec))
+
+
+if __name__ == '__main__':
+    main()
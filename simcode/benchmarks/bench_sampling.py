@@ -0,0 +1,74 @@
+"""Benchmarks destination sampling methods.
+
+Run from the project root directory:
+`python -m simcode.benchmarks.bench_sampling`
+"""
+
+# Standard libs.
+import argparse
+import logging
+import time
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+import simcode.src.nycbike as nycbike
+import simcode.src.sampling as sampling
+
+
+def benchmarkDraws(destinationP, method, numDraws):
+    """Measures raw destination draws per second for a sampling method."""
+    sampler = sampling.makeSampler(destinationP, method)
+    # Draw from rows that have at least one destination.
+    rows = np.flatnonzero(destinationP.sum(axis=2).ravel() > 0)
+    rng = np.random.RandomState(0)
+    rows = rows[rng.randint(len(rows), size=numDraws)].tolist()
+    uniforms = rng.random_sample(numDraws).tolist()
+    numTimeframes = destinationP.shape[1]
+
+    startTime = time.time()
+    for r, u in zip(rows, uniforms):
+        sampler.sample(r // numTimeframes, r % numTimeframes, u)
+    return numDraws / (time.time() - startTime)
+
+
+def benchmarkSimulation(method, scaleArrivalRate, tripDataDir):
+    """Measures simulation events per second for a sampling method."""
+    simulation = nycbike.BikeSharingSimulation()
+    # Warm up the caches so that only the simulation itself is timed.
+    simulation.run(scaleArrivalRate=scaleArrivalRate, rngSeed=0,
+                   tripDataDir=tripDataDir, samplingMethod=method)
+    startTime = time.time()
+    simulation.run(scaleArrivalRate=scaleArrivalRate, rngSeed=0,
+                   tripDataDir=tripDataDir, samplingMethod=method)
+    duration = time.time() - startTime
+    return simulation.simEngine.numEventsProcessed / duration
+
+
+def main():
+    """Parses command-line args and runs the benchmarks."""
+    parser = argparse.ArgumentParser(description='Sampling benchmark')
+    parser.add_argument('--tripDataDir', dest='tripDataDir', action='store',
+        default=load_trip_stats.TRIP_DATA_DIR,
+        help='Directory of the trip statistics.')
+    parser.add_argument('--numDraws', dest='numDraws', action='store',
+        default=200000, help='Number of raw destination draws.')
+    parser.add_argument('--scaleArrivalRate', dest='scaleArrivalRate',
+        action='store', default=5, help='Scale factor for arrival rate.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    _, _, destinationP = load_trip_stats.loadTripStatistics(args.tripDataDir)
+    print('%-8s %16s %16s' % ('method', 'draws/sec', 'events/sec'))
+    for method in (sampling.CHOICE, sampling.ALIAS):
+        drawsPerSec = benchmarkDraws(
+            destinationP, method, int(args.numDraws))
+        eventsPerSec = benchmarkSimulation(
+            method, float(args.scaleArrivalRate), args.tripDataDir)
+        print('%-8s %16.0f %16.0f' % (method, drawsPerSec, eventsPerSec))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+"""Benchmarks the simulation on synthetic networks of configurable scale.
+
+Synthetic trip statistics are generated for every number of stations and
+destination sparsity, in the sparse format so that networks of 10,000
+stations fit in memory, and the simulation is run on them at every arrival
+rate scale factor. Every run reports its load time, setup time
+(computeArrivalTimes, destination sampler and the Initialize event),
+events/sec and peak RSS. Runs execute in fresh worker processes, so that
+the peak RSS of one run does not carry over to the next.
+
+Results are saved as JSON. Pass the JSON file of an earlier version as
+--baseline to print the relative change of every run.
+
+Run from the project root directory, e.g.:
+`python -m simcode.benchmarks.bench_scale --numStations=1000,10000 --scaleArrivalRates=1,20 --output=bench_scale.json`
+"""
+
+# Standard libs.
+import argparse
+import concurrent.futures
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+import simcode.src.nycbike as nycbike
+import simcode.src.sampling as sampling
+
+
+# Share of the daily trips that start in every hour, as in the Citi Bike
+# trip statistics of January 2018.
+HOURLY_PROFILE = np.array([
+    94, 25, 4, 4, 10, 127, 506, 1144, 2037, 1563, 1006, 983, 1145, 1249,
+    1355, 1435, 1655, 2302, 2154, 1402, 925, 619, 435, 225], dtype=float)
+HOURLY_PROFILE /= HOURLY_PROFILE.sum()
+
+# Mean number of trips per station and day in the Citi Bike statistics.
+TRIPS_PER_STATION = 29.2
+
+# Riding time in minutes between neighboring stations, which sets the size
+# of the synthetic city, and the shortest trip duration in minutes.
+STATION_SPACING = 3.0
+MIN_DURATION = 5.0
+
+# Number of start stations generated at a time.
+GENERATE_BLOCK_SIZE = 256
+
+# Parameters that identify a run, used to match runs with the baseline.
+CONFIG_KEYS = ('numStations', 'destinationsPerStation', 'tripsPerStation',
+               'scaleArrivalRate', 'seed')
+
+
+def generateTripStatistics(tripDataDir, numStations, destinationsPerStation,
+                           tripsPerStation=TRIPS_PER_STATION, seed=0):
+    """Writes synthetic trip statistics in the format of loadTripStatistics.
+
+    Stations are placed uniformly at random in a square city. Their daily
+    trip counts are log-normally distributed, follow the hourly profile of
+    the Citi Bike data, and every trip goes to one of the
+    destinationsPerStation nearest stations, with random probabilities per
+    timeframe. Trip durations grow with the distance. The destination
+    probabilities are written in the sparse format only.
+
+    Args:
+        tripDataDir: Directory in which the statistics are written.
+        numStations: Number of stations.
+        destinationsPerStation: Number of destinations of every station.
+        tripsPerStation: Mean number of trips per station and day.
+        seed: Seed of the random number generator.
+    """
+    if not os.path.exists(tripDataDir):
+        os.makedirs(tripDataDir)
+    rng = np.random.RandomState(seed)
+    numTimeframes = len(HOURLY_PROFILE)
+    numDestinations = min(destinationsPerStation, numStations)
+
+    rates = rng.lognormal(sigma=1.0, size=numStations)
+    rates *= tripsPerStation / rates.mean()
+    tripCountData = rng.poisson(np.outer(rates, HOURLY_PROFILE))
+    np.save(os.path.join(tripDataDir, load_trip_stats.TRIP_COUNT_FILENAME),
+            tripCountData)
+
+    positions = rng.random_sample((numStations, 2)) * (
+        STATION_SPACING * np.sqrt(numStations))
+    tripDurations = np.lib.format.open_memmap(
+        os.path.join(tripDataDir, load_trip_stats.TRIP_DURATION_FILENAME),
+        mode='w+', dtype=np.float64, shape=(numStations, numStations))
+    indexDtype = load_trip_stats.SparseDestinationP.indexDtype(numStations)
+    indices = np.empty((numStations, numTimeframes, numDestinations),
+                       dtype=indexDtype)
+    probs = np.empty((numStations, numTimeframes, numDestinations),
+                     dtype=np.float32)
+    for start in range(0, numStations, GENERATE_BLOCK_SIZE):
+        block = slice(start, min(start + GENERATE_BLOCK_SIZE, numStations))
+        distances = np.sqrt(((positions[block, np.newaxis, :]
+                              - positions[np.newaxis, :, :]) ** 2).sum(2))
+        neighbors = np.sort(np.argpartition(
+            distances, numDestinations - 1, axis=1)[:, :numDestinations],
+            axis=1)
+        rows = np.arange(len(neighbors))[:, np.newaxis]
+        durations = np.full(distances.shape, np.nan)
+        durations[rows, neighbors] = (
+            MIN_DURATION + distances[rows, neighbors])
+        tripDurations[block] = durations
+        indices[block] = neighbors[:, np.newaxis, :]
+        weights = rng.random_sample(
+            (len(neighbors), numTimeframes, numDestinations))
+        probs[block] = weights / weights.sum(axis=2, keepdims=True)
+    tripDurations.flush()
+    del tripDurations
+
+    offsets = np.arange(numStations * numTimeframes + 1,
+                        dtype=np.int64) * numDestinations
+    destinationP = load_trip_stats.SparseDestinationP(
+        offsets, indices.ravel(), probs.ravel(),
+        (numStations, numTimeframes, numStations))
+    destinationP.save(os.path.join(
+        tripDataDir, load_trip_stats.SPARSE_DESTINATION_PROBS_FILENAME))
+
+
+class TimedSimulation(nycbike.BikeSharingSimulation):
+    """Simulation that times the setup steps of _initialize."""
+
+    def __init__(self):
+        self.timings = {}
+
+    def computeArrivalTimes(self, tripCountData):
+        startTime = time.time()
+        arrivalTimes = nycbike.BikeSharingSimulation.computeArrivalTimes(
+            self, tripCountData)
+        self.timings['computeArrivalTimes'] = time.time() - startTime
+        return arrivalTimes
+
+    def _loadTripData(self, *args):
+        startTime = time.time()
+        tripData = nycbike.BikeSharingSimulation._loadTripData(self, *args)
+        self.timings['loadTripData'] = time.time() - startTime
+        return tripData
+
+
+def _peakRss():
+    """Returns the peak resident set size of the process in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def benchmarkRun(tripDataDir, scaleArrivalRate, bikesPerStation,
+                 racksPerStation, samplingMethod):
+    """Runs the simulation once on a synthetic network and times it.
+
+    Returns:
+        Dictionary of the measurements, with times in seconds and memory
+        in MB.
+    """
+    baselineRss = _peakRss()
+    startTime = time.time()
+    tripCountData, _, _ = load_trip_stats.loadTripStatistics(
+        tripDataDir, sparse=True)
+    loadTime = time.time() - startTime
+
+    # The statistics are cached, so _initialize only derives the arrival
+    # schedule and the destination sampler from them.
+    simulation = TimedSimulation()
+    simEngine, globalData = simulation._initialize(
+        totalNumBikes=bikesPerStation * len(tripCountData),
+        racksPerStation=racksPerStation, scaleArrivalRate=scaleArrivalRate,
+        rngSeed=0, tripDataDir=tripDataDir, sparseDestinations=True,
+        samplingMethod=samplingMethod)
+    startTime = time.time()
+    # The Initialize event is the first event of the run.
+    simEngine.runSimulation(maxEvents=1)
+    initializeTime = time.time() - startTime
+
+    startTime = time.time()
+    simEngine.runSimulation()
+    runTime = time.time() - startTime
+    statistics = simulation._finish(simEngine, globalData, startTime)
+    numEvents = simEngine.numEventsProcessed - 1
+
+    timings = simulation.timings
+    return {
+        'numArrivals': int(globalData['arrivalTimes'].numArrivals()),
+        'numEvents': numEvents,
+        'revenue': float(statistics['Revenue']),
+        'loadTime': loadTime,
+        'computeArrivalTimesTime': timings['computeArrivalTimes'],
+        'samplerTime': (timings['loadTripData']
+                        - timings['computeArrivalTimes']),
+        'initializeTime': initializeTime,
+        'runTime': runTime,
+        'eventsPerSec': numEvents / runTime,
+        'baselineRssMB': baselineRss,
+        'peakRssMB': _peakRss(),
+    }
+
+
+def _inWorker(function, *args):
+    """Calls function in a fresh worker process and returns its result."""
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(function, *args).result()
+
+
+def _gitCommit():
+    """Returns the commit of the working tree, or None outside git."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runBenchmarks(configs, dataDir, bikesPerStation=15,
+                  racksPerStation=nycbike.RACKS,
+                  samplingMethod=sampling.ALIAS):
+    """Runs the benchmark configurations.
+
+    The synthetic statistics of a network are generated once and reused by
+    all arrival rates.
+
+    Args:
+        configs: Iterable of dictionaries with the CONFIG_KEYS.
+        dataDir: Directory in which the synthetic statistics are generated.
+            Networks already generated there are reused.
+        bikesPerStation: Number of bikes per station.
+        racksPerStation: Number of bike racks per station.
+        samplingMethod: Method used to select trip destinations.
+
+    Yields:
+        Dictionary of the configuration and measurements of every run.
+    """
+    for config in configs:
+        tripDataDir = os.path.join(
+            dataDir, 'stations%d_destinations%d_trips%g_seed%d' % (
+                config['numStations'], config['destinationsPerStation'],
+                config['tripsPerStation'], config['seed']))
+        generateTime = 0.0
+        if not os.path.exists(os.path.join(
+                tripDataDir,
+                load_trip_stats.SPARSE_DESTINATION_PROBS_FILENAME)):
+            startTime = time.time()
+            _inWorker(generateTripStatistics, tripDataDir,
+                      config['numStations'], config['destinationsPerStation'],
+                      config['tripsPerStation'], config['seed'])
+            generateTime = time.time() - startTime
+        result = dict(config)
+        result['generateTime'] = generateTime
+        result.update(_inWorker(
+            benchmarkRun, tripDataDir, config['scaleArrivalRate'],
+            bikesPerStation, racksPerStation, samplingMethod))
+        yield result
+
+
+def _configKey(result):
+    return tuple(result[key] for key in CONFIG_KEYS)
+
+
+def _parseList(value, valueType):
+    return [valueType(item) for item in value.split(',')]
+
+
+def main():
+    """Parses command-line args and runs the benchmarks."""
+    parser = argparse.ArgumentParser(description='Synthetic scale benchmark')
+    parser.add_argument('--numStations', dest='numStations', action='store',
+        default='1000,10000', help='Comma-separated numbers of stations.')
+    parser.add_argument('--scaleArrivalRates', dest='scaleArrivalRates',
+        action='store', default='1,5',
+        help='Comma-separated arrival rate scale factors.')
+    parser.add_argument('--destinationsPerStation',
+        dest='destinationsPerStation', action='store', default='20',
+        help='Comma-separated numbers of destinations per station.')
+    parser.add_argument('--tripsPerStation', dest='tripsPerStation',
+        action='store', default=TRIPS_PER_STATION,
+        help='Mean number of trips per station and day.')
+    parser.add_argument('--bikesPerStation', dest='bikesPerStation',
+        action='store', default=15, help='Number of bikes per station.')
+    parser.add_argument('--seed', dest='seed', action='store', default=0,
+        help='Seed of the synthetic statistics.')
+    parser.add_argument('--dataDir', dest='dataDir', action='store',
+        default=None, help='Directory in which the synthetic statistics '
+        'are kept. Defaults to a temporary directory.')
+    parser.add_argument('--output', dest='output', action='store',
+        default='bench_scale.json', help='JSON file of the results.')
+    parser.add_argument('--baseline', dest='baseline', action='store',
+        default=None, help='JSON file of earlier results to compare with.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    configs = [
+        {'numStations': numStations,
+         'destinationsPerStation': destinationsPerStation,
+         'tripsPerStation': float(args.tripsPerStation),
+         'scaleArrivalRate': scaleArrivalRate,
+         'seed': int(args.seed)}
+        for numStations, destinationsPerStation, scaleArrivalRate
+        in itertools.product(
+            _parseList(args.numStations, int),
+            _parseList(args.destinationsPerStation, int),
+            _parseList(args.scaleArrivalRates, float))]
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = dict((_configKey(result), result)
+                            for result in json.load(f)['results'])
+
+    dataDir = args.dataDir or tempfile.mkdtemp()
+    print('%8s %6s %6s %10s %8s %8s %8s %12s %8s %s' % (
+        'stations', 'dests', 'scale', 'events', 'load', 'setup', 'run',
+        'events/sec', 'RSS MB', 'vs baseline'))
+    results = []
+    try:
+        for result in runBenchmarks(configs, dataDir,
+                                    int(args.bikesPerStation)):
+            results.append(result)
+            setupTime = (result['computeArrivalTimesTime']
+                         + result['samplerTime'] + result['initializeTime'])
+            comparison = ''
+            previous = baseline.get(_configKey(result))
+            if previous is not None:
+                comparison = 'events/sec %+.1f%%, RSS %+.1f%%' % (
+                    100 * (result['eventsPerSec']
+                           / previous['eventsPerSec'] - 1),
+                    100 * (result['peakRssMB'] / previous['peakRssMB'] - 1))
+            print('%8d %6d %6g %10d %8.2f %8.2f %8.2f %12.0f %8.0f %s' % (
+                result['numStations'], result['destinationsPerStation'],
+                result['scaleArrivalRate'], result['numEvents'],
+                result['loadTime'], setupTime, result['runTime'],
+                result['eventsPerSec'], result['peakRssMB'], comparison))
+    finally:
+        if not args.dataDir:
+            shutil.rmtree(dataDir)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'benchmark': 'bench_scale',
+            'timestamp': datetime.datetime.now().isoformat(),
+            'commit': _gitCommit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'results': results,
+        }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,663 @@
+"""Batched time-stepped simulation of many bike sharing scenarios at once.
+
+The batched simulation advances K independent scenarios, which may differ
+in their initial distribution, seed and arrival rate scale factor, together
+in fixed time steps. Station inventories and customer queues are (K,
+stations) integer arrays. Customers arrive at the evenly spaced arrival
+times of BikeSharingSimulation.computeArrivalTimes, the destinations and
+bike losses of all rides that start in a step are drawn in bulk, and the
+queues follow the rules of the nycbike event handlers:
+
+* A customer who finds no bike waits. When a bike is returned, customers
+  who have waited REFUND_TIME or longer are lost, and the next one rides.
+* A customer who finds no empty rack waits until a bike is picked up, and
+  gets a refund after waiting more than REFUND_TIME.
+* Idle time is accumulated at the stations' events and at the end of the
+  day, and rides still in flight at the end of the day are completed.
+
+Within a step, returns are processed before pickups and waits are measured
+in whole steps. This time discretization is the only approximation;
+compareWithSimulation measures the resulting error against
+BikeSharingSimulation.run.
+
+Run from the project root directory to measure the speed and the error:
+`python -m simcode.src.batchsim --numScenarios=20 --numReplications=5`
+"""
+
+# Standard libs.
+import argparse
+import logging
+import time
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.confidence as confidence
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+import simcode.src.fluid as fluid
+import simcode.src.nycbike as nycbike
+import simcode.src.sampling as sampling
+
+
+# Default length of a time step in minutes.
+DEFAULT_TIME_STEP = 1.0
+
+# Initial number of variates pre-drawn per scenario.
+DEFAULT_BLOCK_SIZE = 1024
+
+# Tolerance of the arrival counts to rounding errors of the arrival times.
+_ARRIVAL_EPSILON = 1e-9
+
+
+class _ScenarioStreams(object):
+    """Uniform variates drawn from a separate generator per scenario.
+
+    Every scenario consumes its own generator in order, so the variates of
+    a scenario depend only on its seed and not on the other scenarios of
+    the batch. The variates are pre-drawn into one buffer row per scenario.
+    """
+
+    def __init__(self, seeds, blockSize=DEFAULT_BLOCK_SIZE):
+        self.generators = [np.random.default_rng(seed) for seed in seeds]
+        self.buffers = np.empty((len(seeds), blockSize))
+        # All buffers start out consumed.
+        self.cursors = np.full(len(seeds), blockSize)
+
+    def take(self, counts):
+        """Returns the next counts[k] variates of every scenario k.
+
+        Args:
+            counts: Integer array with the number of variates per scenario.
+
+        Returns:
+            Array of the variates of scenario 0, then scenario 1, etc.
+        """
+        blockSize = self.buffers.shape[1]
+        if counts.max() > blockSize:
+            self._refill(np.arange(len(counts)), 2 * counts.max())
+        else:
+            rows = np.flatnonzero(self.cursors + counts > blockSize)
+            if len(rows):
+                self._refill(rows, blockSize)
+        scenarios = np.repeat(np.arange(len(counts)), counts)
+        firsts = np.cumsum(counts) - counts
+        positions = (np.arange(len(scenarios)) - firsts[scenarios]
+                     + self.cursors[scenarios])
+        self.cursors += counts
+        return self.buffers[scenarios, positions]
+
+    def _refill(self, rows, blockSize):
+        """Moves the unused variates of rows to the front and draws more."""
+        unused = [self.buffers[row, self.cursors[row]:].copy()
+                  for row in rows]
+        if blockSize != self.buffers.shape[1]:
+            self.buffers = np.empty((len(self.buffers), blockSize))
+        for row, unused in zip(rows, unused):
+            self.buffers[row, :len(unused)] = unused
+            self.buffers[row, len(unused):] = self.generators[row].random(
+                blockSize - len(unused))
+            self.cursors[row] = 0
+
+
+class _WaitingQueues(object):
+    """Customers waiting at every (scenario, station), by time waited.
+
+    Customers who have waited fewer than numAges steps are counted in a ring
+    buffer with one row per step, so that they age without being moved.
+    Customers who have waited longer are merged into one count, with the
+    sum of the steps in which they started waiting. Stations are indexed by
+    the flat (scenario, station) index.
+    """
+
+    def __init__(self, numAges, size):
+        self.numAges = numAges
+        self.recent = np.zeros((numAges, size), dtype=np.int64)
+        self.old = np.zeros(size, dtype=np.int64)
+        self.oldStepSum = np.zeros(size)
+        # Total number of waiting customers.
+        self.numWaiting = np.zeros(size, dtype=np.int64)
+        # Indices of the stations that joined every row of recent, so that
+        # aging does not scan all stations.
+        self.joined = [[] for _ in range(numAges)]
+
+    def join(self, step, counts, indices=None):
+        """Adds customers who start waiting in a step.
+
+        Args:
+            step: Current step.
+            counts: Number of customers per station, or per index of
+                indices.
+            indices: Unique station indices. All stations if unspecified.
+        """
+        if indices is None:
+            indices = np.flatnonzero(counts)
+            counts = counts[indices]
+        if len(indices):
+            self.recent[step % self.numAges, indices] += counts
+            self.numWaiting[indices] += counts
+            self.joined[step % self.numAges].append(indices)
+
+    def serve(self, step, indices, available, maxAge=None):
+        """Removes waiting customers, longest waiting first.
+
+        Args:
+            step: Current step.
+            indices: Unique station indices.
+            available: Maximum number of customers removed per index.
+            maxAge: Only customers who have waited at most this many steps
+                are removed. All customers if unspecified.
+
+        Returns:
+            (removed, waitSteps, removedOld) arrays per index: the number of
+            removed customers, their total wait in steps and the number of
+            them who have waited numAges steps or longer.
+        """
+        available = available.copy()
+        waitSteps = np.zeros(len(indices))
+        removedOld = np.zeros(len(indices), dtype=np.int64)
+        if maxAge is None:
+            waiting = self.old[indices]
+            removedOld = np.minimum(waiting, available)
+            # Their waits are estimated from the mean of their start steps.
+            meanStep = self.oldStepSum[indices] / np.maximum(waiting, 1)
+            waitSteps += removedOld * (step - meanStep)
+            self.oldStepSum[indices] -= removedOld * meanStep
+            self.old[indices] -= removedOld
+            available -= removedOld
+            maxAge = self.numAges - 1
+        removed = removedOld.copy()
+        for age in range(maxAge, -1, -1):
+            row = self.recent[(step - age) % self.numAges]
+            served = np.minimum(row[indices], available)
+            row[indices] -= served
+            waitSteps += served * age
+            available -= served
+            removed += served
+        self.numWaiting[indices] -= removed
+        return removed, waitSteps, removedOld
+
+    def removeOlder(self, step, indices, minAge):
+        """Removes the customers who have waited minAge steps or longer.
+
+        Args:
+            step: Current step.
+            indices: Unique station indices.
+            minAge: Minimum number of steps waited.
+
+        Returns:
+            (removed, waitSteps) arrays per index: the number of removed
+            customers and their total wait in steps.
+        """
+        removed = self.old[indices].copy()
+        waitSteps = step * removed - self.oldStepSum[indices]
+        self.old[indices] = 0
+        self.oldStepSum[indices] = 0
+        for age in range(minAge, self.numAges):
+            row = self.recent[(step - age) % self.numAges]
+            removed += row[indices]
+            waitSteps += row[indices] * age
+            row[indices] = 0
+        self.numWaiting[indices] -= removed
+        return removed, waitSteps
+
+    def age(self, step):
+        """Merges the customers who reach numAges steps at step's end."""
+        firstStep = step - (self.numAges - 1)
+        joined = self.joined[firstStep % self.numAges]
+        if joined:
+            # Repeated indices are harmless, as they add the same counts.
+            indices = np.concatenate(joined)
+            row = self.recent[firstStep % self.numAges]
+            self.old[indices] += row[indices]
+            self.oldStepSum[indices] += firstStep * row[indices]
+            row[indices] = 0
+            del joined[:]
+
+
+class BatchedSimulation(object):
+    """Time-stepped simulation of a batch of scenarios."""
+
+    def __init__(self, tripCountData, tripDurations, destinationP,
+                 racksPerStation=nycbike.RACKS, timeStep=DEFAULT_TIME_STEP,
+                 bikeLossProb=nycbike.BIKE_LOSS_PROBABILITY,
+                 destinationSampler=None):
+        """Creates the simulation from the trip statistics.
+
+        Args:
+            tripCountData: Array where entry [i][j] is the number of trips
+                from station i in timeframe j.
+            tripDurations: Array of average trip durations in minutes.
+            destinationP: Destination probabilities, dense or
+                SparseDestinationP.
+            racksPerStation: Number of racks per station.
+            timeStep: Length of a time step in minutes.
+            bikeLossProb: Probability of a bike being lost on a ride.
+            destinationSampler: sampling.AliasSampler of destinationP. It is
+                built if unspecified.
+        """
+        self.tripCountData = np.asarray(tripCountData)
+        self.tripDurations = np.asarray(tripDurations)
+        self.numStations, self.numTimeframes = self.tripCountData.shape
+        self.racksPerStation = racksPerStation
+        self.timeStep = float(timeStep)
+        self.bikeLossProb = bikeLossProb
+        self.numSteps = int(np.ceil(nycbike.DAY_DURATION / self.timeStep))
+        self.destinationSampler = (
+            destinationSampler
+            or sampling.makeSampler(destinationP, sampling.ALIAS))
+
+    @classmethod
+    def fromTripData(cls, tripDataDir=None, sparseDestinations=False,
+                     **kwargs):
+        """Creates the simulation from the trip statistics in a directory.
+
+        Args:
+            tripDataDir: Directory containing the trip statistics.
+            sparseDestinations: If True, the sparse destination
+                probabilities are used.
+            kwargs: Other arguments of BatchedSimulation.
+        """
+        tripDataDir = tripDataDir or load_trip_stats.TRIP_DATA_DIR
+        tripCountData, tripDurations, destinationP = (
+            load_trip_stats.loadTripStatistics(
+                tripDataDir, sparse=sparseDestinations))
+        # Shares the alias tables with BikeSharingSimulation.run.
+        destinationSampler = load_trip_stats.getDerivedArtifact(
+            tripDataDir, 'destinationSampler',
+            (sampling.ALIAS, sparseDestinations),
+            lambda: sampling.makeSampler(destinationP, sampling.ALIAS))
+        return cls(tripCountData, tripDurations, destinationP,
+                   destinationSampler=destinationSampler, **kwargs)
+
+    def run(self, initialDistributions, rngSeeds=None, scaleArrivalRates=1):
+        """Simulates a day of every scenario.
+
+        Args:
+            initialDistributions: Array of shape (stations,) or (K,
+                stations) of initial numbers of bikes.
+            rngSeeds: Seed of every scenario, given as a sequence of K
+                integers or np.random.SeedSequence objects. A single seed is
+                spawned into K independent seeds, and without seeds every
+                scenario gets fresh entropy.
+            scaleArrivalRates: Scale factor for the number of arrivals,
+                either one for all scenarios or one per scenario.
+
+        Returns:
+            Dictionary with the keys of BikeSharingSimulation.run. Revenue
+            and BikesLost have shape (K,) and the per-station statistics
+            shape (K, stations), without the K dimension for a single
+            distribution.
+        """
+        distributions = np.asarray(initialDistributions)
+        single = distributions.ndim == 1
+        distributions = np.atleast_2d(distributions).astype(np.int64)
+        numScenarios = len(distributions)
+        if rngSeeds is None or np.ndim(rngSeeds) == 0:
+            if not isinstance(rngSeeds, np.random.SeedSequence):
+                rngSeeds = np.random.SeedSequence(rngSeeds)
+            rngSeeds = rngSeeds.spawn(numScenarios)
+        assert len(rngSeeds) == numScenarios
+        scales = np.broadcast_to(
+            np.asarray(scaleArrivalRates, dtype=float), (numScenarios,))
+
+        statistics = self._simulate(
+            distributions, _ScenarioStreams(rngSeeds), scales)
+        if single:
+            statistics = dict(
+                (name, value[0]) for name, value in statistics.items())
+        return statistics
+
+    def _cumulativeArrivals(self, scales):
+        """Returns the arrival counts and their cumulative sums.
+
+        Scenarios with the same scale factor share their counts, so the
+        arrays have shape (1, stations, timeframes) if all scale factors
+        are equal, and (K, stations, timeframes) otherwise. The cumulative
+        sums have an extra leading timeframe of zeros.
+        """
+        if np.all(scales == scales[0]):
+            scales = scales[:1]
+        counts = np.rint(
+            self.tripCountData[None] * scales[:, None, None]).astype(np.int64)
+        cumulative = np.zeros(counts.shape[:2] + (self.numTimeframes + 1,),
+                              dtype=np.int64)
+        np.cumsum(counts, axis=2, out=cumulative[:, :, 1:])
+        return counts, cumulative
+
+    def _arrivalsBefore(self, t, counts, cumulative):
+        """Returns the number of arrivals before time t per station.
+
+        Arrivals are spaced evenly within each timeframe, as in
+        BikeSharingSimulation.computeArrivalTimes.
+        """
+        timeframeLength = float(nycbike.DAY_DURATION) / self.numTimeframes
+        timeframe = int(t // timeframeLength)
+        if timeframe >= self.numTimeframes:
+            return cumulative[:, :, -1]
+        n = counts[:, :, timeframe]
+        elapsed = (t - timeframe * timeframeLength) / timeframeLength
+        return cumulative[:, :, timeframe] + np.minimum(
+            np.ceil(elapsed * n - _ARRIVAL_EPSILON).astype(np.int64), n)
+
+    def _simulate(self, distributions, streams, scales):
+        """Simulates a day of a (K, stations) array of distributions."""
+        numScenarios, numStations = distributions.shape
+        size = numScenarios * numStations
+        dt = self.timeStep
+        counts, cumulative = self._cumulativeArrivals(scales)
+
+        # Customers waiting for a bike are lost from this many steps on, and
+        # customers waiting for a rack at least numAges steps get a refund.
+        lostAge = int(np.ceil(nycbike.REFUND_TIME / dt))
+        numAges = int(nycbike.REFUND_TIME // dt) + 1
+        pickupQueues = _WaitingQueues(numAges, size)
+        dropoffQueues = _WaitingQueues(numAges, size)
+        # Rides in flight as arrays of flat (scenario, destination) indices
+        # by the step in which they end.
+        inFlight = {}
+
+        # Station arrays are indexed by the flat (scenario, station) index,
+        # and bikes is also viewed with shape (K, stations).
+        bikes = distributions.ravel().copy()
+        bikesByScenario = bikes.reshape(numScenarios, numStations)
+        revenue = np.zeros(numScenarios, dtype=np.int64)
+        bikesLost = np.zeros(numScenarios, dtype=np.int64)
+        customersLost = np.zeros(size, dtype=np.int64)
+        timeWaitForCycle = np.zeros(size)
+        timeWaitForDropoff = np.zeros(size)
+        idleTime = np.zeros(size)
+        lastEventTime = np.zeros(size)
+        arrivalsBefore = self._arrivalsBefore(0.0, counts, cumulative)
+
+        step = 0
+        while step < self.numSteps or inFlight:
+            inDay = step < self.numSteps
+            # Events happen in the middle of the step.
+            eventTime = (step + 0.5) * dt
+
+            # Rides that end in this step return their bikes.
+            ended = inFlight.pop(step, None)
+            servedWaiting = None
+            if ended is not None:
+                returnedTo, returns = np.unique(
+                    np.concatenate(ended), return_counts=True)
+                docked = np.minimum(
+                    returns, self.racksPerStation - bikes[returnedTo])
+                overflow = returns > docked
+                dropoffQueues.join(step, (returns - docked)[overflow],
+                                   returnedTo[overflow])
+                returnedTo = returnedTo[docked > 0]
+                docked = docked[docked > 0]
+                if inDay:
+                    self._accumulateIdleTime(returnedTo, eventTime, bikes,
+                                             idleTime, lastEventTime)
+                bikes[returnedTo] += docked
+
+                # Returned bikes go to waiting customers, after the
+                # customers who have waited too long give up.
+                waiting = pickupQueues.numWaiting[returnedTo] > 0
+                if waiting.any():
+                    indices = returnedTo[waiting]
+                    lost, waitSteps = pickupQueues.removeOlder(
+                        step, indices, lostAge)
+                    customersLost[indices] += lost
+                    timeWaitForCycle[indices] += waitSteps * dt
+                    served, waitSteps, _ = pickupQueues.serve(
+                        step, indices, docked[waiting], lostAge - 1)
+                    timeWaitForCycle[indices] += waitSteps * dt
+                    bikes[indices] -= served
+                    servedWaiting = (indices, served)
+
+            # New customers take the remaining bikes or start waiting.
+            if inDay:
+                arrivalsAfter = self._arrivalsBefore(
+                    (step + 1) * dt, counts, cumulative)
+                arrivals = np.broadcast_to(
+                    arrivalsAfter - arrivalsBefore, bikesByScenario.shape)
+                arrivalsBefore = arrivalsAfter
+                newPickups = np.minimum(arrivals, bikesByScenario).ravel()
+                pickupQueues.join(step, arrivals.ravel() - newPickups)
+                pickups = newPickups
+                if servedWaiting is not None:
+                    pickups = newPickups.copy()
+                    pickups[servedWaiting[0]] += servedWaiting[1]
+                pickedUpAt = np.flatnonzero(pickups)
+                # Stations with returns already had their event.
+                self._accumulateIdleTime(pickedUpAt, eventTime, bikes,
+                                         idleTime, lastEventTime)
+                bikes -= newPickups
+                pickups = pickups[pickedUpAt]
+            elif servedWaiting is not None:
+                pickedUpAt, pickups = servedWaiting
+            else:
+                pickedUpAt = pickups = np.zeros(0, dtype=np.int64)
+
+            # Pickups free racks for the bikes waiting longest.
+            waiting = dropoffQueues.numWaiting[pickedUpAt] > 0
+            if waiting.any():
+                indices = pickedUpAt[waiting]
+                served, waitSteps, refunded = dropoffQueues.serve(
+                    step, indices, pickups[waiting])
+                timeWaitForDropoff[indices] += waitSteps * dt
+                bikes[indices] += served
+                revenue -= nycbike.TRIP_COST * np.bincount(
+                    indices // numStations, refunded,
+                    numScenarios).astype(np.int64)
+
+            if len(pickedUpAt):
+                scenarios = pickedUpAt // numStations
+                revenue += nycbike.TRIP_COST * np.bincount(
+                    scenarios, pickups, numScenarios).astype(np.int64)
+                self._startRides(step, scenarios, pickedUpAt % numStations,
+                                 pickups, streams, inFlight, bikesLost)
+
+            pickupQueues.age(step)
+            dropoffQueues.age(step)
+            step += 1
+            if step == self.numSteps:
+                # The bikes docked at the end of the day were idle since
+                # the last event of their station, as in nycbike.endSim.
+                self._accumulateIdleTime(
+                    slice(None), nycbike.DAY_DURATION, bikes, idleTime,
+                    lastEventTime)
+            # After the end of the day, nothing happens until the next ride
+            # ends. Skipped steps only age the waiting customers.
+            if step >= self.numSteps and inFlight and step not in inFlight:
+                nextStep = min(inFlight)
+                for skippedStep in range(step, min(nextStep, step + numAges)):
+                    pickupQueues.age(skippedStep)
+                    dropoffQueues.age(skippedStep)
+                step = nextStep
+
+        shape = (numScenarios, numStations)
+        return {
+            'Revenue': revenue,
+            'TimeWaitForDropoff': timeWaitForDropoff.reshape(shape),
+            'TimeWaitForCycle': timeWaitForCycle.reshape(shape),
+            'CustomersLost': customersLost.reshape(shape),
+            'BikesLost': bikesLost,
+            'IdleTime': idleTime.reshape(shape),
+        }
+
+    @staticmethod
+    def _accumulateIdleTime(indices, eventTime, bikes, idleTime,
+                            lastEventTime):
+        """Adds the idle time of stations since their last event."""
+        idleTime[indices] += bikes[indices] * (
+            eventTime - lastEventTime[indices])
+        lastEventTime[indices] = eventTime
+
+    def _startRides(self, step, scenarios, starts, pickups, streams,
+                    inFlight, bikesLost):
+        """Draws the outcomes of the rides that start in a step.
+
+        Args:
+            step: Current step.
+            scenarios: Scenario of every station with pickups, in
+                increasing order.
+            starts: Station ID of every station with pickups.
+            pickups: Number of pickups at every station.
+            streams: _ScenarioStreams of the scenarios.
+            inFlight: Dictionary of the rides in flight by end step.
+            bikesLost: Array of the number of bikes lost per scenario.
+        """
+        numScenarios = len(bikesLost)
+        numStations = self.numStations
+        scenarios = np.repeat(scenarios, pickups)
+        starts = np.repeat(starts, pickups)
+        if not len(starts):
+            return
+        # Rides are ordered by scenario, as the variates.
+        variates = streams.take(np.bincount(
+            scenarios, minlength=numScenarios) * 2).reshape(-1, 2)
+        timeframeLength = float(nycbike.DAY_DURATION) / self.numTimeframes
+        timeframe = min(
+            int((step + 0.5) * self.timeStep / timeframeLength),
+            self.numTimeframes - 1)
+        destinations = self.destinationSampler.sampleMany(
+            starts, timeframe, variates[:, 0])
+
+        crashed = variates[:, 1] <= self.bikeLossProb
+        if crashed.any():
+            bikesLost += np.bincount(scenarios[crashed],
+                                     minlength=numScenarios)
+            returned = ~crashed
+            scenarios = scenarios[returned]
+            starts = starts[returned]
+            destinations = destinations[returned]
+            if not len(destinations):
+                return
+
+        # Rides start in the middle of the step and end at least one step
+        # later.
+        endSteps = np.maximum(step + 1, (
+            step + 0.5 + self.tripDurations[starts, destinations]
+            / self.timeStep).astype(np.int64))
+        targets = scenarios * numStations + destinations
+        order = np.argsort(endSteps, kind='stable')
+        endSteps = endSteps[order]
+        targets = targets[order]
+        groupStarts = np.flatnonzero(
+            np.r_[True, endSteps[1:] != endSteps[:-1]])
+        groupEnds = np.r_[groupStarts[1:], len(endSteps)]
+        for begin, end in zip(groupStarts, groupEnds):
+            inFlight.setdefault(endSteps[begin], []).append(
+                targets[begin:end])
+
+
+def compareWithSimulation(batchedSimulation, distributions,
+                          numReplications=5, rngSeed=0, **runKwargs):
+    """Measures the error of the batched simulation.
+
+    Every distribution is simulated numReplications times with both
+    simulations, and the mean totals of every statistic are compared.
+    TimeWaitForDropoff and BikesLost come from rare events: with 5
+    replications on the Jan 2018 data, the 95% confidence intervals of
+    their simulated means are about 11% and 36% of the mean. Their errors
+    are therefore best compared with relativeHalfWidth.
+
+    Args:
+        batchedSimulation: BatchedSimulation.
+        distributions: (K, stations) array of initial distributions.
+        numReplications: Number of runs of every distribution with each
+            simulation.
+        rngSeed: Seed of the first run of every distribution. Run r is
+            seeded with rngSeed + r.
+        runKwargs: Other arguments of BikeSharingSimulation.run, which
+            should match the batched simulation.
+
+    Returns:
+        Dictionary from statistic name to a dictionary with the mean totals
+        per distribution of both simulations (batched, simulation), the
+        relative error of the batched mean (relativeError), and the
+        half-width of the 95% confidence interval of the simulated mean
+        relative to the mean (relativeHalfWidth).
+    """
+    distributions = np.asarray(distributions)
+    seeds = [rngSeed + replication for replication in range(numReplications)]
+    batched = batchedSimulation.run(
+        np.repeat(distributions, numReplications, axis=0),
+        rngSeeds=seeds * len(distributions),
+        scaleArrivalRates=runKwargs.get('scaleArrivalRate', 1))
+
+    comparison = {}
+    for name, values in batched.items():
+        if values.ndim > 1:
+            values = values.sum(axis=1)
+        comparison[name] = {
+            'batched': values.reshape(-1, numReplications).mean(axis=1),
+            'simulation': np.zeros(len(distributions)),
+            'relativeHalfWidth': np.zeros(len(distributions)),
+        }
+    for i, distribution in enumerate(distributions):
+        results = [nycbike.BikeSharingSimulation().run(
+            initialDistribution=distribution, rngSeed=seed, **runKwargs)
+            for seed in seeds]
+        summary = confidence.summarizeReplications(results)
+        for name, result in comparison.items():
+            mean = summary[name]['mean']
+            result['simulation'][i] = mean
+            result['relativeHalfWidth'][i] = (
+                summary[name]['halfWidth'] / abs(mean) if mean else 0.0)
+    for result in comparison.values():
+        simulated = result['simulation']
+        result['relativeError'] = np.where(
+            simulated != 0, (result['batched'] - simulated)
+            / np.where(simulated != 0, np.abs(simulated), 1), 0.0)
+    return comparison
+
+
+def main():
+    """Parses command-line args and measures speed and error."""
+    parser = argparse.ArgumentParser(
+        description='Batched time-stepped simulation')
+    parser.add_argument('--tripDataDir', dest='tripDataDir', action='store',
+        default=load_trip_stats.TRIP_DATA_DIR,
+        help='Directory of the trip statistics.')
+    parser.add_argument('--numScenarios', dest='numScenarios',
+        action='store', default=20,
+        help='Number of random distributions compared.')
+    parser.add_argument('--numReplications', dest='numReplications',
+        action='store', default=5,
+        help='Number of runs of every distribution.')
+    parser.add_argument('--batchSize', dest='batchSize', action='store',
+        default=1000, help='Number of scenarios timed in one batch.')
+    parser.add_argument('--scaleArrivalRate', dest='scaleArrivalRate',
+        action='store', default=1, help='Scale factor for arrival rate.')
+    parser.add_argument('--timeStep', dest='timeStep', action='store',
+        default=DEFAULT_TIME_STEP, help='Time step in minutes.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    scaleArrivalRate = float(args.scaleArrivalRate)
+    batchedSimulation = BatchedSimulation.fromTripData(
+        args.tripDataDir, timeStep=float(args.timeStep))
+    rng = np.random.RandomState(0)
+    batchSize = int(args.batchSize)
+    startTime = time.time()
+    batchedSimulation.run(
+        fluid.randomDistributions(
+            batchSize, batchedSimulation.numStations, rng=rng),
+        rngSeeds=0, scaleArrivalRates=scaleArrivalRate)
+    print('batched simulation: %.0f runs/min' % (
+        60 * batchSize / (time.time() - startTime)))
+
+    comparison = compareWithSimulation(
+        batchedSimulation,
+        fluid.randomDistributions(
+            int(args.numScenarios), batchedSimulation.numStations, rng=rng),
+        int(args.numReplications), tripDataDir=args.tripDataDir,
+        scaleArrivalRate=scaleArrivalRate)
+    print('%-20s %16s %16s %12s %12s' % (
+        'statistic', 'mean batched', 'mean simulation', 'max error',
+        'sim 95% CI'))
+    for name, result in sorted(comparison.items()):
+        print('%-20s %16.1f %16.1f %11.2f%% %11.2f%%' % (
+            name, result['batched'].mean(), result['simulation'].mean(),
+            100 * np.abs(result['relativeError']).max(),
+            100 * result['relativeHalfWidth'].max()))
+
+
+if __name__ == '__main__':
+    main()
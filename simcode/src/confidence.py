@@ -0,0 +1,86 @@
+"""Confidence intervals for statistics estimated from replications."""
+
+# Standard libs.
+import math
+import statistics
+
+# Third-party libs.
+import numpy as np
+
+
+def tQuantile(p, df):
+    """Returns the p-quantile of Student's t distribution.
+
+    The quantile is exact for 1 and 2 degrees of freedom and otherwise uses
+    the Cornish-Fisher expansion around the normal quantile. For confidence
+    levels up to 99%, the expansion is within 1% of the exact quantile with
+    3 degrees of freedom and within 0.01% with 10 or more.
+
+    Args:
+        p: Probability in (0, 1).
+        df: Positive number of degrees of freedom.
+    """
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = statistics.NormalDist().inv_cdf(p)
+    return (z
+            + (z ** 3 + z) / (4.0 * df)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96.0 * df ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z)
+            / (384.0 * df ** 3)
+            + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3
+               - 945 * z) / (92160.0 * df ** 4))
+
+
+def confidenceInterval(samples, confidence=0.95):
+    """Computes the t confidence interval of the mean of samples.
+
+    Args:
+        samples: Sequence of independent observations.
+        confidence: Confidence level of the interval.
+
+    Returns:
+        Dictionary with the keys n, mean, std (sample standard deviation),
+        halfWidth, low and high. With fewer than two samples the standard
+        deviation and half-width are NaN.
+    """
+    samples = np.asarray(samples, dtype=float)
+    n = len(samples)
+    mean = samples.mean()
+    if n > 1:
+        std = samples.std(ddof=1)
+        halfWidth = (tQuantile(0.5 + confidence / 2.0, n - 1)
+                     * std / math.sqrt(n))
+    else:
+        std = halfWidth = float('nan')
+    return {
+        'n': n,
+        'mean': mean,
+        'std': std,
+        'halfWidth': halfWidth,
+        'low': mean - halfWidth,
+        'high': mean + halfWidth,
+    }
+
+
+def summarizeReplications(results, confidence=0.95):
+    """Summarizes the simulation statistics of several replications.
+
+    Args:
+        results: List of statistics dictionaries returned by
+            BikeSharingSimulation.run, one per replication. Per-station
+            statistics are summarized by their total over all stations.
+        confidence: Confidence level of the intervals.
+
+    Returns:
+        Dictionary from statistic name to the confidenceInterval dictionary
+        of its values, with the per-replication values under 'samples'.
+    """
+    summary = {}
+    for name in results[0]:
+        samples = np.array([np.sum(result[name]) for result in results])
+        summary[name] = confidenceInterval(samples, confidence)
+        summary[name]['samples'] = samples
+    return summary
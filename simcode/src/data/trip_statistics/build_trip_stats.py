@@ -0,0 +1,543 @@
+"""Builds the Citi Bike simulation data from trip dataset CSV files.
+
+This replaces the generate_trip_statistics.ipynb notebook. The CSV files are
+read in chunks of rows, and every chunk is reduced with vectorized NumPy
+operations into fixed-size accumulators, so peak memory depends on the
+number of stations and the chunk size but not on the number of trips.
+
+The accumulators hold raw counts and sums, which can be saved and merged,
+so that new months of trips can be folded into earlier ones.
+
+Run from the project root directory, e.g.:
+`python -m simcode.src.data.trip_statistics.build_trip_stats 201801-citibike-tripdata.csv --tripDataDir=simcode/src/data/trip_statistics/`
+"""
+
+# Standard libs.
+import argparse
+import concurrent.futures
+import csv
+import io
+import itertools
+import logging
+import operator
+import os
+import zipfile
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+
+
+# Number of timeframes (hours) per day.
+NUM_TIMEFRAMES = 24
+
+# Default number of CSV rows reduced at a time.
+DEFAULT_CHUNK_SIZE = 100000
+
+# Names of the CSV columns used, in the dataset's older and newer formats.
+# Newer files have no trip duration column, so it is computed from the start
+# and stop times.
+COLUMN_NAMES = {
+    'startTime': ('starttime', 'started_at'),
+    'stopTime': ('stoptime', 'ended_at'),
+    'duration': ('tripduration',),
+    'startID': ('start station id', 'start_station_id'),
+    'endID': ('end station id', 'end_station_id'),
+}
+
+# Filename of the station ID map, which holds the original station ID of
+# every station number.
+STATION_IDS_FILENAME = 'stationIDs.npy'
+
+# Station ID values of trips without a known station.
+MISSING_STATION_IDS = ('', 'NULL')
+
+
+def _openCsv(filename):
+    """Opens a CSV file, or the first CSV file of a zip archive, as text."""
+    if not filename.endswith('.zip'):
+        return open(filename, newline='')
+    zipRef = zipfile.ZipFile(filename)
+    member = [name for name in zipRef.namelist()
+              if name.endswith('.csv') and not name.startswith('__MACOSX')][0]
+    return io.TextIOWrapper(zipRef.open(member), newline='')
+
+
+def _columnIndices(header):
+    """Returns the index of every column in COLUMN_NAMES in a CSV header.
+
+    Returns:
+        Dictionary from the keys of COLUMN_NAMES to column indices. The
+        duration is missing if the file has no trip duration column.
+    """
+    header = [name.strip().lower() for name in header]
+    indices = {}
+    for key, names in COLUMN_NAMES.items():
+        for name in names:
+            if name in header:
+                indices[key] = header.index(name)
+                break
+        else:
+            if key != 'duration':
+                raise ValueError('CSV file has no %s column' % names[0])
+    return indices
+
+
+def readTripChunks(filenames, chunkSize=DEFAULT_CHUNK_SIZE):
+    """Reads the trips of CSV files in chunks of rows.
+
+    Args:
+        filenames: Paths of Citi Bike trip CSV files, or zip archives of
+            one CSV file.
+        chunkSize: Maximum number of trips per chunk.
+
+    Yields:
+        Dictionary of arrays with one entry per trip: startID and endID
+        (original station IDs as strings), startTime (datetime64) and
+        duration (seconds). Trips without a start or end station are
+        skipped.
+    """
+    for filename in filenames:
+        with _openCsv(filename) as f:
+            reader = csv.reader(f)
+            indices = _columnIndices(next(reader))
+            # Only the used columns of a row are kept.
+            keys = sorted(indices)
+            getColumns = operator.itemgetter(
+                *[indices[key] for key in keys])
+            while True:
+                rows = list(map(
+                    getColumns, itertools.islice(reader, chunkSize)))
+                if not rows:
+                    break
+                columns = dict(zip(keys, zip(*rows)))
+                del rows
+                startIDs = np.array(columns['startID'])
+                endIDs = np.array(columns['endID'])
+                startTimes = np.array(
+                    columns['startTime'], dtype='datetime64[ms]')
+                if 'duration' in columns:
+                    durations = np.array(columns['duration'], dtype=float)
+                else:
+                    stopTimes = np.array(
+                        columns['stopTime'], dtype='datetime64[ms]')
+                    durations = (stopTimes - startTimes) / np.timedelta64(
+                        1, 's')
+                known = ~(np.isin(startIDs, MISSING_STATION_IDS)
+                          | np.isin(endIDs, MISSING_STATION_IDS))
+                if not known.all():
+                    logging.info('Skipping %d trips without a station'
+                                 % np.count_nonzero(~known))
+                yield {
+                    'startID': startIDs[known],
+                    'endID': endIDs[known],
+                    'startTime': startTimes[known],
+                    'duration': durations[known],
+                }
+
+
+def collectStationIDs(chunks):
+    """Numbers the stations in the order the notebook did.
+
+    Start stations are numbered in order of their first trip, followed by
+    the stations that are only destinations, in order of their first trip.
+
+    Args:
+        chunks: Iterable of trip chunks (see readTripChunks).
+
+    Returns:
+        Array of the original station IDs, indexed by station number.
+    """
+    startIDs = {}
+    endIDs = {}
+    for chunk in chunks:
+        for key, seen in (('startID', startIDs), ('endID', endIDs)):
+            ids, firstIndices = np.unique(chunk[key], return_index=True)
+            for stationID in ids[np.argsort(firstIndices)].tolist():
+                seen.setdefault(stationID, len(seen))
+    stationIDs = list(startIDs)
+    stationIDs.extend(
+        stationID for stationID in endIDs if stationID not in startIDs)
+    return np.array(stationIDs)
+
+
+def mapStationIDs(stationIDs, ids):
+    """Maps original station IDs to station numbers.
+
+    Args:
+        stationIDs: Array of original station IDs, indexed by station number.
+        ids: Array of original station IDs to map.
+
+    Returns:
+        Integer array of station numbers.
+    """
+    order = np.argsort(stationIDs)
+    positions = np.searchsorted(stationIDs, ids, sorter=order)
+    positions = np.minimum(positions, len(order) - 1)
+    numbers = order[positions]
+    unknown = stationIDs[numbers] != ids
+    if np.any(unknown):
+        raise ValueError('unknown station ID %s' % ids[unknown][0])
+    return numbers
+
+
+class TripStatisticsAccumulator(object):
+    """Accumulates trip counts and durations over chunks of trips.
+
+    The accumulator holds raw sums, so accumulators of different months can
+    be merged, saved and folded into later; the statistics read by the
+    simulation are derived from them on demand. Stations are numbered by
+    the persistent ID map stationIDs: new stations get the next numbers,
+    and the numbers of known stations never change.
+
+    Memory use is fixed by the number of stations: destination counts take
+    stations x timeframes x stations 32-bit integers. The number of trips
+    per station pair, which the mean durations divide by, is the sum of the
+    destination counts over the timeframes.
+    """
+
+    def __init__(self, stationIDs=(), numTimeframes=NUM_TIMEFRAMES):
+        """Creates an empty accumulator.
+
+        Args:
+            stationIDs: Original station IDs, indexed by station number.
+            numTimeframes: Number of timeframes per day.
+        """
+        self.stationIDs = np.array(stationIDs, dtype=str)
+        self.numTimeframes = numTimeframes
+        numStations = len(self.stationIDs)
+        self.destinationCounts = np.zeros(
+            numStations * numTimeframes * numStations, dtype=np.int32)
+        self.durationSums = np.zeros(numStations * numStations)
+        self.days = set()
+
+    @property
+    def numStations(self):
+        """Number of stations in the ID map."""
+        return len(self.stationIDs)
+
+    def addStations(self, stationIDs):
+        """Adds the unknown stations of stationIDs to the ID map.
+
+        Args:
+            stationIDs: Original station IDs, numbered in order if unknown.
+        """
+        known = set(self.stationIDs.tolist())
+        newIDs = []
+        for stationID in np.asarray(stationIDs, dtype=str).tolist():
+            if stationID not in known:
+                known.add(stationID)
+                newIDs.append(stationID)
+        if not newIDs:
+            return
+        numStations = self.numStations
+        destinationCounts = self.destinationCountsByStation()
+        durationSums = self.durationSums.reshape(numStations, numStations)
+        self.stationIDs = np.concatenate(
+            (self.stationIDs, np.array(newIDs, dtype=str)))
+        grown = TripStatisticsAccumulator(
+            self.stationIDs, self.numTimeframes)
+        # The known stations keep their numbers.
+        grown.destinationCountsByStation()[
+            :numStations, :, :numStations] = destinationCounts
+        grown.durationSums.reshape(self.numStations, self.numStations)[
+            :numStations, :numStations] = durationSums
+        self.destinationCounts = grown.destinationCounts
+        self.durationSums = grown.durationSums
+
+    def addTrips(self, chunk):
+        """Adds a chunk of trips read by readTripChunks.
+
+        The stations of the trips must be in the ID map (see addStations).
+        """
+        self.add(mapStationIDs(self.stationIDs, chunk['startID']),
+                 mapStationIDs(self.stationIDs, chunk['endID']),
+                 chunk['startTime'], chunk['duration'])
+
+    def add(self, startIDs, endIDs, startTimes, durations):
+        """Adds a chunk of trips.
+
+        Args:
+            startIDs: Integer array of start station numbers.
+            endIDs: Integer array of end station numbers.
+            startTimes: datetime64 array of trip start times.
+            durations: Array of trip durations in seconds.
+        """
+        numStations = self.numStations
+        days = startTimes.astype('datetime64[D]')
+        self.days.update(np.unique(days).tolist())
+        hours = ((startTimes - days) // np.timedelta64(1, 'h')).astype(
+            np.int64)
+        timeframes = hours * self.numTimeframes // 24
+        rows = startIDs * self.numTimeframes + timeframes
+        # Few distinct (start, timeframe, destination) triples occur in a
+        # chunk, so they are counted before updating the accumulator.
+        triples, counts = np.unique(
+            rows * numStations + endIDs, return_counts=True)
+        self.destinationCounts[triples] += counts.astype(np.int32)
+        pairs = startIDs * numStations + endIDs
+        self.durationSums += np.bincount(
+            pairs, weights=durations, minlength=numStations * numStations)
+
+    def destinationCountsByStation(self):
+        """Returns a (stations x timeframes x stations) view of the counts."""
+        return self.destinationCounts.reshape(
+            self.numStations, self.numTimeframes, self.numStations)
+
+    def tripCountData(self, numDays=None):
+        """Returns the average number of trips per station and timeframe.
+
+        Args:
+            numDays: Number of days the trips are averaged over. Defaults to
+                the number of days with trips.
+
+        Returns:
+            Integer (stations x timeframes) array, rounded as the notebook.
+        """
+        numDays = numDays or len(self.days)
+        counts = self.destinationCountsByStation().sum(axis=2)
+        return np.rint(counts / float(numDays)).astype(int)
+
+    def tripDurations(self):
+        """Returns the mean trip duration of every station pair in minutes.
+
+        Pairs without trips have a NaN duration.
+        """
+        numTrips = self.destinationCountsByStation().sum(axis=1).ravel()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            durations = self.durationSums / numTrips / 60.0
+        durations[numTrips == 0] = np.nan
+        return durations.reshape(self.numStations, self.numStations)
+
+    def destinationProbabilityRows(self):
+        """Yields the destination probabilities one start station at a time.
+
+        Yields:
+            (timeframes x stations) float64 arrays. Timeframes without trips
+            have all-zero probabilities.
+        """
+        for counts in self.destinationCountsByStation():
+            totals = counts.sum(axis=1, keepdims=True)
+            yield counts / np.maximum(totals, 1).astype(float)
+
+    def merge(self, other):
+        """Adds the trips of another accumulator.
+
+        The stations of other that are not in the ID map are added to it.
+
+        Args:
+            other: TripStatisticsAccumulator with the same number of
+                timeframes.
+        """
+        if other.numTimeframes != self.numTimeframes:
+            raise ValueError('cannot merge %d timeframes into %d'
+                             % (other.numTimeframes, self.numTimeframes))
+        overlap = self.days & other.days
+        if overlap:
+            logging.warning('Merging trips of %d days already accumulated, '
+                            'e.g. %s' % (len(overlap), min(overlap)))
+        self.addStations(other.stationIDs)
+        numbers = mapStationIDs(self.stationIDs, other.stationIDs)
+        timeframes = np.arange(self.numTimeframes)
+        self.destinationCountsByStation()[
+            np.ix_(numbers, timeframes, numbers)] += (
+                other.destinationCountsByStation())
+        self.durationSums.reshape(self.numStations, self.numStations)[
+            np.ix_(numbers, numbers)] += other.durationSums.reshape(
+                other.numStations, other.numStations)
+        self.days.update(other.days)
+
+    def __getstate__(self):
+        """Returns the sums in compact form, with the non-zero counts only.
+
+        Accumulators returned by worker processes are pickled in this form.
+        """
+        triples = np.flatnonzero(self.destinationCounts)
+        pairs = np.flatnonzero(
+            self.destinationCountsByStation().sum(axis=1))
+        return {
+            'stationIDs': self.stationIDs,
+            'numTimeframes': np.array(self.numTimeframes),
+            'days': np.array(sorted(self.days), dtype='datetime64[D]'),
+            'triples': triples,
+            'tripleCounts': self.destinationCounts[triples],
+            'pairs': pairs,
+            'pairDurationSums': self.durationSums[pairs],
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state['stationIDs'], int(state['numTimeframes']))
+        self.destinationCounts[state['triples']] = state['tripleCounts']
+        self.durationSums[state['pairs']] = state['pairDurationSums']
+        self.days = set(state['days'].tolist())
+
+    def save(self, filename):
+        """Saves the accumulator to a compressed .npz file."""
+        np.savez_compressed(filename, **self.__getstate__())
+
+    @classmethod
+    def load(cls, filename):
+        """Loads an accumulator saved with save()."""
+        accumulator = cls.__new__(cls)
+        with np.load(filename) as data:
+            accumulator.__setstate__(
+                dict((name, data[name]) for name in data.files))
+        return accumulator
+
+
+def accumulateFile(filename, chunkSize=DEFAULT_CHUNK_SIZE):
+    """Accumulates the trips of one CSV file.
+
+    The file is read twice: once to number its stations and once to
+    accumulate the trips.
+
+    Args:
+        filename: Path of a Citi Bike trip CSV file, or a zip archive.
+        chunkSize: Number of CSV rows reduced at a time.
+
+    Returns:
+        TripStatisticsAccumulator of the file's trips.
+    """
+    accumulator = TripStatisticsAccumulator(
+        collectStationIDs(readTripChunks([filename], chunkSize)))
+    numTrips = 0
+    for chunk in readTripChunks([filename], chunkSize):
+        accumulator.addTrips(chunk)
+        numTrips += len(chunk['duration'])
+    logging.info('%s: %d trips, %d stations, %d days'
+                 % (filename, numTrips, accumulator.numStations,
+                    len(accumulator.days)))
+    return accumulator
+
+
+def writeTripStatistics(accumulator, tripDataDir, sparse=False,
+                        numDays=None):
+    """Writes the statistics read by loadTripStatistics.
+
+    The station ID map is written alongside, as STATION_IDS_FILENAME.
+
+    Args:
+        accumulator: TripStatisticsAccumulator of the trips.
+        tripDataDir: Directory in which the statistics are written.
+        sparse: If True, the destination probabilities are written in the
+            sparse format only, without creating the dense array.
+        numDays: Number of days the trip counts are averaged over. Defaults
+            to the number of days with trips.
+    """
+    if not os.path.exists(tripDataDir):
+        os.makedirs(tripDataDir)
+    np.save(os.path.join(tripDataDir, STATION_IDS_FILENAME),
+            accumulator.stationIDs)
+    np.save(os.path.join(tripDataDir, load_trip_stats.TRIP_COUNT_FILENAME),
+            accumulator.tripCountData(numDays))
+    np.save(os.path.join(tripDataDir, load_trip_stats.TRIP_DURATION_FILENAME),
+            accumulator.tripDurations())
+    numStations = accumulator.numStations
+    shape = (numStations, accumulator.numTimeframes, numStations)
+    if sparse:
+        destinationP = load_trip_stats.SparseDestinationP.fromDenseRows(
+            accumulator.destinationProbabilityRows(), shape)
+        destinationP.save(os.path.join(
+            tripDataDir, load_trip_stats.SPARSE_DESTINATION_PROBS_FILENAME))
+    else:
+        # Rows are written one start station at a time.
+        destinationP = np.lib.format.open_memmap(
+            os.path.join(tripDataDir,
+                         load_trip_stats.DESTINATION_PROBS_FILENAME),
+            mode='w+', dtype=np.float64, shape=shape)
+        for stationID, row in enumerate(
+                accumulator.destinationProbabilityRows()):
+            destinationP[stationID] = row
+        destinationP.flush()
+        del destinationP
+
+
+def buildTripStatistics(filenames, tripDataDir=load_trip_stats.TRIP_DATA_DIR,
+                        sparse=False, chunkSize=DEFAULT_CHUNK_SIZE,
+                        numDays=None, workers=1, accumulatorFile=None):
+    """Builds the trip statistics files read by loadTripStatistics.
+
+    Every file, e.g. one month of trips, is accumulated separately, in
+    parallel worker processes if requested, and the accumulators are then
+    merged in the order of filenames. If accumulatorFile exists, the new
+    files are folded into the accumulator saved there, which is then
+    updated. Otherwise, if tripDataDir has a station ID map from an earlier
+    build, its station numbers are kept.
+
+    Args:
+        filenames: Paths of Citi Bike trip CSV files, or zip archives.
+        tripDataDir: Directory in which the statistics are written.
+        sparse: If True, the destination probabilities are written in the
+            sparse format only, without creating the dense array.
+        chunkSize: Number of CSV rows reduced at a time.
+        numDays: Number of days the trip counts are averaged over. Defaults
+            to the number of days with trips.
+        workers: Number of worker processes that accumulate files.
+        accumulatorFile: Path of the .npz file of the saved accumulator.
+
+    Returns:
+        TripStatisticsAccumulator of all the trips.
+    """
+    stationIDsPath = os.path.join(tripDataDir, STATION_IDS_FILENAME)
+    if accumulatorFile and os.path.exists(accumulatorFile):
+        accumulator = TripStatisticsAccumulator.load(accumulatorFile)
+    elif os.path.exists(stationIDsPath):
+        accumulator = TripStatisticsAccumulator(np.load(stationIDsPath))
+    else:
+        accumulator = TripStatisticsAccumulator()
+
+    workers = min(workers, len(filenames))
+    if workers <= 1:
+        fileAccumulators = (accumulateFile(filename, chunkSize)
+                            for filename in filenames)
+        for fileAccumulator in fileAccumulators:
+            accumulator.merge(fileAccumulator)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers) as executor:
+            for fileAccumulator in executor.map(
+                    accumulateFile, filenames,
+                    [chunkSize] * len(filenames)):
+                accumulator.merge(fileAccumulator)
+    logging.info('%d stations, %d days'
+                 % (accumulator.numStations, len(accumulator.days)))
+
+    if accumulatorFile:
+        accumulator.save(accumulatorFile)
+    writeTripStatistics(accumulator, tripDataDir, sparse, numDays)
+    return accumulator
+
+
+def main():
+    """Parses command-line args and builds the trip statistics."""
+    parser = argparse.ArgumentParser(
+        description='Build trip statistics from Citi Bike trip CSV files')
+    parser.add_argument('filenames', nargs='+',
+        help='Trip CSV files, or zip archives of one CSV file.')
+    parser.add_argument('--tripDataDir', dest='tripDataDir', action='store',
+        default=load_trip_stats.TRIP_DATA_DIR,
+        help='Directory in which the statistics are written.')
+    parser.add_argument('--sparse', dest='sparse', action='store_true',
+        help='Write sparse destination probabilities only.')
+    parser.add_argument('--chunkSize', dest='chunkSize', action='store',
+        default=DEFAULT_CHUNK_SIZE, help='Number of CSV rows per chunk.')
+    parser.add_argument('--numDays', dest='numDays', action='store',
+        default=None, help='Number of days the trip counts average over.')
+    parser.add_argument('--workers', dest='workers', action='store',
+        default=1, help='Number of worker processes, one file each.')
+    parser.add_argument('--accumulatorFile', dest='accumulatorFile',
+        action='store', default=None,
+        help='Saved accumulator that the files are folded into.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    buildTripStatistics(
+        args.filenames, args.tripDataDir, sparse=args.sparse,
+        chunkSize=int(args.chunkSize),
+        numDays=int(args.numDays) if args.numDays else None,
+        workers=int(args.workers), accumulatorFile=args.accumulatorFile)
+
+
+if __name__ == '__main__':
+    main()
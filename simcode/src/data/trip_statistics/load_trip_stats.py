@@ -1,6 +1,9 @@
 """Methods used to load Citi Bike simulation data from file."""
 
 # Standard libs.
+import argparse
+import collections
+import logging
 import os
 import zipfile
 
@@ -15,25 +18,333 @@ TRIP_STATS_ZIP_FILENME = 'tripStatistics.zip'
 TRIP_COUNT_FILENAME = 'tripCountData.npy'
 TRIP_DURATION_FILENAME = 'Durations.npy'
 DESTINATION_PROBS_FILENAME = 'destinationP.npy'
+SPARSE_DESTINATION_PROBS_FILENAME = 'destinationP_sparse.npz'
 
+# Maximum number of derived artifacts (e.g. arrival schedules) kept in the
+# process-wide cache. The least recently used artifact is evicted first.
+DERIVED_CACHE_SIZE = 16
 
-def loadTripStatistics(tripDataDir=TRIP_DATA_DIR):
-    """Loads Citi Bike trip statistics."""
+# Process-wide cache of loaded trip statistics. Maps the absolute data
+# directory and storage format to a (signature, statistics) tuple.
+_tripStatsCache = {}
+# Process-wide LRU cache of artifacts derived from the trip statistics.
+_derivedCache = collections.OrderedDict()
 
-    # Check if files unzipped.
-    if not os.path.exists(
-            os.path.join(tripDataDir, TRIP_COUNT_FILENAME)):
+
+def _extractTripStatistics(tripDataDir, filenames):
+    """Unzips the trip statistics files that are not present.
+
+    Args:
+        tripDataDir: Directory containing the trip statistics.
+        filenames: Names of the files in the archive that are needed.
+    """
+    missing = [filename for filename in filenames if not os.path.exists(
+        os.path.join(tripDataDir, filename))]
+    if missing:
         # Unzip files from archive.
-        zipRef = zipfile.ZipFile(
-            os.path.join(tripDataDir, TRIP_STATS_ZIP_FILENME), 'r')
-        zipRef.extractall(tripDataDir)
-        zipRef.close()
-    # Load Citi bike trip statistics.
+        with zipfile.ZipFile(os.path.join(
+                tripDataDir, TRIP_STATS_ZIP_FILENME), 'r') as zipRef:
+            for filename in missing:
+                zipRef.extract(filename, tripDataDir)
+
+
+def _dataSignature(tripDataDir, filenames=(
+        TRIP_COUNT_FILENAME, TRIP_DURATION_FILENAME,
+        DESTINATION_PROBS_FILENAME)):
+    """Returns the cache key of the trip statistics files in a directory.
+
+    The key contains the absolute directory and the modification time and
+    size of every data file, so that regenerated files invalidate the cache.
+    """
+    fileStats = []
+    for filename in filenames:
+        fileStat = os.stat(os.path.join(tripDataDir, filename))
+        fileStats.append((filename, fileStat.st_mtime_ns, fileStat.st_size))
+    return (os.path.abspath(tripDataDir), tuple(fileStats))
+
+
+def loadTripStatistics(tripDataDir=TRIP_DATA_DIR, useCache=True,
+                       sparse=False):
+    """Loads Citi Bike trip statistics.
+
+    Args:
+        tripDataDir: Directory containing the trip statistics.
+        useCache: If True, the statistics are loaded once per process as
+            read-only memory-mapped arrays and reused by later calls. The
+            cached arrays are reloaded if the files on disk change.
+        sparse: If True, destination probabilities are returned as a
+            SparseDestinationP. The sparse file is created from the dense
+            statistics the first time it is requested.
+
+    Returns:
+        Tuple of (tripCountData, tripDurations, destinationP) arrays.
+    """
+    if sparse:
+        if not os.path.exists(os.path.join(
+                tripDataDir, SPARSE_DESTINATION_PROBS_FILENAME)):
+            convertToSparse(tripDataDir)
+        _extractTripStatistics(
+            tripDataDir, (TRIP_COUNT_FILENAME, TRIP_DURATION_FILENAME))
+        filenames = (TRIP_COUNT_FILENAME, TRIP_DURATION_FILENAME,
+                     SPARSE_DESTINATION_PROBS_FILENAME)
+    else:
+        filenames = (TRIP_COUNT_FILENAME, TRIP_DURATION_FILENAME,
+                     DESTINATION_PROBS_FILENAME)
+        _extractTripStatistics(tripDataDir, filenames)
+    if not useCache:
+        return _loadArrays(tripDataDir, mmapMode=None, sparse=sparse)
+
+    signature = _dataSignature(tripDataDir, filenames)
+    cached = _tripStatsCache.get((signature[0], sparse))
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    logging.info('Loading trip statistics from %s' % signature[0])
+    tripStatistics = _loadArrays(tripDataDir, mmapMode='r', sparse=sparse)
+    _tripStatsCache[(signature[0], sparse)] = (signature, tripStatistics)
+    # Artifacts derived from stale files are no longer valid.
+    for key in [k for k in _derivedCache if k[0] == signature[0]]:
+        del _derivedCache[key]
+    return tripStatistics
+
+
+def _loadArrays(tripDataDir, mmapMode, sparse=False):
+    """Loads the trip statistics arrays from the data directory."""
     tripCountData = np.load(
-        os.path.join(tripDataDir, TRIP_COUNT_FILENAME))
+        os.path.join(tripDataDir, TRIP_COUNT_FILENAME), mmap_mode=mmapMode)
     tripDurations = np.load(
-        os.path.join(tripDataDir, TRIP_DURATION_FILENAME))
-    destinationP = np.load(
-        os.path.join(tripDataDir, DESTINATION_PROBS_FILENAME))
+        os.path.join(tripDataDir, TRIP_DURATION_FILENAME),
+        mmap_mode=mmapMode)
+    if sparse:
+        destinationP = SparseDestinationP.load(os.path.join(
+            tripDataDir, SPARSE_DESTINATION_PROBS_FILENAME))
+    else:
+        destinationP = np.load(
+            os.path.join(tripDataDir, DESTINATION_PROBS_FILENAME),
+            mmap_mode=mmapMode)
 
     return tripCountData, tripDurations, destinationP
+
+
+def getDerivedArtifact(tripDataDir, name, params, factory):
+    """Returns an artifact derived from the trip statistics, caching it.
+
+    Artifacts are cached per process with least-recently-used eviction and
+    are invalidated when loadTripStatistics reloads changed files.
+    Callers must treat the returned artifact as read-only.
+
+    Args:
+        tripDataDir: Directory containing the trip statistics.
+        name: String name of the artifact, e.g. 'arrivalTimes'.
+        params: Hashable parameters the artifact depends on.
+        factory: Callable with no arguments that computes the artifact.
+
+    Returns:
+        The cached or newly computed artifact.
+    """
+    key = (os.path.abspath(tripDataDir), name, params)
+    if key in _derivedCache:
+        _derivedCache.move_to_end(key)
+        return _derivedCache[key]
+
+    artifact = factory()
+    _derivedCache[key] = artifact
+    while len(_derivedCache) > DERIVED_CACHE_SIZE:
+        _derivedCache.popitem(last=False)
+    return artifact
+
+
+def clearTripStatisticsCache():
+    """Removes all loaded trip statistics and derived artifacts."""
+    _tripStatsCache.clear()
+    _derivedCache.clear()
+
+
+class SparseDestinationP(object):
+    """Destination probabilities stored in compressed sparse row format.
+
+    Row r = stationID * numTimeframes + timeframe holds the destinations
+    with non-zero probability of being chosen from stationID during
+    timeframe. Their station indices are indices[offsets[r]:offsets[r + 1]]
+    and their probabilities are probs[offsets[r]:offsets[r + 1]], so memory
+    scales with the number of observed (start, hour, destination) triples
+    rather than with the square of the number of stations.
+    """
+
+    def __init__(self, offsets, indices, probs, shape):
+        self.offsets = offsets
+        self.indices = indices
+        self.probs = probs
+        self.shape = tuple(int(n) for n in shape)
+
+    @staticmethod
+    def indexDtype(numStations):
+        """Returns the smallest integer type that can hold station indices."""
+        if numStations <= np.iinfo(np.int16).max:
+            return np.int16
+        return np.int32
+
+    @classmethod
+    def fromDense(cls, destinationP):
+        """Converts a dense (stations x timeframes x stations) array."""
+        return cls.fromDenseRows(iter(destinationP), destinationP.shape)
+
+    @classmethod
+    def fromDenseRows(cls, stationRows, shape):
+        """Converts dense probabilities given one start station at a time.
+
+        Args:
+            stationRows: Iterable of (timeframes x stations) arrays, one for
+                every start station.
+            shape: Shape of the dense array.
+
+        Returns:
+            SparseDestinationP instance.
+        """
+        numStations, numTimeframes = shape[0], shape[1]
+        offsets = np.zeros(numStations * numTimeframes + 1, dtype=np.int64)
+        indices = []
+        probs = []
+        for stationID, stationRow in enumerate(stationRows):
+            timeframes, destinations = np.nonzero(stationRow)
+            rowCounts = np.bincount(timeframes, minlength=numTimeframes)
+            start = stationID * numTimeframes
+            offsets[start + 1:start + numTimeframes + 1] = rowCounts
+            indices.append(destinations)
+            probs.append(stationRow[timeframes, destinations])
+        np.cumsum(offsets, out=offsets)
+        indexDtype = cls.indexDtype(numStations)
+        indices = (np.concatenate(indices).astype(indexDtype) if indices
+                   else np.zeros(0, dtype=indexDtype))
+        probs = (np.concatenate(probs).astype(np.float32) if probs
+                 else np.zeros(0, dtype=np.float32))
+        return cls(offsets, indices, probs, shape)
+
+    def row(self, stationID, timeframe):
+        """Returns destination indices and probabilities for one row."""
+        r = stationID * self.shape[1] + timeframe
+        start, end = self.offsets[r], self.offsets[r + 1]
+        return self.indices[start:end], self.probs[start:end]
+
+    def sample(self, stationID, timeframe, u):
+        """Selects a destination using a uniform variate.
+
+        Args:
+            stationID: Start station of the trip.
+            timeframe: Timeframe in which the trip starts.
+            u: Uniform random variate in [0, 1).
+
+        Returns:
+            Integer destination station ID.
+        """
+        indices, probs = self.row(stationID, timeframe)
+        if len(probs) == 0:
+            raise ValueError(
+                'no destinations for station %d in timeframe %d'
+                % (stationID, timeframe))
+        cdf = np.cumsum(probs, dtype=np.float64)
+        return int(indices[cdf.searchsorted(u * cdf[-1], side='right')])
+
+    def toDense(self):
+        """Returns the probabilities as a dense float64 array."""
+        destinationP = np.zeros(self.shape)
+        rows = np.repeat(
+            np.arange(self.shape[0] * self.shape[1]), np.diff(self.offsets))
+        destinationP.reshape(-1, self.shape[2])[rows, self.indices] = (
+            self.probs)
+        return destinationP
+
+    @property
+    def nbytes(self):
+        """Total number of bytes used by the sparse arrays."""
+        return self.offsets.nbytes + self.indices.nbytes + self.probs.nbytes
+
+    def save(self, filename):
+        """Saves the sparse probabilities to an .npz file."""
+        np.savez(filename, offsets=self.offsets, indices=self.indices,
+                 probs=self.probs, shape=np.array(self.shape))
+
+    @classmethod
+    def load(cls, filename):
+        """Loads sparse probabilities saved with save()."""
+        with np.load(filename) as data:
+            return cls(data['offsets'], data['indices'], data['probs'],
+                       data['shape'])
+
+
+def _iterNpyRows(fileobj):
+    """Reads a .npy file one entry of its first axis at a time.
+
+    Args:
+        fileobj: Open binary file positioned at the start of the .npy data.
+
+    Returns:
+        Tuple of (shape, generator of arrays along the first axis).
+    """
+    version = np.lib.format.read_magic(fileobj)
+    if version == (1, 0):
+        shape, fortranOrder, dtype = (
+            np.lib.format.read_array_header_1_0(fileobj))
+    else:
+        shape, fortranOrder, dtype = (
+            np.lib.format.read_array_header_2_0(fileobj))
+    assert not fortranOrder
+    rowShape = shape[1:]
+    rowBytes = int(np.prod(rowShape)) * dtype.itemsize
+
+    def rows():
+        for _ in range(shape[0]):
+            yield np.frombuffer(
+                fileobj.read(rowBytes), dtype=dtype).reshape(rowShape)
+    return shape, rows()
+
+
+def convertToSparse(tripDataDir=TRIP_DATA_DIR):
+    """Writes the sparse destination probabilities file.
+
+    The dense probabilities are read one start station at a time, from the
+    unzipped file if present or else directly from the zip archive, so the
+    dense array is never held in memory.
+
+    Args:
+        tripDataDir: Directory containing the trip statistics.
+
+    Returns:
+        SparseDestinationP instance that was written.
+    """
+    densePath = os.path.join(tripDataDir, DESTINATION_PROBS_FILENAME)
+    if os.path.exists(densePath):
+        with open(densePath, 'rb') as fileobj:
+            shape, rows = _iterNpyRows(fileobj)
+            destinationP = SparseDestinationP.fromDenseRows(rows, shape)
+    else:
+        with zipfile.ZipFile(os.path.join(
+                tripDataDir, TRIP_STATS_ZIP_FILENME), 'r') as zipRef:
+            # The simulation also needs the (small) count and duration files.
+            for filename in (TRIP_COUNT_FILENAME, TRIP_DURATION_FILENAME):
+                if not os.path.exists(os.path.join(tripDataDir, filename)):
+                    zipRef.extract(filename, tripDataDir)
+            with zipRef.open(DESTINATION_PROBS_FILENAME) as fileobj:
+                shape, rows = _iterNpyRows(fileobj)
+                destinationP = SparseDestinationP.fromDenseRows(rows, shape)
+    destinationP.save(
+        os.path.join(tripDataDir, SPARSE_DESTINATION_PROBS_FILENAME))
+    logging.info(
+        'Wrote %d destination probabilities (%.1f MB)'
+        % (len(destinationP.probs), destinationP.nbytes / 1e6))
+    return destinationP
+
+
+def main():
+    """Parses command-line args and converts the trip statistics."""
+    parser = argparse.ArgumentParser(
+        description='Convert destination probabilities to sparse format')
+    parser.add_argument('--tripDataDir', dest='tripDataDir', action='store',
+        default=TRIP_DATA_DIR, help='Directory of the trip statistics.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    convertToSparse(args.tripDataDir)
+
+
+if __name__ == '__main__':
+    main()
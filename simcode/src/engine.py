@@ -1,17 +1,34 @@
 """Discrete event simulator."""
 
 # Standard libs.
-import heapq
+import copy
 import logging
+import pickle
+import time
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.fel as fel
 
 
 class DiscreteEvent(object):
-    """Base class for a discrete event."""
+    """Base class for a discrete event.
+
+    DiscreteEvent objects are kept for compatibility. The engine stores
+    events as lightweight tuples (see DiscreteEventSimulationEngine), and
+    scheduling a DiscreteEvent wraps it in such a tuple.
+    """
 
     def __init__(self, handler, timestamp, **handlerKwargs):
         self.timestamp = timestamp
         self.handler = handler
         self.handlerKwargs = handlerKwargs
+        # Tie-breakers for events with equal timestamps. Both are assigned
+        # by DiscreteEventSimulationEngine.schedule.
+        self.priority = 0
+        self.seq = 0
 
     def __str__(self):
         """Returns a description of the event.
@@ -23,44 +40,472 @@ class DiscreteEvent(object):
         return 'T={0:.2f}, {1}'.format(
             self.timestamp, self.handler.__name__)
 
-    def __cmp__(self, other):
-         return cmp(self.timestamp, other.timestamp)
+    def __lt__(self, other):
+        return ((self.timestamp, self.priority, self.seq)
+                < (other.timestamp, other.priority, other.seq))
+
+
+# Priority of finalizers, which follow all other events at their timestamp.
+FINALIZE_PRIORITY = float('inf')
+
+
+def eventHandler(*payloadNames):
+    """Decorator that declares the fields of an event handler's payload.
+
+    Handlers are called as handler(simEngine, payload). When the payload is
+    a tuple, its field names allow the FEL to present the event as a
+    DiscreteEvent with the fields as handler keyword arguments.
+
+    Args:
+        payloadNames: Names of the payload tuple fields.
+    """
+    def decorator(handler):
+        handler.payloadNames = payloadNames
+        return handler
+    return decorator
+
+
+def _runDiscreteEvent(simEngine, event):
+    """Processes an event scheduled as a DiscreteEvent."""
+    event.handler(simEngine, **event.handlerKwargs)
+
+
+def _handlerName(handler, payload):
+    """Returns the name of the handler that processes an event."""
+    if handler is _runDiscreteEvent:
+        handler = payload.handler
+    return handler.__name__
+
+
+class EngineInstrumentation(object):
+    """Per-handler and throughput statistics collected during a run.
+
+    Records, for each handler, the number of events processed and the
+    cumulative wall time spent in the handler; the FEL size high-water mark;
+    and the number of events and wall time per window of simulation time.
+    """
+
+    def __init__(self, windowDuration=60):
+        """Creates empty statistics.
+
+        Args:
+            windowDuration: Width of the simulation time windows over which
+                event throughput is reported.
+        """
+        self.windowDuration = windowDuration
+        # Handler name -> [count, wall time].
+        self.handlers = {}
+        # Window index -> [count, wall time].
+        self.windows = {}
+        self.felHighWaterMark = 0
+        self.numEvents = 0
+        self.wallTime = 0.0
+        self._lastTime = None
+
+    def start(self):
+        """Marks the start of a runSimulation call."""
+        self._lastTime = time.perf_counter()
+
+    def dispatch(self, simEngine, handler, payload):
+        """Processes an event and records its statistics."""
+        startTime = time.perf_counter()
+        handler(simEngine, payload)
+        endTime = time.perf_counter()
+        # Wall time since the previous event includes the engine overhead.
+        elapsed = endTime - self._lastTime
+        self._lastTime = endTime
+        self.numEvents += 1
+        self.wallTime += elapsed
+
+        name = _handlerName(handler, payload)
+        handlerStats = self.handlers.get(name)
+        if handlerStats is None:
+            handlerStats = self.handlers[name] = [0, 0.0]
+        handlerStats[0] += 1
+        handlerStats[1] += endTime - startTime
+
+        window = int(simEngine.simTime // self.windowDuration)
+        windowStats = self.windows.get(window)
+        if windowStats is None:
+            windowStats = self.windows[window] = [0, 0.0]
+        windowStats[0] += 1
+        windowStats[1] += elapsed
+
+        felSize = len(simEngine._fel)
+        if felSize > self.felHighWaterMark:
+            self.felHighWaterMark = felSize
+
+    def report(self):
+        """Returns the collected statistics.
+
+        Returns:
+            Dictionary with the keys:
+                numEvents: Total number of events processed.
+                wallTime: Total wall time of the processed events, in seconds.
+                felHighWaterMark: Largest FEL size after any event.
+                handlers: Dictionary from handler name to a dictionary with
+                    the keys count, time (cumulative wall time in seconds),
+                    meanTime and fraction (of all processed events).
+                windows: NumPy record array with one record per simulation
+                    time window that contains events, with the fields start
+                    (simulation time), numEvents, wallTime and eventsPerSec.
+        """
+        handlers = {}
+        for name, (count, handlerTime) in self.handlers.items():
+            handlers[name] = {
+                'count': count,
+                'time': handlerTime,
+                'meanTime': handlerTime / count,
+                'fraction': count / float(self.numEvents),
+            }
+        indices = sorted(self.windows)
+        windows = np.zeros(len(indices), dtype=[
+            ('start', float), ('numEvents', int), ('wallTime', float),
+            ('eventsPerSec', float)])
+        for record, index in zip(windows, indices):
+            count, windowTime = self.windows[index]
+            record['start'] = index * self.windowDuration
+            record['numEvents'] = count
+            record['wallTime'] = windowTime
+            record['eventsPerSec'] = (
+                count / windowTime if windowTime > 0 else np.inf)
+        return {
+            'numEvents': self.numEvents,
+            'wallTime': self.wallTime,
+            'felHighWaterMark': self.felHighWaterMark,
+            'handlers': handlers,
+            'windows': windows.view(np.recarray),
+        }
 
 
 class DiscreteEventSimulationEngine(object):
-    """Discrete event simulation engine."""
+    """Discrete event simulation engine.
+
+    Events are processed in order of timestamp. Events with equal timestamps
+    are processed in order of priority (lowest first) and then in the order
+    in which they were scheduled.
+
+    Scheduled events are stored in the FEL as
+    (timestamp, priority, seq, handler, payload) tuples, where seq is the
+    insertion sequence number, and are processed by calling
+    handler(simEngine, payload). The FEL backend (see the fel module) is
+    selected when the engine is created.
+
+    Instrumentation (see enableInstrumentation) is off by default, and then
+    costs one check per event.
+
+    Besides the FEL, the engine can merge a presorted stream of events whose
+    timestamps are known in advance (see attachStream). Stream events never
+    enter the FEL, which then only holds events scheduled during the run.
+
+    A run can be stepped in slices of simulation time (see runUntil and
+    runSlices) and paused from within a handler (see pause); the next call
+    continues it with the remaining events.
+    """
 
-    def __init__(self):
+    def __init__(self, felBackend=fel.HEAP):
+        """Creates the engine.
+
+        Args:
+            felBackend: Name of the FEL backend (fel.HEAP, fel.CALENDAR or
+                fel.BUCKET), or a FEL instance.
+        """
         # Initialize simulation time.
         self.simTime = 0
-        # The FEL is a timestamp-based priority queue.
-        self.FEL = []
+        # The FEL is a timestamp-based priority queue of event tuples.
+        self._fel = fel.makeFEL(felBackend)
+        # Number of events scheduled so far, used for FIFO tie-breaking.
+        self.numEventsScheduled = 0
+        # Total number of events processed by this engine.
+        self.numEventsProcessed = 0
+        # Presorted event stream merged with the FEL.
+        self._streamTimes = []
+        self._streamHandler = None
+        self._streamPayloads = []
+        self._streamIndex = 0
+        # EngineInstrumentation, or None if instrumentation is disabled.
+        self.instrumentation = None
+        # Set by pause to stop the current run after the current event.
+        self._pauseRequested = False
+
+    def enableInstrumentation(self, windowDuration=60):
+        """Enables collection of per-handler and throughput statistics.
 
-    def schedule(self, event):
+        Args:
+            windowDuration: Width of the simulation time windows over which
+                event throughput is reported.
+
+        Returns:
+            The EngineInstrumentation that collects the statistics. Its
+            report method returns them as a dictionary.
+        """
+        self.instrumentation = EngineInstrumentation(windowDuration)
+        return self.instrumentation
+
+    @property
+    def FEL(self):
+        """Pending scheduled events as DiscreteEvents, in FEL storage order.
+
+        Events scheduled with scheduleAt are converted to new DiscreteEvent
+        objects. This view is intended for inspection and testing.
+        """
+        events = []
+        for timestamp, priority, seq, handler, payload in (
+                self._fel.entries()):
+            if handler is _runDiscreteEvent:
+                event = payload
+            else:
+                payloadNames = getattr(handler, 'payloadNames', ('payload',))
+                if len(payloadNames) == 1:
+                    payload = (payload,)
+                event = DiscreteEvent(
+                    handler, timestamp, **dict(zip(payloadNames, payload)))
+                event.priority = priority
+                event.seq = seq
+            events.append(event)
+        return events
+
+    def schedule(self, event, priority=0):
         """Schedules a discrete event in the FEL.
 
         Args:
-            event: An instance of DiscreteEvent.
+            event: An instance of DiscreteEvent. The event handler is called
+                with the event's handlerKwargs as keyword arguments.
+            priority: Tie-breaker for events with equal timestamps. Events
+                with lower priority are processed first.
         """
-        heapq.heappush(self.FEL, event)
+        event.priority = priority
+        event.seq = self.numEventsScheduled
+        self.numEventsScheduled += 1
+        self._fel.push((
+            event.timestamp, priority, event.seq, _runDiscreteEvent, event))
 
-    def runSimulation(self, maxEvents=float('inf')):
-        """Processes all events in the FEL.
+    def scheduleAt(self, timestamp, handler, payload=None, priority=0):
+        """Schedules an event without allocating a DiscreteEvent.
+
+        Args:
+            timestamp: Simulation time of the event.
+            handler: Event handler, called as handler(simEngine, payload).
+            payload: Data passed to the handler.
+            priority: Tie-breaker for events with equal timestamps. Events
+                with lower priority are processed first.
+        """
+        seq = self.numEventsScheduled
+        self.numEventsScheduled = seq + 1
+        self._fel.push((timestamp, priority, seq, handler, payload))
+
+    def addFinalizer(self, timestamp, handler, payload=None):
+        """Registers a callback that fires when the simulation reaches
+        timestamp, e.g. to collect statistics at the end of the horizon.
+
+        The finalizer is processed after all other events at timestamp,
+        including events that they schedule at timestamp, and before any
+        later event. It is an FEL event, so it is copied with snapshots and
+        moved by shiftTime.
+
+        Args:
+            timestamp: Simulation time of the finalizer.
+            handler: Callback, called as handler(simEngine, payload).
+            payload: Data passed to the callback.
+        """
+        self.scheduleAt(timestamp, handler, payload, FINALIZE_PRIORITY)
+
+    def attachStream(self, timestamps, handler, payloads):
+        """Attaches a presorted stream of events to merge with the FEL.
+
+        Stream event i is processed by calling
+        handler(simEngine, payloads[i]). Its priority is
+        i - len(timestamps), so that it is processed before FEL events with
+        the same timestamp and non-negative priority, and after stream
+        events that precede it.
+
+        Args:
+            timestamps: Non-decreasing sequence of event timestamps.
+            handler: Event handler called for every stream event.
+            payloads: Sequence of per-event payloads.
+        """
+        self._streamTimes = list(timestamps)
+        self._streamHandler = handler
+        self._streamPayloads = payloads
+        self._streamIndex = 0
+
+    def runSimulation(self, maxEvents=float('inf'), untilTime=None):
+        """Processes all events in the FEL and the attached stream.
 
         Args:
             maxEvents: Maximum number of events to process. If unspecified,
                 all events in the FEL will be processed.
+            untilTime: If specified, only events with timestamps up to
+                untilTime are processed, and the simulation time is then
+                advanced to untilTime. A later call continues with the
+                remaining events.
+
+        Returns:
+            True if all events up to untilTime were processed, or False if
+            the run stopped after maxEvents or was paused.
         """
+        self._pauseRequested = False
+        if untilTime is None:
+            untilTime = float('inf')
+        felFirst = self._fel.first
+        felPop = self._fel.pop
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.start()
         numEventsProcessed = 0
-        while len(self.FEL) > 0 and numEventsProcessed < maxEvents:
-            event = heapq.heappop(self.FEL)
-            logging.debug(event)
-            # Update simulation time.
-            self.simTime = event.timestamp
-            # Process the event.
-            event.handler(self, **event.handlerKwargs)
-            numEventsProcessed += 1
+        done = False
+        while not done and numEventsProcessed < maxEvents:
+            # Handlers may attach a new stream, which restarts this loop.
+            streamTimes = self._streamTimes
+            streamHandler = self._streamHandler
+            streamPayloads = self._streamPayloads
+            numStreamEvents = len(streamTimes)
+            i = self._streamIndex
+            while numEventsProcessed < maxEvents:
+                top = felFirst()
+                if i < numStreamEvents:
+                    t = streamTimes[i]
+                    if top is None or t < top[0] or (
+                            t == top[0] and i - numStreamEvents < top[1]):
+                        # The next event comes from the stream.
+                        if t > untilTime:
+                            self.simTime = untilTime
+                            done = True
+                            break
+                        self.simTime = t
+                        i += 1
+                        self._streamIndex = i
+                        if debug:
+                            logging.debug('T=%.2f, %s' % (
+                                t, streamHandler.__name__))
+                        if instrumentation is None:
+                            streamHandler(self, streamPayloads[i - 1])
+                        else:
+                            instrumentation.dispatch(
+                                self, streamHandler, streamPayloads[i - 1])
+                        numEventsProcessed += 1
+                        if self._pauseRequested:
+                            done = True
+                            break
+                        if streamTimes is not self._streamTimes:
+                            break
+                        continue
+                elif top is None:
+                    if untilTime != float('inf'):
+                        self.simTime = max(self.simTime, untilTime)
+                    done = True
+                    break
+                if top[0] > untilTime:
+                    self.simTime = untilTime
+                    done = True
+                    break
+                timestamp, _, _, handler, payload = felPop()
+                # Update simulation time.
+                self.simTime = timestamp
+                if debug:
+                    logging.debug('T=%.2f, %s' % (
+                        timestamp, _handlerName(handler, payload)))
+                # Process the event.
+                if instrumentation is None:
+                    handler(self, payload)
+                else:
+                    instrumentation.dispatch(self, handler, payload)
+                numEventsProcessed += 1
+                if self._pauseRequested:
+                    done = True
+                    break
+                if streamTimes is not self._streamTimes:
+                    break
+        self.numEventsProcessed += numEventsProcessed
         logging.info('Processed %d events.' % numEventsProcessed)
+        completed = done and not self._pauseRequested
+        self._pauseRequested = False
+        return completed
+
+    def runUntil(self, simTime, maxEvents=float('inf')):
+        """Processes the events up to simTime and advances the clock to it.
+
+        Events at simTime, including finalizers, are processed. A later
+        call continues the run, so a long run can be stepped in slices.
+
+        Args:
+            simTime: Simulation time at which the run stops.
+            maxEvents: Maximum number of events to process.
+
+        Returns:
+            True if the run reached simTime, or False if it stopped after
+            maxEvents or was paused.
+        """
+        return self.runSimulation(maxEvents, untilTime=simTime)
+
+    def runSlices(self, sliceDuration, untilTime=None):
+        """Runs the simulation in slices of simulation time.
+
+        The run stops when no events remain, at untilTime, when it is
+        paused, or when the caller stops resuming the generator, e.g. to
+        abort it early. In all cases a later call continues the run.
+
+        Args:
+            sliceDuration: Simulation time per slice.
+            untilTime: If specified, the run stops at untilTime.
+
+        Yields:
+            The simulation time at the end of every slice.
+        """
+        while True:
+            nextTime = self.nextEventTime()
+            if nextTime is None or (untilTime is not None
+                                    and self.simTime >= untilTime):
+                return
+            sliceEnd = self.simTime + sliceDuration
+            if untilTime is not None:
+                sliceEnd = min(sliceEnd, untilTime)
+            completed = self.runUntil(sliceEnd)
+            yield self.simTime
+            if not completed:
+                return
+
+    def pause(self):
+        """Stops the current run after the event being processed.
+
+        The run continues with the next call to runSimulation, runUntil or
+        runSlices.
+        """
+        self._pauseRequested = True
+
+    def nextEventTime(self):
+        """Returns the timestamp of the next event, or None if none remain.
+        """
+        top = self._fel.first()
+        nextTime = None if top is None else top[0]
+        if self._streamIndex < len(self._streamTimes):
+            streamTime = self._streamTimes[self._streamIndex]
+            if nextTime is None or streamTime < nextTime:
+                nextTime = streamTime
+        return nextTime
+
+    def shiftTime(self, offset):
+        """Moves the origin of the simulation time forward.
+
+        The simulation time and the timestamps of all pending events,
+        scheduled or in the attached stream, are decreased by offset. Their
+        order is unchanged. This allows a long run to be simulated as a
+        sequence of periods, such as days, that all start at time zero.
+
+        Args:
+            offset: Simulation time of the new origin, at most the timestamp
+                of any pending event.
+        """
+        entries = self._fel.entries()
+        # The FEL is cleared and refilled, so that time-bucketed backends
+        # start over at the new origin with their own configuration.
+        self._fel.clear()
+        for timestamp, priority, seq, handler, payload in entries:
+            self._fel.push((timestamp - offset, priority, seq, handler,
+                            payload))
+        self._streamTimes = [t - offset for t in self._streamTimes]
+        self.simTime -= offset
 
     def currentTime(self):
         """Returns the current simulation time.
@@ -69,3 +514,93 @@ class DiscreteEventSimulationEngine(object):
             Positive number representing the current simulation time.
         """
         return self.simTime
+
+
+class Snapshot(object):
+    """Copy of a paused simulation that can be resumed many times.
+
+    A snapshot holds a deep copy of an engine, including its pending events
+    and attached stream, together with the application state that the
+    events refer to. Every fork is an independent deep copy of both, so
+    forks can be modified and run without affecting each other. Objects
+    listed as shared, such as read-only input data, are referenced instead
+    of copied, and are stored by reference when the snapshot is saved.
+    """
+
+    def __init__(self, simEngine, state=None, shared=(), metadata=None):
+        """Takes a snapshot.
+
+        Args:
+            simEngine: Paused DiscreteEventSimulationEngine.
+            state: Application state, e.g. a dictionary of the global data
+                referenced by the scheduled events.
+            shared: Objects referenced by the engine or the state that are
+                never modified, and are therefore not copied.
+            metadata: Picklable dictionary describing the snapshot. It is
+                saved ahead of the simulation state, so that load can
+                recreate the shared objects from it.
+        """
+        self.simTime = simEngine.simTime
+        self.metadata = metadata or {}
+        self._shared = list(shared)
+        self._copy = self._deepcopy((simEngine, state))
+
+    def _deepcopy(self, value):
+        """Returns a deep copy of value that references the shared objects."""
+        memo = dict((id(obj), obj) for obj in self._shared)
+        return copy.deepcopy(value, memo)
+
+    def fork(self):
+        """Returns an independent copy of the snapshot to resume.
+
+        Returns:
+            Tuple of (simEngine, state). Calling simEngine.runSimulation()
+            continues the simulation from the snapshot time.
+        """
+        return self._deepcopy(self._copy)
+
+    def save(self, filename):
+        """Saves the snapshot to a file, without its shared objects.
+
+        Args:
+            filename: Path of the file.
+        """
+        sharedIndices = dict(
+            (id(obj), i) for i, obj in enumerate(self._shared))
+        with open(filename, 'wb') as f:
+            pickle.dump((self.metadata, len(self._shared)), f,
+                        pickle.HIGHEST_PROTOCOL)
+            pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+            pickler.persistent_id = lambda obj: sharedIndices.get(id(obj))
+            pickler.dump((self.simTime, self._copy))
+
+    @classmethod
+    def load(cls, filename, shared=()):
+        """Loads a snapshot saved with save.
+
+        Args:
+            filename: Path of the file.
+            shared: The shared objects of the saved snapshot, in the same
+                order, or a function that returns them given the snapshot
+                metadata.
+
+        Returns:
+            Snapshot instance.
+        """
+        with open(filename, 'rb') as f:
+            metadata, numShared = pickle.load(f)
+            if callable(shared):
+                shared = shared(metadata)
+            shared = list(shared)
+            if numShared != len(shared):
+                raise ValueError('snapshot has %d shared objects, got %d'
+                                 % (numShared, len(shared)))
+            unpickler = pickle.Unpickler(f)
+            unpickler.persistent_load = lambda i: shared[i]
+            simTime, state = unpickler.load()
+        snapshot = cls.__new__(cls)
+        snapshot.simTime = simTime
+        snapshot.metadata = metadata
+        snapshot._shared = shared
+        snapshot._copy = state
+        return snapshot
@@ -0,0 +1,251 @@
+"""Future event list (FEL) backends for the discrete event simulator.
+
+A FEL stores event entries, which are tuples starting with
+(timestamp, priority, seq) where seq is unique, and returns them in
+increasing tuple order. All backends therefore process events in exactly
+the same order and are interchangeable.
+
+Backends implement:
+    push(entry): Inserts an entry.
+    pop(): Removes and returns the smallest entry.
+    first(): Returns the smallest entry without removing it, or None if the
+        FEL is empty.
+    entries(): Returns a list of all entries in unspecified order.
+    clear(): Removes all entries, keeping the configuration of the backend.
+    __len__(): Returns the number of entries.
+"""
+
+# Standard libs.
+import heapq
+import math
+
+
+# Names of the available backends.
+HEAP = 'heap'
+CALENDAR = 'calendar'
+BUCKET = 'bucket'
+
+
+class HeapFEL(object):
+    """FEL stored in a binary heap with O(log n) push and pop."""
+
+    def __init__(self):
+        self.heap = []
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, entry):
+        heapq.heappush(self.heap, entry)
+
+    def pop(self):
+        return heapq.heappop(self.heap)
+
+    def first(self):
+        return self.heap[0] if self.heap else None
+
+    def entries(self):
+        # Entries are returned in heap order.
+        return list(self.heap)
+
+    def clear(self):
+        self.heap = []
+
+
+class CalendarQueueFEL(object):
+    """Calendar queue with amortized O(1) push and pop (Brown, 1988).
+
+    Time is divided into "days" (buckets) of equal width, and a "year" is
+    numBuckets days. An entry with timestamp t is stored in bucket
+    floor(t / width) mod numBuckets, in a small heap. Entries are dequeued
+    by scanning the days of the current year in order. The number of
+    buckets doubles or halves with the number of entries, and the bucket
+    width is re-estimated from the spacing of the earliest entries.
+    """
+
+    def __init__(self, numBuckets=2, bucketWidth=1.0):
+        self._size = 0
+        self._resize(numBuckets, bucketWidth, [])
+
+    def __len__(self):
+        return self._size
+
+    def _resize(self, numBuckets, bucketWidth, entries):
+        """Rebuilds the calendar with the given number of buckets."""
+        self._buckets = [[] for _ in range(numBuckets)]
+        self._width = float(bucketWidth)
+        # Day number (floor(t / width)) of the bucket being dequeued.
+        self._currentDay = None
+        self._size = 0
+        self._growThreshold = 2 * numBuckets
+        self._shrinkThreshold = numBuckets // 2 if numBuckets > 2 else -1
+        for entry in entries:
+            self._insert(entry)
+
+    def _newWidth(self):
+        """Estimates a bucket width from the earliest entries."""
+        times = sorted(heapq.nsmallest(
+            25, (e[0] for b in self._buckets for e in b)))
+        gaps = [b - a for a, b in zip(times, times[1:]) if b > a]
+        if not gaps:
+            return self._width
+        return 3.0 * sum(gaps) / len(gaps)
+
+    def _rebuild(self, numBuckets):
+        """Redistributes all entries over a new number of buckets."""
+        entries = self.entries()
+        self._resize(numBuckets, self._newWidth(), entries)
+
+    def _insert(self, entry):
+        day = math.floor(entry[0] / self._width)
+        heapq.heappush(self._buckets[day % len(self._buckets)], entry)
+        if self._currentDay is None or day < self._currentDay:
+            self._currentDay = day
+        self._size += 1
+
+    def push(self, entry):
+        self._insert(entry)
+        if self._size > self._growThreshold:
+            self._rebuild(2 * len(self._buckets))
+
+    def _findFirst(self):
+        """Returns the bucket holding the smallest entry, or None."""
+        if not self._size:
+            return None
+        buckets = self._buckets
+        numBuckets = len(buckets)
+        width = self._width
+        day = self._currentDay
+        # Scan one year of buckets starting from the current day.
+        for _ in range(numBuckets):
+            bucket = buckets[day % numBuckets]
+            if bucket and math.floor(bucket[0][0] / width) <= day:
+                self._currentDay = day
+                return bucket
+            day += 1
+        # No entry within the next year: search all buckets directly.
+        bucket = min((b for b in buckets if b), key=lambda b: b[0])
+        self._currentDay = math.floor(bucket[0][0] / width)
+        return bucket
+
+    def pop(self):
+        bucket = self._findFirst()
+        if bucket is None:
+            raise IndexError('pop from empty FEL')
+        entry = heapq.heappop(bucket)
+        self._size -= 1
+        if self._size < self._shrinkThreshold:
+            self._rebuild(len(self._buckets) // 2)
+        return entry
+
+    def first(self):
+        bucket = self._findFirst()
+        return bucket[0] if bucket is not None else None
+
+    def entries(self):
+        return [entry for bucket in self._buckets for entry in bucket]
+
+    def clear(self):
+        # The calendar keeps its current number of buckets and width.
+        self._resize(len(self._buckets), self._width, [])
+
+
+class BucketFEL(object):
+    """Bucketed time wheel with a ladder-style overflow rung.
+
+    The wheel covers numBuckets buckets of fixed width starting at an
+    origin time. Entries within the wheel go into the heap of their bucket
+    and entries beyond it into an overflow heap. When the wheel is empty,
+    it is moved forward to the earliest overflow entry and refilled. This
+    suits event times that are dense within a bounded horizon, such as one
+    simulated day.
+    """
+
+    def __init__(self, bucketWidth=1.0, numBuckets=2048, origin=0.0):
+        self._width = float(bucketWidth)
+        self._buckets = [[] for _ in range(numBuckets)]
+        self._overflow = []
+        self._origin = origin
+        # Origin of the wheel when the FEL is created or cleared.
+        self._initialOrigin = origin
+        # Index of the first bucket that may hold entries.
+        self._current = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def push(self, entry):
+        index = int((entry[0] - self._origin) // self._width)
+        if index < self._current:
+            # Entries earlier than the current bucket keep their order within
+            # it, as no earlier bucket holds entries.
+            index = self._current
+        if index < len(self._buckets):
+            heapq.heappush(self._buckets[index], entry)
+        else:
+            heapq.heappush(self._overflow, entry)
+        self._size += 1
+
+    def _findFirst(self):
+        """Returns the bucket holding the smallest entry, or None."""
+        if not self._size:
+            return None
+        buckets = self._buckets
+        while True:
+            for index in range(self._current, len(buckets)):
+                if buckets[index]:
+                    self._current = index
+                    return buckets[index]
+            # The wheel is empty: move it to the earliest overflow entry.
+            overflow = self._overflow
+            self._overflow = []
+            self._origin = math.floor(
+                overflow[0][0] / self._width) * self._width
+            self._current = 0
+            self._size -= len(overflow)
+            for entry in overflow:
+                self.push(entry)
+
+    def pop(self):
+        bucket = self._findFirst()
+        if bucket is None:
+            raise IndexError('pop from empty FEL')
+        self._size -= 1
+        return heapq.heappop(bucket)
+
+    def first(self):
+        bucket = self._findFirst()
+        return bucket[0] if bucket is not None else None
+
+    def entries(self):
+        return ([entry for bucket in self._buckets for entry in bucket]
+                + list(self._overflow))
+
+    def clear(self):
+        self._buckets = [[] for _ in self._buckets]
+        self._overflow = []
+        self._origin = self._initialOrigin
+        self._current = 0
+        self._size = 0
+
+
+def makeFEL(backend=HEAP):
+    """Creates an empty FEL.
+
+    Args:
+        backend: Name of the backend (HEAP, CALENDAR or BUCKET), or a FEL
+            instance, which is returned unchanged.
+
+    Returns:
+        FEL instance.
+    """
+    if not isinstance(backend, str):
+        return backend
+    if backend == HEAP:
+        return HeapFEL()
+    if backend == CALENDAR:
+        return CalendarQueueFEL()
+    if backend == BUCKET:
+        return BucketFEL()
+    raise ValueError('unknown FEL backend %r' % backend)
@@ -0,0 +1,410 @@
+"""Deterministic fluid approximation of the bike sharing simulation.
+
+The fluid model replaces individual customers by expected flows. The day is
+divided into fixed time steps. In every step, the expected demand at each
+station is served from its bike inventory, the served rides are routed to
+their destinations with the destination probabilities, and they dock there
+after the average trip duration, limited by the number of racks. Bikes that
+find no empty rack wait in a backlog and unmet demand waits at most one
+step before it is lost, similar to the customer queues of the simulation.
+
+All quantities are arrays with a leading batch dimension, so that many
+initial distributions are scored at once. The model is intended to screen
+distributions before evaluating the most promising ones with
+BikeSharingSimulation.run.
+
+Run from the project root directory to measure the correlation with the
+simulation:
+`python -m simcode.src.fluid --numDistributions=20`
+"""
+
+# Standard libs.
+import argparse
+import logging
+import time
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+import simcode.src.nycbike as nycbike
+
+
+# Default length of a time step in minutes.
+DEFAULT_TIME_STEP = 5.0
+
+# Default number of distributions evaluated together.
+DEFAULT_CHUNK_SIZE = 32
+
+
+def _destinationEntries(destinationP, timeframe):
+    """Returns the (start, destination, probability) arrays of a timeframe.
+
+    Only destinations with non-zero probability are returned.
+    """
+    if isinstance(destinationP, load_trip_stats.SparseDestinationP):
+        numStations, numTimeframes = destinationP.shape[:2]
+        starts, destinations, probs = [], [], []
+        for stationID in range(numStations):
+            row = stationID * numTimeframes + timeframe
+            begin, end = destinationP.offsets[row:row + 2]
+            starts.append(np.full(end - begin, stationID))
+            destinations.append(destinationP.indices[begin:end])
+            probs.append(destinationP.probs[begin:end])
+        return (np.concatenate(starts), np.concatenate(destinations),
+                np.concatenate(probs).astype(float))
+    probs = np.asarray(destinationP[:, timeframe, :])
+    starts, destinations = np.nonzero(probs)
+    return starts, destinations, probs[starts, destinations]
+
+
+class _RideRouting(object):
+    """Routing of served rides to destination stations and time steps.
+
+    Entries (start, destination) with non-zero probability are sorted by
+    (delay, destination), so that the rides of all entries with the same
+    target are summed with one np.add.reduceat.
+    """
+
+    def __init__(self, starts, destinations, probs, delays, numStations):
+        order = np.lexsort((destinations, delays))
+        self.starts = starts[order]
+        self.probs = probs[order]
+        targets = delays[order] * numStations + destinations[order]
+        # First entry of every distinct target.
+        self.groupStarts = np.flatnonzero(
+            np.r_[True, targets[1:] != targets[:-1]])
+        self.targets = targets[self.groupStarts]
+        self.delays = delays[order][self.groupStarts]
+
+
+class FluidModel(object):
+    """Fluid approximation of a simulated day."""
+
+    def __init__(self, tripCountData, tripDurations, destinationP,
+                 scaleArrivalRate=1, racksPerStation=nycbike.RACKS,
+                 timeStep=DEFAULT_TIME_STEP,
+                 bikeLossProb=nycbike.BIKE_LOSS_PROBABILITY):
+        """Builds the model from the trip statistics.
+
+        Args:
+            tripCountData: Array where entry [i][j] is the number of trips
+                from station i in timeframe j.
+            tripDurations: Array of average trip durations in minutes.
+            destinationP: Destination probabilities, dense or
+                SparseDestinationP.
+            scaleArrivalRate: Scale factor for the number of arrivals.
+            racksPerStation: Number of racks per station.
+            timeStep: Length of a time step in minutes.
+            bikeLossProb: Probability of a bike being lost on a ride.
+        """
+        self.numStations, numTimeframes = tripCountData.shape
+        self.racksPerStation = racksPerStation
+        self.timeStep = float(timeStep)
+        self.bikeLossProb = bikeLossProb
+        self.numSteps = int(np.ceil(nycbike.DAY_DURATION / self.timeStep))
+        timeframeLength = float(nycbike.DAY_DURATION) / numTimeframes
+
+        # Expected arrivals per step, as in computeArrivalTimes.
+        tripCounts = np.rint(tripCountData * scaleArrivalRate)
+        self._demand = tripCounts * (self.timeStep / timeframeLength)
+        self._stepTimeframes = np.minimum(
+            (np.arange(self.numSteps) * self.timeStep
+             / timeframeLength).astype(int), numTimeframes - 1)
+
+        # Rides dock at least one step after they start.
+        self._routings = []
+        maxDelay = 1
+        for timeframe in range(numTimeframes):
+            starts, destinations, probs = _destinationEntries(
+                destinationP, timeframe)
+            durations = np.asarray(tripDurations)[starts, destinations]
+            delays = np.maximum(
+                1, np.rint(durations / self.timeStep)).astype(np.int64)
+            # Rides that end after the day never dock.
+            delays = np.minimum(delays, self.numSteps)
+            self._routings.append(_RideRouting(
+                starts, destinations, probs, delays, self.numStations))
+            if len(delays):
+                maxDelay = max(maxDelay, int(delays.max()))
+        # Rides in flight are kept in a ring buffer of time steps.
+        self._ringLength = maxDelay + 1
+
+    @classmethod
+    def fromTripData(cls, tripDataDir=None, sparseDestinations=False,
+                     **kwargs):
+        """Builds the model from the trip statistics in a directory.
+
+        Args:
+            tripDataDir: Directory containing the trip statistics.
+            sparseDestinations: If True, the sparse destination
+                probabilities are used.
+            kwargs: Other arguments of FluidModel.
+        """
+        tripCountData, tripDurations, destinationP = (
+            load_trip_stats.loadTripStatistics(
+                tripDataDir or load_trip_stats.TRIP_DATA_DIR,
+                sparse=sparseDestinations))
+        return cls(tripCountData, tripDurations, destinationP, **kwargs)
+
+    def evaluate(self, distributions, chunkSize=DEFAULT_CHUNK_SIZE):
+        """Estimates the simulation statistics of initial distributions.
+
+        Args:
+            distributions: Array of shape (stations,) or (K, stations) of
+                initial numbers of bikes.
+            chunkSize: Number of distributions evaluated together, which
+                bounds the memory used for rides in flight.
+
+        Returns:
+            Dictionary with the keys of BikeSharingSimulation.run. Revenue
+            and BikesLost have shape (K,) and the per-station statistics
+            shape (K, stations), without the K dimension for a single
+            distribution.
+        """
+        distributions = np.asarray(distributions, dtype=float)
+        single = distributions.ndim == 1
+        distributions = np.atleast_2d(distributions)
+        chunks = [self._evaluateChunk(distributions[i:i + chunkSize])
+                  for i in range(0, len(distributions), chunkSize)]
+        statistics = dict(
+            (name, np.concatenate([chunk[name] for chunk in chunks]))
+            for name in chunks[0])
+        if single:
+            statistics = dict(
+                (name, value[0]) for name, value in statistics.items())
+        return statistics
+
+    def _dock(self, bikes, dropoffBacklogs):
+        """Docks waiting bikes in empty racks, longest waiting first."""
+        for dropoffBacklog in reversed(dropoffBacklogs):
+            docked = np.minimum(dropoffBacklog, self.racksPerStation - bikes)
+            bikes += docked
+            dropoffBacklog -= docked
+
+    def _evaluateChunk(self, distributions):
+        """Evaluates a (K, stations) array of distributions."""
+        numDistributions, numStations = distributions.shape
+        dt = self.timeStep
+        ringLength = self._ringLength
+        # Carry unmet demand to the next step if customers wait that long.
+        carryDemand = dt <= nycbike.REFUND_TIME
+        # Customers still waiting to drop off a bike at the end of this many
+        # steps after the step they arrived in get a refund.
+        refundSteps = max(1, int(round(nycbike.REFUND_TIME / dt)))
+
+        # Arrays are indexed by station first, so that the rides of one
+        # station are contiguous when they are routed.
+        bikes = distributions.T.copy()
+        # Bikes waiting for an empty rack by the number of step ends they
+        # have waited, the last entry holding the refunded customers.
+        dropoffBacklogs = [np.zeros_like(bikes)
+                           for _ in range(refundSteps + 2)]
+        # Customers waiting for a bike.
+        pickupBacklog = np.zeros_like(bikes)
+        # Rides in flight by docking step (modulo ringLength) and station.
+        inFlight = np.zeros((ringLength * numStations, numDistributions))
+        numRides = np.zeros_like(bikes)
+        refunds = np.zeros_like(bikes)
+        customersLost = np.zeros_like(bikes)
+        timeWaitForCycle = np.zeros_like(bikes)
+        timeWaitForDropoff = np.zeros_like(bikes)
+        idleTime = np.zeros_like(bikes)
+        bikesLost = np.zeros(numDistributions)
+
+        for step in range(self.numSteps):
+            # Dock the rides that end in this step.
+            slot = (step % ringLength) * numStations
+            dropoffBacklogs[0] += inFlight[slot:slot + numStations]
+            inFlight[slot:slot + numStations] = 0
+            self._dock(bikes, dropoffBacklogs)
+
+            # Serve waiting customers, then new demand.
+            served = np.minimum(pickupBacklog, bikes)
+            bikes -= served
+            timeWaitForCycle += (served * (dt / 2.0)
+                                 + (pickupBacklog - served)
+                                 * nycbike.REFUND_TIME)
+            customersLost += pickupBacklog - served
+            rides = served
+            demand = self._demand[:, self._stepTimeframes[step], None]
+            served = np.minimum(demand, bikes)
+            bikes -= served
+            rides = rides + served
+            if carryDemand:
+                pickupBacklog = demand - served
+            else:
+                customersLost += demand - served
+            numRides += rides
+
+            # Pickups free racks for waiting bikes.
+            self._dock(bikes, dropoffBacklogs)
+            for dropoffBacklog in dropoffBacklogs:
+                timeWaitForDropoff += dropoffBacklog * dt
+            idleTime += bikes * dt
+            # Age the waiting bikes.
+            refunds += dropoffBacklogs[-2]
+            dropoffBacklogs[-1] += dropoffBacklogs[-2]
+            dropoffBacklogs[1:-1] = dropoffBacklogs[:-2]
+            dropoffBacklogs[0] = np.zeros_like(bikes)
+
+            # Route the rides to their destinations.
+            bikesLost += rides.sum(axis=0) * self.bikeLossProb
+            rides *= 1.0 - self.bikeLossProb
+            routing = self._routings[self._stepTimeframes[step]]
+            # Rides that dock after the end of the day are dropped.
+            numTargets = np.searchsorted(
+                routing.delays, self.numSteps - step)
+            if numTargets == 0:
+                continue
+            numEntries = (routing.groupStarts[numTargets]
+                          if numTargets < len(routing.groupStarts)
+                          else len(routing.starts))
+            flows = (rides[routing.starts[:numEntries]]
+                     * routing.probs[:numEntries, None])
+            targets = ((routing.targets[:numTargets] + step * numStations)
+                       % (ringLength * numStations))
+            inFlight[targets] += np.add.reduceat(
+                flows, routing.groupStarts[:numTargets], axis=0)
+
+        return {
+            'Revenue': nycbike.TRIP_COST * (numRides - refunds).sum(axis=0),
+            'TimeWaitForDropoff': timeWaitForDropoff.T,
+            'TimeWaitForCycle': timeWaitForCycle.T,
+            'CustomersLost': customersLost.T,
+            'BikesLost': bikesLost,
+            'IdleTime': idleTime.T,
+        }
+
+
+def randomDistributions(numDistributions, numStations,
+                        totalNumBikes=nycbike.NUM_BIKES,
+                        racksPerStation=nycbike.RACKS, concentration=1.0,
+                        rng=np.random):
+    """Draws random initial distributions of bikes.
+
+    Station shares are drawn from a symmetric Dirichlet distribution, bikes
+    are assigned with a multinomial draw, and bikes beyond the rack capacity
+    are reassigned to stations with empty racks.
+
+    Args:
+        numDistributions: Number of distributions K.
+        numStations: Number of stations.
+        totalNumBikes: Number of bikes in every distribution.
+        racksPerStation: Maximum number of bikes per station.
+        concentration: Dirichlet concentration. Smaller values give more
+            uneven distributions.
+        rng: Random number generator.
+
+    Returns:
+        (K, stations) float array of bike counts.
+    """
+    assert totalNumBikes <= numStations * racksPerStation
+    distributions = np.zeros((numDistributions, numStations))
+    for i in range(numDistributions):
+        shares = rng.dirichlet(np.full(numStations, concentration))
+        counts = rng.multinomial(totalNumBikes, shares)
+        while counts.max() > racksPerStation:
+            excess = np.maximum(counts - racksPerStation, 0).sum()
+            counts = np.minimum(counts, racksPerStation)
+            space = racksPerStation - counts
+            counts += rng.multinomial(excess, space / float(space.sum()))
+        distributions[i] = counts
+    return distributions
+
+
+def rankCorrelation(x, y):
+    """Returns the Spearman rank correlation of two samples without ties."""
+    return np.corrcoef(
+        np.argsort(np.argsort(x)), np.argsort(np.argsort(y)))[0, 1]
+
+
+def compareWithSimulation(model, distributions, numReplications=1,
+                          rngSeed=0, **runKwargs):
+    """Compares fluid estimates with simulation results.
+
+    Args:
+        model: FluidModel.
+        distributions: (K, stations) array of initial distributions.
+        numReplications: Number of simulation runs averaged per
+            distribution.
+        rngSeed: Seed of the first simulation run of every distribution.
+        runKwargs: Other arguments of BikeSharingSimulation.run, which
+            should match the model parameters.
+
+    Returns:
+        Dictionary from statistic name to a dictionary with the fluid and
+        simulated totals per distribution (fluid, simulation) and their
+        Pearson and Spearman correlations (pearson, spearman).
+    """
+    fluidStatistics = model.evaluate(distributions)
+    simulated = dict((name, np.zeros(len(distributions)))
+                     for name in fluidStatistics)
+    for i, distribution in enumerate(distributions):
+        for replication in range(numReplications):
+            statistics = nycbike.BikeSharingSimulation().run(
+                initialDistribution=distribution,
+                rngSeed=rngSeed + replication, **runKwargs)
+            for name in simulated:
+                simulated[name][i] += (np.sum(statistics[name])
+                                       / float(numReplications))
+
+    comparison = {}
+    for name in fluidStatistics:
+        fluid = fluidStatistics[name]
+        if fluid.ndim > 1:
+            fluid = fluid.sum(axis=1)
+        comparison[name] = {
+            'fluid': fluid,
+            'simulation': simulated[name],
+            'pearson': np.corrcoef(fluid, simulated[name])[0, 1],
+            'spearman': rankCorrelation(fluid, simulated[name]),
+        }
+    return comparison
+
+
+def main():
+    """Parses command-line args and compares the model with simulations."""
+    parser = argparse.ArgumentParser(description='Fluid surrogate model')
+    parser.add_argument('--tripDataDir', dest='tripDataDir', action='store',
+        default=load_trip_stats.TRIP_DATA_DIR,
+        help='Directory of the trip statistics.')
+    parser.add_argument('--numDistributions', dest='numDistributions',
+        action='store', default=20,
+        help='Number of random distributions compared.')
+    parser.add_argument('--scaleArrivalRate', dest='scaleArrivalRate',
+        action='store', default=1, help='Scale factor for arrival rate.')
+    parser.add_argument('--timeStep', dest='timeStep', action='store',
+        default=DEFAULT_TIME_STEP, help='Time step in minutes.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    scaleArrivalRate = float(args.scaleArrivalRate)
+    model = FluidModel.fromTripData(
+        args.tripDataDir, scaleArrivalRate=scaleArrivalRate,
+        timeStep=float(args.timeStep))
+    # Distributions from almost uniform to very uneven.
+    rng = np.random.RandomState(0)
+    numDistributions = int(args.numDistributions)
+    distributions = np.concatenate([randomDistributions(
+        1, model.numStations, concentration=concentration, rng=rng)
+        for concentration in np.logspace(-1, 2, numDistributions)])
+
+    startTime = time.time()
+    model.evaluate(distributions)
+    print('fluid model: %.1f distributions/sec' % (
+        numDistributions / (time.time() - startTime)))
+    comparison = compareWithSimulation(
+        model, distributions, tripDataDir=args.tripDataDir,
+        scaleArrivalRate=scaleArrivalRate)
+    print('%-20s %10s %10s %16s %16s' % (
+        'statistic', 'pearson', 'spearman', 'mean fluid', 'mean simulation'))
+    for name, result in sorted(comparison.items()):
+        print('%-20s %10.3f %10.3f %16.1f %16.1f' % (
+            name, result['pearson'], result['spearman'],
+            result['fluid'].mean(), result['simulation'].mean()))
+
+
+if __name__ == '__main__':
+    main()
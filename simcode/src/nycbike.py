@@ -2,6 +2,9 @@
 
 # Standard libs.
 import argparse
+import array
+import concurrent.futures
+import itertools
 import logging
 import os
 import time
@@ -13,7 +16,13 @@ import numpy as np
 
 # App libs.
 import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+import simcode.src.confidence as confidence
 import simcode.src.engine as engine
+import simcode.src.fel as fel
+import simcode.src.randomness as randomness
+import simcode.src.sampling as sampling
+import simcode.src.telemetry as telemetry
+import simcode.src.tracing as tracing
 
 
 ##############################
@@ -34,6 +43,23 @@ REFUND_TIME = 5
 # Probability of a bike becoming lost/damaged due to accident.
 BIKE_LOSS_PROBABILITY = 0.001
 
+# Number of 32-bit words used to seed the random number generator from a
+# np.random.SeedSequence.
+RNG_STATE_WORDS = 8
+
+# Customer arrival modes: arrivals spaced evenly within every timeframe,
+# or drawn as a non-homogeneous Poisson process with the timeframe rates.
+DETERMINISTIC_ARRIVALS = 'deterministic'
+POISSON_ARRIVALS = 'poisson'
+
+# Last element of the SeedSequence spawn key of the Poisson arrivals of the
+# days after the first in runDays, which are drawn from their own generator.
+POISSON_SPAWN_KEY = 0x706f6973
+
+# Names of the statistics returned by a simulation run.
+STATISTICS = ('Revenue', 'TimeWaitForDropoff', 'TimeWaitForCycle',
+              'CustomersLost', 'BikesLost', 'IdleTime')
+
 # Initial number of bikes available in the system.
 NUM_BIKES = 12000
 
@@ -49,6 +75,9 @@ RACKS = 30
 class Customer(object):
     """Represents a Citi bike customer."""
 
+    __slots__ = ('customerID', 'arrivalIndex', 'startID', 'endID',
+                 'startPickupWait', 'startDropoffWait')
+
     # Monotonically increasing customer id.
     currentCustomerID = 0
 
@@ -56,14 +85,25 @@ class Customer(object):
         # Assign unique customer ID.
         self.customerID = Customer.currentCustomerID
         Customer.currentCustomerID += 1
+        # Index of the customer's arrival in the ArrivalSchedule.
+        self.arrivalIndex = None
+        self.startID = None
+        self.endID = None
         self.startPickupWait = None
+        self.startDropoffWait = None
 
 
 class Queue(object):
     """Represents queue of customers waiting for bike pickup or return."""
 
-    def __init__(self):
-        self.queue = deque([])
+    def __init__(self, queue=None):
+        """Creates a queue.
+
+        Args:
+            queue: Deque of the waiting customers. Defaults to an empty
+                deque.
+        """
+        self.queue = deque([]) if queue is None else queue
 
     def __len__(self):
         return len(self.queue)
@@ -79,15 +119,315 @@ class Queue(object):
         return self.queue.popleft()
 
 
+def _stationColumn(name, doc):
+    """Returns a property that reads and writes a StationTable column."""
+    def get(self):
+        return getattr(self._table, name)[self._row]
+
+    def set(self, value):
+        getattr(self._table, name)[self._row] = value
+    return property(get, set, doc=doc)
+
+
 class Station(object):
-    """Represents a bike station."""
+    """Represents a bike station.
+
+    A station is a view of one row of a StationTable, which holds the state
+    of all stations. A station created on its own is the only row of a
+    table of its own, until it is appended to another table.
+    """
+
+    __slots__ = ('stationID', '_table', '_row')
 
     def __init__(self, stationID, totalRacks, numBikes):
         assert numBikes <= totalRacks
         self.stationID = stationID
-        self.numBikes = numBikes
-        self.numRacks = totalRacks - numBikes
-        self.lastEvent = 0
+        self._table = StationTable()
+        self._table.extend(totalRacks, [numBikes])
+        self._row = 0
+
+    @classmethod
+    def _view(cls, table, row):
+        """Returns a view of a row of a table."""
+        station = cls.__new__(cls)
+        station.stationID = row
+        station._table = table
+        station._row = row
+        return station
+
+    numBikes = _stationColumn('numBikes', 'Number of docked bikes.')
+    numRacks = _stationColumn('numRacks', 'Number of empty racks.')
+    lastEvent = _stationColumn(
+        'lastEvent', 'Time up to which the idle time has been counted.')
+
+
+class StationTable(object):
+    """State of all bike stations, stored by column.
+
+    Row i of the numBikes, numRacks and lastEvent columns is the state of
+    station i. The event handlers index the columns directly: Python arrays
+    are as fast as lists for scalar access, while whole-network operations
+    work on NumPy views of the same memory (see arrays). Indexing or
+    iterating over the table gives Station views of the rows.
+    """
+
+    def __init__(self, stations=()):
+        """Creates a table of the given stations.
+
+        Args:
+            stations: Station objects, which become views of their rows.
+        """
+        self.numBikes = array.array('q')
+        self.numRacks = array.array('q')
+        self.lastEvent = array.array('d')
+        self._views = []
+        for station in stations:
+            self.append(station)
+
+    def __len__(self):
+        return len(self.numBikes)
+
+    def __getitem__(self, stationID):
+        return self._stationViews()[stationID]
+
+    def __iter__(self):
+        return iter(self._stationViews())
+
+    def _stationViews(self):
+        """Returns the Station views of all rows, creating missing ones."""
+        views = self._views
+        for row in range(len(views), len(self.numBikes)):
+            views.append(Station._view(self, row))
+        return views
+
+    def extend(self, racksPerStation, numBikes):
+        """Adds stations at the end of the table.
+
+        Args:
+            racksPerStation: Number of racks of every new station, or a
+                sequence with the number of racks of each.
+            numBikes: Sequence with the number of bikes of each new station.
+        """
+        numBikes = np.asarray(numBikes).astype(np.int64)
+        numRacks = np.broadcast_to(racksPerStation, numBikes.shape) - numBikes
+        assert np.all(numRacks >= 0)
+        self.numBikes.frombytes(numBikes.tobytes())
+        self.numRacks.frombytes(numRacks.astype(np.int64).tobytes())
+        self.lastEvent.frombytes(np.zeros(len(numBikes)).tobytes())
+
+    def append(self, station):
+        """Moves a station into a new row, making it a view of the row."""
+        views = self._stationViews()
+        self.numBikes.append(station.numBikes)
+        self.numRacks.append(station.numRacks)
+        self.lastEvent.append(station.lastEvent)
+        station._table = self
+        station._row = len(views)
+        views.append(station)
+
+    def arrays(self):
+        """Returns NumPy views of the columns.
+
+        The table cannot grow while the views are in use.
+
+        Returns:
+            Dictionary of the numBikes, numRacks (int64) and lastEvent
+            (float64) arrays, indexed by station ID.
+        """
+        return {
+            'numBikes': np.frombuffer(self.numBikes, dtype=np.int64),
+            'numRacks': np.frombuffer(self.numRacks, dtype=np.int64),
+            'lastEvent': np.frombuffer(self.lastEvent, dtype=np.float64),
+        }
+
+    def accumulateIdleTime(self, idleTime, currentTime):
+        """Adds the idle time of the docked bikes up to currentTime.
+
+        Args:
+            idleTime: Array of the idle time of every station, updated in
+                place.
+            currentTime: Simulation time up to which idle time is counted,
+                which becomes the lastEvent of every station.
+        """
+        arrays = self.arrays()
+        idleTime += arrays['numBikes'] * (currentTime - arrays['lastEvent'])
+        arrays['lastEvent'].fill(currentTime)
+
+    def __getstate__(self):
+        # Views are recreated on demand, so copies only hold the columns.
+        state = self.__dict__.copy()
+        state['_views'] = []
+        return state
+
+
+class QueueTable(object):
+    """Queues of customers of all stations.
+
+    The event handlers use the deques in the queues list directly. Copies
+    and pickles store all waiting customers in one list, so that snapshots
+    do not copy an object per station. Indexing or iterating over the
+    table gives Queue views of the deques.
+    """
+
+    def __init__(self, queues=()):
+        """Creates a table of the given queues.
+
+        Args:
+            queues: Queue objects, which become views of their rows.
+        """
+        self.queues = []
+        self._views = []
+        for queue in queues:
+            self.append(queue)
+
+    def __len__(self):
+        return len(self.queues)
+
+    def __getitem__(self, stationID):
+        return self._queueViews()[stationID]
+
+    def __iter__(self):
+        return iter(self._queueViews())
+
+    def _queueViews(self):
+        """Returns the Queue views of all rows, creating missing ones."""
+        views = self._views
+        for row in range(len(views), len(self.queues)):
+            views.append(Queue(self.queues[row]))
+        return views
+
+    def extend(self, numQueues):
+        """Adds empty queues at the end of the table."""
+        self.queues.extend(deque() for _ in range(numQueues))
+
+    def append(self, queue):
+        """Moves a queue into a new row, sharing its deque."""
+        views = self._queueViews()
+        self.queues.append(queue.queue)
+        views.append(queue)
+
+    def lengths(self):
+        """Returns an integer array of the queue lengths."""
+        return np.fromiter(map(len, self.queues), dtype=np.int64,
+                           count=len(self.queues))
+
+    def __getstate__(self):
+        return {
+            'lengths': array.array('q', map(len, self.queues)),
+            'customers': [
+                customer for queue in self.queues for customer in queue],
+        }
+
+    def __setstate__(self, state):
+        customers = iter(state['customers'])
+        self.queues = [deque(itertools.islice(customers, length))
+                       for length in state['lengths']]
+        self._views = []
+
+
+class ArrivalSchedule(object):
+    """Customer arrival times of all stations stored in one flat array.
+
+    The arrival times of station s are times[offsets[s]:offsets[s + 1]] in
+    increasing order. Arrivals are consumed through an integer cursor per
+    station, which leaves the times untouched so that they can be shared
+    between simulation runs.
+
+    The schedule also orders all arrivals into one merged stream, sorted by
+    time and then by station. Every arrival carries the engine priority that
+    reproduces its position in this stream, so arrivals scheduled one at a
+    time through the FEL are processed in exactly the same order as the
+    merged stream.
+    """
+
+    def __init__(self, times, offsets):
+        self.times = times
+        self.offsets = offsets
+        # Python lists are faster than NumPy arrays for scalar access.
+        self._times = times.tolist()
+        self._ends = offsets[1:].tolist()
+        self.cursors = offsets[:-1].tolist()
+        # Index of the next customer to arrive at each station.
+        self.arrived = offsets[:-1].tolist()
+
+        # Times are stored station by station, so a stable sort orders
+        # simultaneous arrivals by station.
+        order = np.argsort(times, kind='stable')
+        ranks = np.empty(len(times), dtype=np.int64)
+        ranks[order] = np.arange(len(times))
+        self._priorities = (ranks - len(times)).tolist()
+        stationIDs = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        self._mergedStream = (times[order], stationIDs[order])
+
+    @classmethod
+    def fromLists(cls, arrivalTimes):
+        """Creates a schedule from per-station lists of arrival times."""
+        counts = [len(times) for times in arrivalTimes]
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        times = np.array(
+            [t for stationTimes in arrivalTimes for t in stationTimes],
+            dtype=float)
+        return cls(times, offsets)
+
+    def __len__(self):
+        """Returns the number of stations."""
+        return len(self._ends)
+
+    def copy(self):
+        """Returns a schedule sharing the times with all cursors reset."""
+        schedule = ArrivalSchedule.__new__(ArrivalSchedule)
+        schedule.__dict__.update(self.__dict__)
+        schedule.cursors = self.offsets[:-1].tolist()
+        schedule.arrived = self.offsets[:-1].tolist()
+        return schedule
+
+    def __deepcopy__(self, memo):
+        # Copies share the times and only copy the cursors.
+        schedule = self.copy()
+        schedule.cursors = list(self.cursors)
+        schedule.arrived = list(self.arrived)
+        return schedule
+
+    def numArrivals(self):
+        """Returns the total number of arrivals at all stations."""
+        return len(self._times)
+
+    def numRemaining(self, stationID):
+        """Returns the number of unconsumed arrivals at a station."""
+        return self._ends[stationID] - self.cursors[stationID]
+
+    def nextArrival(self, stationID):
+        """Consumes the next arrival of a station.
+
+        Returns:
+            Tuple of (arrival time, engine priority), or None if all arrivals
+            at the station have been consumed.
+        """
+        cursor = self.cursors[stationID]
+        if cursor >= self._ends[stationID]:
+            return None
+        self.cursors[stationID] = cursor + 1
+        return self._times[cursor], self._priorities[cursor]
+
+    def arrive(self, stationID):
+        """Records the arrival of a new customer at a station.
+
+        Returns:
+            Index of the customer's arrival, in [0, numArrivals()). The
+            k-th customer to arrive at a station always gets the same index.
+        """
+        index = self.arrived[stationID]
+        self.arrived[stationID] = index + 1
+        return index
+
+    def mergedStream(self):
+        """Returns all arrivals as one stream sorted by time.
+
+        Returns:
+            Tuple of (times, stationIDs) arrays.
+        """
+        return self._mergedStream
 
 
 ########################
@@ -102,67 +442,115 @@ def Initialize(simEngine, **kwargs):
     numStations = len(arrivalTimes)
 
     # Initialize bike stations and queues.
-    for stationID in range(numStations):
-        globalData['stations'].append(
-            Station(stationID,
-                    kwargs['racksPerStation'], initialDistribution[stationID]))
-        globalData['pickupQueues'].append(Queue())
-        globalData['dropoffQueues'].append(Queue())
+    globalData['stations'].extend(
+        kwargs['racksPerStation'], initialDistribution[:numStations])
+    globalData['pickupQueues'].extend(numStations)
+    globalData['dropoffQueues'].extend(numStations)
+    _scheduleArrivals(simEngine, globalData)
+
+
+def _scheduleArrivals(simEngine, globalData):
+    """Schedules the arrivals of globalData['arrivalTimes']."""
+    arrivalTimes = globalData['arrivalTimes']
+    if globalData['mergedArrivals']:
+        # All arrivals are merged into a presorted stream that bypasses the
+        # FEL.
+        times, stationIDs = arrivalTimes.mergedStream()
+        simEngine.attachStream(
+            times, Arrival, _ArrivalPayloads(globalData, stationIDs))
+        return
 
     # Schedule first arrival event for each station.
-    for stationID in range(numStations):
-        if len(arrivalTimes[stationID]) > 0:
-            t = arrivalTimes[stationID].pop(0)
-            simEngine.schedule(engine.DiscreteEvent(
-                Arrival, t, stationID=stationID, globalData=globalData))
+    for stationID in range(len(arrivalTimes)):
+        arrival = arrivalTimes.nextArrival(stationID)
+        if arrival is not None:
+            simEngine.scheduleAt(arrival[0], Arrival,
+                (globalData, stationID, None), arrival[1])
 
-def endSim(simEngine):
-    """Collects simulation statistics at the end of the simulation period(24 hrs)"""
-    for stationID in range(numStations):
-        globalData['statistics']['IdleTime'][stationID] += globalData['stations'][stationID].numBikes * (currentTime - globalData['stations'][stationID].lastEvent)
 
+@engine.eventHandler('globalData')
+def endSim(simEngine, globalData):
+    """Collects simulation statistics at the end of the simulation period.
 
-def Arrival(simEngine, **kwargs):
-    """Customer arrives at the station to pick up a bike."""
-    globalData = kwargs['globalData']
-    stationID = kwargs['stationID']
-    numStations = globalData['destinationP'].shape[0]
-    numTimeframes = globalData['destinationP'].shape[1]
+    Adds the idle time of the bikes docked since the last event at every
+    station. Runs as a finalizer at the end of the day (24 hrs).
+    """
+    globalData['stations'].accumulateIdleTime(
+        globalData['statistics']['IdleTime'], simEngine.simTime)
+
+
+class _ArrivalPayloads(object):
+    """Arrival event payloads of the merged arrival stream.
+
+    Payloads are created on demand so that the stream does not hold a tuple
+    per arrival.
+    """
+
+    def __init__(self, globalData, stationIDs):
+        self.globalData = globalData
+        self.stationIDs = stationIDs.tolist()
+
+    def __len__(self):
+        return len(self.stationIDs)
+
+    def __getitem__(self, i):
+        return (self.globalData, self.stationIDs[i], None)
+
+
+@engine.eventHandler('globalData', 'stationID', 'customer')
+def Arrival(simEngine, payload=None, **kwargs):
+    """Customer arrives at the station to pick up a bike.
+
+    The payload is a (globalData, stationID, customer) tuple, where customer
+    is None for a newly arriving customer. The same values can also be given
+    as keyword arguments.
+    """
+    if payload is None:
+        payload = (kwargs['globalData'], kwargs['stationID'],
+                   kwargs.get('customer'))
+    globalData, stationID, customer = payload
     # Customer who will pick up a bike.
-    if 'customer' in kwargs:
-        customer = kwargs['customer']
-    else:
+    if customer is None:
         customer = Customer()
+        customer.arrivalIndex = globalData['arrivalTimes'].arrive(stationID)
         customer.startID = stationID
-    currentTime = simEngine.currentTime()
-
-    # Checks the ArrivalData for the next arrival and schedules it.
-    # Note: schedule immediately in case customer has to wait in line / leaves
-    if len(globalData['arrivalTimes'][stationID]) > 0:
-        t = globalData['arrivalTimes'][stationID].pop(0)
-        simEngine.schedule(engine.DiscreteEvent(
-                Arrival, t, stationID=stationID, globalData=globalData))
+        # Checks the ArrivalData for the next arrival and schedules it,
+        # unless all arrivals are merged into the engine's stream.
+        # Note: schedule immediately in case customer has to wait in line /
+        # leaves
+        if not globalData['mergedArrivals']:
+            arrival = globalData['arrivalTimes'].nextArrival(stationID)
+            if arrival is not None:
+                simEngine.scheduleAt(arrival[0], Arrival,
+                    (globalData, stationID, None), arrival[1])
+    currentTime = simEngine.simTime
+    stations = globalData['stations']
+    numBikes = stations.numBikes
+    statistics = globalData['statistics']
+    trace = globalData['trace']
 
     # Check if there are bikes available.
-    if globalData['stations'][stationID].numBikes <= 0:
+    if numBikes[stationID] <= 0:
         # Customer begins waiting for bike to become available.
         customer.startPickupWait = currentTime
-        globalData['pickupQueues'][stationID].put(customer)
-        logging.debug(
-            '\t(customer %d) Damn! where are all the bikes at station %d, the time is %.3f' % (
-            customer.customerID, stationID, currentTime))
+        globalData['pickupQueues'].queues[stationID].append(customer)
+        if trace is not None:
+            trace.record(currentTime, tracing.NO_BIKE, customer.customerID,
+                         stationID)
         return
 
     # Customer pays to rent bike.
-    globalData['statistics']['Revenue'] += TRIP_COST
+    statistics['Revenue'] += TRIP_COST
 
     # Select destination based on the probabilities.
-    currentTimeframe = int(np.floor(
-        (currentTime / float(DAY_DURATION)) * numTimeframes))
+    numTimeframes = globalData['destinationP'].shape[1]
+    currentTimeframe = int(
+        (currentTime / float(DAY_DURATION)) * numTimeframes)
     currentTimeframe = min(currentTimeframe, numTimeframes - 1)
-    customer.endID = np.random.choice(
-        numStations,
-        p=globalData['destinationP'][stationID][currentTimeframe])
+    uDestination, uCrash = globalData['random'].tripVariates(
+        customer.arrivalIndex)
+    customer.endID = globalData['destinationSampler'].sample(
+        stationID, currentTimeframe, uDestination)
 
     # Schedule end of ride using the average trip duration.
     t = (currentTime
@@ -170,114 +558,135 @@ def Arrival(simEngine, **kwargs):
 
     # Determine if bike will become lost or damaged.
     rideOutcome = RideEnd
-    if np.random.random() <= globalData['bikeLossProb']:
+    if uCrash <= globalData['bikeLossProb']:
         rideOutcome = RideCrash
-    simEngine.schedule(engine.DiscreteEvent(rideOutcome, t,
-            customer=customer, globalData=globalData))
+    simEngine.scheduleAt(t, rideOutcome, (globalData, customer))
 
     # Update total Idle Time till current time
     if currentTime <= 1440:
-        globalData['statistics']['IdleTime'][stationID] += globalData['stations'][stationID].numBikes * (currentTime - globalData['stations'][stationID].lastEvent)
-        globalData['stations'][stationID].lastEvent = currentTime
+        lastEvent = stations.lastEvent
+        statistics['IdleTime'][stationID] += numBikes[stationID] * (
+            currentTime - lastEvent[stationID])
+        lastEvent[stationID] = currentTime
 
     # Update number of bikes and racks for the station.
-    globalData['stations'][stationID].numBikes -= 1
-    globalData['stations'][stationID].numRacks += 1
+    numBikes[stationID] -= 1
+    stations.numRacks[stationID] += 1
 
-    logging.debug(
-        '\t(customer %d) yay! i got a bike from %d at time %.3f n im going to %d n will reach at %.3f' % (
-        customer.customerID, stationID, currentTime, customer.endID, t))
+    if trace is not None:
+        trace.record(currentTime, tracing.PICKUP, customer.customerID,
+                     stationID, customer.endID, t)
 
     # Checks if there are people waiting to put the bikes back.
-    if len(globalData['dropoffQueues'][stationID]) > 0:
+    dropoffQueue = globalData['dropoffQueues'].queues[stationID]
+    if dropoffQueue:
         # Calculate time the customer waited to drop off the bike.
-        waitingCustomer = globalData['dropoffQueues'][stationID].remove()
+        waitingCustomer = dropoffQueue.popleft()
         waitTime = currentTime - waitingCustomer.startDropoffWait
         #  Update total wait time.
-        globalData['statistics']['TimeWaitForDropoff'][stationID] += waitTime
-        logging.debug(
-            '\t(customer %d) finally i can return my bike at stn %d after waiting for %.3f having arrived at %.3f' % (
-            waitingCustomer.customerID, stationID, waitTime, currentTime))
+        statistics['TimeWaitForDropoff'][stationID] += waitTime
+        if trace is not None:
+            trace.record(currentTime, tracing.DROPOFF_AFTER_WAIT,
+                         waitingCustomer.customerID, stationID, value=waitTime)
         # If customer has waited too long to return the bike, refund is given.
         if waitTime > REFUND_TIME:
-            globalData['statistics']['Revenue'] -= TRIP_COST
-            logging.debug(
-                '\t(customer %d) at least i got my refund for waiting too long to return the bike' % (
-                waitingCustomer.customerID))
+            statistics['Revenue'] -= TRIP_COST
+            if trace is not None:
+                trace.record(currentTime, tracing.REFUND,
+                             waitingCustomer.customerID, stationID)
         # Schedule RideEnd for the waiting customer.
-        simEngine.schedule(engine.DiscreteEvent(
-            RideEnd, currentTime,
-            customer=waitingCustomer, globalData=globalData))
+        simEngine.scheduleAt(
+            currentTime, RideEnd, (globalData, waitingCustomer))
 
 
-def RideEnd(simEngine, **kwargs):
-    """Customer finishes the bike ride."""
+@engine.eventHandler('globalData', 'customer')
+def RideEnd(simEngine, payload=None, **kwargs):
+    """Customer finishes the bike ride.
 
-    globalData = kwargs['globalData']
-    customer = kwargs['customer']
+    The payload is a (globalData, customer) tuple. The same values can also
+    be given as keyword arguments.
+    """
+    if payload is None:
+        payload = (kwargs['globalData'], kwargs['customer'])
+    globalData, customer = payload
     stationID = customer.endID
-    currentTime = simEngine.currentTime()
+    currentTime = simEngine.simTime
+    stations = globalData['stations']
+    numRacks = stations.numRacks
+    statistics = globalData['statistics']
+    trace = globalData['trace']
 
     # Check if there are empty racks to keep the bike.
-    if globalData['stations'][stationID].numRacks <= 0:
+    if numRacks[stationID] <= 0:
         # No empty racks. The customer begins waiting in queue.
         customer.startDropoffWait = currentTime
-        globalData['dropoffQueues'][stationID].put(customer)
-        logging.debug(
-            '\t(customer %d) damn there are no empty racks at station %d at time %.3f' % (
-            customer.customerID, stationID, currentTime))
+        globalData['dropoffQueues'].queues[stationID].append(customer)
+        if trace is not None:
+            trace.record(currentTime, tracing.NO_RACK, customer.customerID,
+                         stationID)
         return
     # Update total Idle Time till current time
+    numBikes = stations.numBikes
     if currentTime < 1440:
-        globalData['statistics']['IdleTime'][stationID] += globalData['stations'][stationID].numBikes * (currentTime - globalData['stations'][stationID].lastEvent)
-        globalData['stations'][stationID].lastEvent = currentTime
+        lastEvent = stations.lastEvent
+        statistics['IdleTime'][stationID] += numBikes[stationID] * (
+            currentTime - lastEvent[stationID])
+        lastEvent[stationID] = currentTime
 
     # Customer returns the bike to the rack.
-    globalData['stations'][stationID].numRacks -= 1
-    globalData['stations'][stationID].numBikes += 1
-    logging.debug(
-        '\t(customer %d) perfecto! i reached my destination %d at time %.3f, my journey is complete' % (
-        customer.customerID, stationID, currentTime))
+    numRacks[stationID] -= 1
+    numBikes[stationID] += 1
+    if trace is not None:
+        trace.record(currentTime, tracing.RETURN, customer.customerID,
+                     stationID)
 
     # If there is at least one customer waiting for a bike and waittime < 5
     # mins, schedule arrival event. Note: not every customer waiting for a
     # bike eventually takes a bike..customers leave after 5 mins.
+    pickupQueue = globalData['pickupQueues'].queues[stationID]
     while(True):
         # Check if customers are waiting.
-        if len(globalData['pickupQueues'][stationID]) == 0:
+        if not pickupQueue:
             break
 
-        waitingCustomer = globalData['pickupQueues'][stationID].remove()
+        waitingCustomer = pickupQueue.popleft()
         waitTime = currentTime - waitingCustomer.startPickupWait
-        globalData['statistics']['TimeWaitForCycle'][stationID] += waitTime
+        statistics['TimeWaitForCycle'][stationID] += waitTime
         if waitTime < REFUND_TIME:
             # Next waiting customer gets a bike
-            simEngine.schedule(engine.DiscreteEvent(
-                Arrival, currentTime,
-                customer=waitingCustomer, stationID=stationID,
-                globalData=globalData))
-            logging.debug(
-                '\t(customer %d) finally i get my ride at stn %d after waiting for %.3f having arrived at %.3f' % (
-                waitingCustomer.customerID, stationID, waitTime, currentTime))
+            simEngine.scheduleAt(currentTime, Arrival,
+                (globalData, stationID, waitingCustomer))
+            if trace is not None:
+                trace.record(currentTime, tracing.PICKUP_AFTER_WAIT,
+                             waitingCustomer.customerID, stationID,
+                             value=waitTime)
             break
         else:
             # We lose a customer
-            globalData['statistics']['CustomersLost'][stationID] += 1
-            logging.debug(
-                '\t(customer %d) @#$%%! u wasted my time! i waited for %.3f minutes for a bike at stn %d, i dont want it anymore' % (
-                waitingCustomer.customerID, waitTime, stationID))
+            statistics['CustomersLost'][stationID] += 1
+            if trace is not None:
+                trace.record(currentTime, tracing.CUSTOMER_LOST,
+                             waitingCustomer.customerID, stationID,
+                             value=waitTime)
 
 
-def RideCrash(simEngine, **kwargs):
-    """Bike is lost or damaged due to an accident."""
-    globalData = kwargs['globalData']
-    customer = kwargs['customer']
+@engine.eventHandler('globalData', 'customer')
+def RideCrash(simEngine, payload=None, **kwargs):
+    """Bike is lost or damaged due to an accident.
+
+    The payload is a (globalData, customer) tuple. The same values can also
+    be given as keyword arguments.
+    """
+    if payload is None:
+        payload = (kwargs['globalData'], kwargs['customer'])
+    globalData, customer = payload
 
     # The bicycle is not returned to the station.
     globalData['statistics']['BikesLost'] += 1
-    logging.debug(
-            '\t(customer %d) oops! the bike was lost or damaged and I never reached stn %d' % (
-            customer.customerID, customer.endID))
+    trace = globalData['trace']
+    if trace is not None:
+        trace.record(simEngine.simTime, tracing.BIKE_LOST,
+                     customer.customerID, customer.endID)
 
 
 ###########################
@@ -288,25 +697,71 @@ class BikeSharingSimulation(object):
     """Initializes and runs the bike sharing simulation."""
 
     def computeArrivalTimes(self, tripCountData):
-        """Computes simulation arrival times based on the trip count data."""
-        totalArrivalEvents = 0
-        arrivalTimes = []
-        numTimeframes = tripCountData.shape[1]
+        """Computes simulation arrival times based on the trip count data.
+
+        Arrivals are spaced evenly within each timeframe.
+
+        Args:
+            tripCountData: Integer array where entry [i][j] is the number of
+                arrivals at station i in timeframe j.
+
+        Returns:
+            ArrivalSchedule of all stations.
+        """
+        tripCountData = np.asarray(tripCountData, dtype=np.int64)
+        numStations, numTimeframes = tripCountData.shape
+        timeframeLength = float(DAY_DURATION) / numTimeframes
+        counts = tripCountData.ravel()
+        totalArrivalEvents = counts.sum()
+
+        # For every arrival, find its timeframe and its index j within the
+        # timeframe; arrival j happens at firstArrival + j * interArrivalTime.
+        binIDs = np.repeat(np.arange(len(counts)), counts)
+        binStarts = np.cumsum(counts) - counts
+        j = np.arange(totalArrivalEvents) - binStarts[binIDs]
+        firstArrival = (binIDs % numTimeframes) * timeframeLength
+        interArrivalTime = timeframeLength / counts[binIDs].astype(float)
+        times = firstArrival + j * interArrivalTime
+
+        offsets = np.zeros(numStations + 1, dtype=np.int64)
+        np.cumsum(tripCountData.sum(axis=1), out=offsets[1:])
+        logging.info('Total Arrival events: %d' % totalArrivalEvents)
+        return ArrivalSchedule(times, offsets)
+
+    def computePoissonArrivalTimes(self, arrivalRates, source=np.random):
+        """Draws arrival times of a non-homogeneous Poisson process.
+
+        The number of arrivals at station i in timeframe j is Poisson with
+        mean arrivalRates[i][j], and the arrivals are uniformly distributed
+        within the timeframe. All stations are drawn at once from source.
+
+        Args:
+            arrivalRates: Array where entry [i][j] is the expected number of
+                arrivals at station i in timeframe j.
+            source: Generator with poisson(lam) and random(size) methods,
+                such as np.random or a np.random.Generator.
+
+        Returns:
+            ArrivalSchedule of all stations.
+        """
+        arrivalRates = np.asarray(arrivalRates, dtype=float)
+        numStations, numTimeframes = arrivalRates.shape
         timeframeLength = float(DAY_DURATION) / numTimeframes
-        for stationID, arrivals in enumerate(tripCountData):
-            arrivalTimes.append([])
-            for i, numPeople in enumerate(arrivals):
-                # Schedule events only if people arrived in this timeframe.
-                totalArrivalEvents += numPeople
-                if numPeople == 0:
-                    continue
-                firstArrival = i * timeframeLength
-                interArrivalTime = timeframeLength / float(numPeople)
-                for j in range(numPeople):
-                    t = firstArrival + j * interArrivalTime
-                    arrivalTimes[stationID].append(t)
+        counts = source.poisson(arrivalRates).ravel()
+        totalArrivalEvents = counts.sum()
+
+        # Offsetting uniform variates by their timeframe index sorts the
+        # arrivals within every timeframe in a single sort of all arrivals.
+        binIDs = np.repeat(np.arange(len(counts)), counts)
+        keys = binIDs + source.random(totalArrivalEvents)
+        keys.sort()
+        times = ((binIDs % numTimeframes) + (keys - binIDs)) * timeframeLength
+
+        offsets = np.zeros(numStations + 1, dtype=np.int64)
+        np.cumsum(counts.reshape(numStations, numTimeframes).sum(axis=1),
+                  out=offsets[1:])
         logging.info('Total Arrival events: %d' % totalArrivalEvents)
-        return arrivalTimes
+        return ArrivalSchedule(times, offsets)
 
     def almostUniformWithTotalSum(self, d, totalSum):
         """Computes uniform or almost-uniform distribution.
@@ -332,7 +787,11 @@ class BikeSharingSimulation(object):
 
     def run(self, initialDistribution=None,
             totalNumBikes=NUM_BIKES, racksPerStation=RACKS, scaleArrivalRate=1,
-            rngSeed=None, tripDataDir=None):
+            rngSeed=None, tripDataDir=None, sparseDestinations=False,
+            samplingMethod=sampling.ALIAS, randomMode=randomness.BATCHED,
+            mergedArrivals=True, felBackend=fel.HEAP, instrument=False,
+            trace=None, antithetic=False, telemetry=None,
+            arrivalMode=DETERMINISTIC_ARRIVALS):
         """Runs the store checkout simulation until it completes.
 
         Args:
@@ -342,11 +801,75 @@ class BikeSharingSimulation(object):
             racksPerStation: Number of bike racks per station.
             scaleArrivalRate: Scale factor for number of arrivals that occur
                 during the simulation.
+            rngSeed: Seed for the random number generator, either an integer
+                or a np.random.SeedSequence.
+            tripDataDir: Directory containing the trip statistics.
+            sparseDestinations: If True, destination probabilities are
+                loaded in the compact sparse format.
+            samplingMethod: Method used to select trip destinations, either
+                sampling.ALIAS (constant time per trip) or sampling.CHOICE
+                (inverse CDF computed per trip, as np.random.choice).
+            randomMode: How uniform variates are drawn, either
+                randomness.BATCHED (pre-drawn in blocks) or
+                randomness.SCALAR (one NumPy call per variate). Both modes
+                give identical results for the same rngSeed. In
+                randomness.COMMON mode, every customer in the arrival
+                schedule gets fixed variates, so runs of different
+                scenarios with the same rngSeed use common random numbers.
+            mergedArrivals: If True, all customer arrivals are merged into
+                one presorted stream instead of keeping a pending Arrival
+                event per station in the FEL. Results are identical.
+            felBackend: FEL backend of the simulation engine (fel.HEAP,
+                fel.CALENDAR or fel.BUCKET). Results are identical.
+            instrument: If True, the engine collects per-handler counts and
+                timings, the FEL high-water mark and event throughput per
+                hour of simulation time. The statistics are logged and
+                available from self.simEngine.instrumentation.report().
+            trace: tracing.TraceRecorder that records the customer events.
+                If unspecified and debug logging is enabled, the events are
+                logged as debug messages.
+            antithetic: If True, randomness.COMMON mode uses the antithetic
+                variates of rngSeed.
+            telemetry: telemetry.TelemetryRecorder that samples the state
+                of all stations during the day.
+            arrivalMode: How customer arrivals are generated from the trip
+                counts, either DETERMINISTIC_ARRIVALS (the scaled counts,
+                rounded and spaced evenly within every timeframe) or
+                POISSON_ARRIVALS (a non-homogeneous Poisson process with
+                the scaled counts as timeframe rates, drawn per run).
 
         Returns:
             Dictionary of simulation results.
         """
         simStartTime = time.time()
+        simEngine, globalData = self._initialize(
+            initialDistribution=initialDistribution,
+            totalNumBikes=totalNumBikes, racksPerStation=racksPerStation,
+            scaleArrivalRate=scaleArrivalRate, rngSeed=rngSeed,
+            tripDataDir=tripDataDir, sparseDestinations=sparseDestinations,
+            samplingMethod=samplingMethod, randomMode=randomMode,
+            mergedArrivals=mergedArrivals, felBackend=felBackend,
+            instrument=instrument, trace=trace, antithetic=antithetic,
+            telemetry=telemetry, arrivalMode=arrivalMode)
+        # Run the simulation.
+        simEngine.runSimulation()
+        return self._finish(simEngine, globalData, simStartTime)
+
+    def _initialize(self, initialDistribution=None,
+            totalNumBikes=NUM_BIKES, racksPerStation=RACKS, scaleArrivalRate=1,
+            rngSeed=None, tripDataDir=None, sparseDestinations=False,
+            samplingMethod=sampling.ALIAS, randomMode=randomness.BATCHED,
+            mergedArrivals=True, felBackend=fel.HEAP, instrument=False,
+            trace=None, antithetic=False, telemetry=None,
+            arrivalMode=DETERMINISTIC_ARRIVALS):
+        """Creates the engine and global data of a run.
+
+        Takes the arguments of run and returns a (simEngine, globalData)
+        tuple, with the Initialize event scheduled.
+        """
+        if antithetic and randomMode != randomness.COMMON:
+            raise ValueError('antithetic variates require the %r random mode'
+                             % randomness.COMMON)
         logging.info('Citi Bike Sharing Simulation')
         logging.info('\ttotalNumBikes: %d' % totalNumBikes)
         logging.info('\tracksPerStation: %d' % racksPerStation)
@@ -354,25 +877,29 @@ class BikeSharingSimulation(object):
 
         # Seed RNG if specified.
         if rngSeed is not None:
-            logging.info('RNG seed: %d' % rngSeed)
-            np.random.seed(rngSeed)
-
-        # Load statistics derived from the Citi Bike trip dataset.
-        tripDataDir = {'tripDataDir': tripDataDir} if tripDataDir else {}
-        tripCountData, tripDurations, destinationP = (
-            load_trip_stats.loadTripStatistics(**tripDataDir))
-        numStations = tripCountData.shape[0]
-
-        # Compute arrival times based on trip count data for each station and
-        # the arrival rate scale factor.
-        tripCountData = np.rint(tripCountData * scaleArrivalRate).astype(int)
-        arrivalTimes = self.computeArrivalTimes(tripCountData)
+            if isinstance(rngSeed, np.random.SeedSequence):
+                logging.info('RNG seed: %d, spawn key %s'
+                             % (rngSeed.entropy, rngSeed.spawn_key))
+                np.random.seed(rngSeed.generate_state(RNG_STATE_WORDS))
+            else:
+                logging.info('RNG seed: %d' % rngSeed)
+                np.random.seed(rngSeed)
+
+        arrivalTimes, tripDurations, destinationP, destinationSampler = (
+            self._loadTripData(tripDataDir, scaleArrivalRate,
+                               sparseDestinations, samplingMethod,
+                               arrivalMode))
+        numStations = len(arrivalTimes)
 
         # Initial distribution of bikes to stations (set at time 00:00).
         if initialDistribution is None:
             initialDistribution = self.almostUniformWithTotalSum(
                 numStations, totalNumBikes)
-        assert len(initialDistribution) == len(tripCountData)
+        assert len(initialDistribution) == numStations
+
+        # Customer events are only formatted as log messages in debug mode.
+        if trace is None and logging.getLogger().isEnabledFor(logging.DEBUG):
+            trace = tracing.LoggingTrace()
 
         # Initialize simulation statistics.
         statistics = {
@@ -387,21 +914,31 @@ class BikeSharingSimulation(object):
         # Global simulation variables.
         globalData = {
             # Entities.
-            'stations': [],
-            'pickupQueues': [],
-            'dropoffQueues': [],
+            'stations': StationTable(),
+            'pickupQueues': QueueTable(),
+            'dropoffQueues': QueueTable(),
             # Citi bike dataset statistics.
             'arrivalTimes': arrivalTimes,
+            'mergedArrivals': mergedArrivals,
             'tripDurations': tripDurations,
             'destinationP': destinationP,
+            'destinationSampler': destinationSampler,
+            # Uniform random numbers for trip outcomes.
+            'random': randomness.makeRandomStream(
+                randomMode, numCustomers=arrivalTimes.numArrivals(),
+                antithetic=antithetic),
             # Simulation statistics.
             'statistics': statistics,
+            # Trace of customer events, or None.
+            'trace': trace,
             # Constants.
             'bikeLossProb': BIKE_LOSS_PROBABILITY,
         }
 
         # Initialize the simulation engine.
-        simEngine = engine.DiscreteEventSimulationEngine()
+        simEngine = engine.DiscreteEventSimulationEngine(felBackend)
+        if instrument:
+            simEngine.enableInstrumentation(windowDuration=60)
 
         # Schedule initial event.
         initEvent = engine.DiscreteEvent(
@@ -409,9 +946,64 @@ class BikeSharingSimulation(object):
             initialDistribution=initialDistribution,
             racksPerStation=racksPerStation)
         simEngine.schedule(initEvent)
-        endEvent = engine.DiscreteEvent(endSim, 1440)
-        # Run the simulation.
-        simEngine.runSimulation()
+        simEngine.addFinalizer(DAY_DURATION, endSim, globalData)
+        if telemetry is not None:
+            telemetry.start(simEngine, globalData['stations'],
+                            globalData['pickupQueues'],
+                            globalData['dropoffQueues'], DAY_DURATION)
+        self.simEngine = simEngine
+        return simEngine, globalData
+
+    def _loadTripData(self, tripDataDir, scaleArrivalRate,
+                      sparseDestinations, samplingMethod,
+                      arrivalMode=DETERMINISTIC_ARRIVALS,
+                      arrivalSource=np.random):
+        """Loads the trip data used by the event handlers.
+
+        Poisson arrivals are drawn from arrivalSource on every call, while
+        deterministic arrival schedules are cached.
+
+        Returns:
+            Tuple of (arrivalTimes, tripDurations, destinationP,
+            destinationSampler), where arrivalTimes is a new ArrivalSchedule
+            and the other values are shared for the lifetime of the process.
+        """
+        # Load statistics derived from the Citi Bike trip dataset. The
+        # statistics are cached for the lifetime of the process.
+        tripDataDir = tripDataDir or load_trip_stats.TRIP_DATA_DIR
+        tripCountData, tripDurations, destinationP = (
+            load_trip_stats.loadTripStatistics(
+                tripDataDir, sparse=sparseDestinations))
+
+        # Compute arrival times based on trip count data for each station and
+        # the arrival rate scale factor.
+        if arrivalMode == POISSON_ARRIVALS:
+            arrivalTimes = self.computePoissonArrivalTimes(
+                tripCountData * float(scaleArrivalRate), arrivalSource)
+        elif arrivalMode == DETERMINISTIC_ARRIVALS:
+            tripCountData = np.rint(
+                tripCountData * scaleArrivalRate).astype(int)
+            arrivalTimes = load_trip_stats.getDerivedArtifact(
+                tripDataDir, 'arrivalTimes', scaleArrivalRate,
+                lambda: self.computeArrivalTimes(tripCountData))
+        else:
+            raise ValueError('unknown arrival mode %r' % arrivalMode)
+
+        # Destination sampling tables are built once per process.
+        destinationSampler = load_trip_stats.getDerivedArtifact(
+            tripDataDir, 'destinationSampler',
+            (samplingMethod, sparseDestinations),
+            lambda: sampling.makeSampler(destinationP, samplingMethod))
+        # Arrival events advance the cursors, so each run gets its own copy.
+        return (arrivalTimes.copy(), tripDurations, destinationP,
+                destinationSampler)
+
+    def _finish(self, simEngine, globalData, simStartTime):
+        """Reports and returns the statistics of a completed run."""
+        statistics = globalData['statistics']
+        trace = globalData['trace']
+        if trace is not None:
+            trace.flush()
         simDuration = time.time() - simStartTime
         logging.info('Simulation complete. Took %.3f seconds.\n' % simDuration)
 
@@ -427,8 +1019,383 @@ class BikeSharingSimulation(object):
         logging.info('BikesLost: %d' % statistics['BikesLost'])
         logging.info('TotalIdleTime: %d' % statistics['IdleTime'].sum())
 
+        if simEngine.instrumentation is not None:
+            report = simEngine.instrumentation.report()
+            logging.info('Events: %d in %.3f seconds, FEL high-water mark: %d'
+                % (report['numEvents'], report['wallTime'],
+                   report['felHighWaterMark']))
+            for name, handlerStats in sorted(report['handlers'].items()):
+                logging.info(
+                    '\t%s: %d events (%.1f%%), %.3f seconds, %.2f us/event'
+                    % (name, handlerStats['count'],
+                       100 * handlerStats['fraction'], handlerStats['time'],
+                       1e6 * handlerStats['meanTime']))
+
         return statistics
 
+    def snapshot(self, snapshotTime, **runKwargs):
+        """Runs the simulation until snapshotTime and takes a snapshot.
+
+        Forks of the snapshot resume the simulation from snapshotTime (see
+        resume), so scenarios that only differ after snapshotTime do not
+        re-simulate the shared part of the day.
+
+        Args:
+            snapshotTime: Simulation time of the snapshot. Events at
+                snapshotTime are processed before the snapshot is taken.
+            runKwargs: Arguments of run.
+
+        Returns:
+            engine.Snapshot of the engine and of a dictionary with the
+            global data (globalData), the state of the np.random generator
+            (rngState) and the next customer ID (customerID). The trip
+            statistics and destination sampler are shared by all forks and
+            are not saved with the snapshot. A trace recorder is copied
+            into every fork, so forks should not write traces to the same
+            directory.
+        """
+        simEngine, globalData = self._initialize(**runKwargs)
+        simEngine.runUntil(snapshotTime)
+        state = {
+            'globalData': globalData,
+            'rngState': np.random.get_state(),
+            'customerID': Customer.currentCustomerID,
+        }
+        metadata = {
+            'tripDataDir': (runKwargs.get('tripDataDir')
+                            or load_trip_stats.TRIP_DATA_DIR),
+            'sparseDestinations': runKwargs.get('sparseDestinations', False),
+            'samplingMethod': runKwargs.get('samplingMethod', sampling.ALIAS),
+        }
+        return engine.Snapshot(simEngine, state, shared=[
+            globalData['tripDurations'], globalData['destinationP'],
+            globalData['destinationSampler']], metadata=metadata)
+
+    @staticmethod
+    def loadSnapshot(filename):
+        """Loads a snapshot saved with engine.Snapshot.save.
+
+        The trip statistics and destination sampler are loaded from the
+        trip data directory of the snapshot.
+
+        Args:
+            filename: Path of the snapshot file.
+
+        Returns:
+            engine.Snapshot instance.
+        """
+        def sharedData(metadata):
+            tripDataDir = metadata['tripDataDir']
+            sparseDestinations = metadata['sparseDestinations']
+            samplingMethod = metadata['samplingMethod']
+            _, tripDurations, destinationP = (
+                load_trip_stats.loadTripStatistics(
+                    tripDataDir, sparse=sparseDestinations))
+            destinationSampler = load_trip_stats.getDerivedArtifact(
+                tripDataDir, 'destinationSampler',
+                (samplingMethod, sparseDestinations),
+                lambda: sampling.makeSampler(destinationP, samplingMethod))
+            return [tripDurations, destinationP, destinationSampler]
+        return engine.Snapshot.load(filename, sharedData)
+
+    def resume(self, snapshot, intervention=None):
+        """Resumes a fork of a snapshot until the simulation completes.
+
+        Args:
+            snapshot: engine.Snapshot returned by snapshot or loadSnapshot.
+            intervention: Function called as
+                intervention(simEngine, globalData) on the fork before it
+                resumes, e.g. to move bikes between stations or to change
+                globalData['bikeLossProb'].
+
+        Returns:
+            Dictionary of simulation results, as returned by run.
+        """
+        simStartTime = time.time()
+        simEngine, state = snapshot.fork()
+        np.random.set_state(state['rngState'])
+        Customer.currentCustomerID = state['customerID']
+        globalData = state['globalData']
+        if intervention is not None:
+            intervention(simEngine, globalData)
+        self.simEngine = simEngine
+        simEngine.runSimulation()
+        return self._finish(simEngine, globalData, simStartTime)
+
+    def runDays(self, numDays, initialDistribution=None,
+                totalNumBikes=NUM_BIKES, racksPerStation=RACKS,
+                scaleArrivalRate=1, rngSeed=None, tripDataDir=None,
+                dayTripDataDirs=None, sparseDestinations=False,
+                samplingMethod=sampling.ALIAS, randomMode=randomness.BATCHED,
+                mergedArrivals=True, felBackend=fel.HEAP, trace=None,
+                arrivalMode=DETERMINISTIC_ARRIVALS):
+        """Simulates consecutive days, carrying the state over midnight.
+
+        The first day starts from the initial distribution, and every
+        following day from the inventory at the end of the previous day.
+        Rides in progress and customers waiting at midnight carry over to
+        the next day. Statistics are reported per day: a ride or wait is
+        counted on the day it ends.
+
+        The per-day objects (arrival schedule, statistics and customers) are
+        recycled or released every day, so memory use does not grow with
+        the number of days. A trace recorder without a directory is a ring
+        buffer of fixed capacity, so the records of earlier days are
+        overwritten once it is full. Trace times restart at zero every day.
+
+        With Poisson arrivals, the arrivals of the first day are drawn as in
+        run, and those of every later day from a generator of its own,
+        seeded from rngSeed. The arrivals therefore do not depend on how
+        many uniform variates the random mode has drawn in advance, and
+        the random modes give identical results, as in run.
+
+        Args:
+            numDays: Number of days to simulate.
+            dayTripDataDirs: Sequence of trip data directories used in turn,
+                one per day, e.g. seven directories of day-of-week
+                statistics starting with the weekday of the first day. All
+                directories must have the same stations. If unspecified,
+                every day uses tripDataDir.
+            Other arguments are as for run. On the first day,
+            dayTripDataDirs[0] replaces tripDataDir.
+
+        Yields:
+            Tuple of (statistics, inventory) at the end of each day, where
+            statistics is the dictionary of the day's statistics (as
+            returned by run) and inventory is an integer array of the number
+            of bikes at each station. Both are overwritten by the next day,
+            so they must be copied to be kept.
+        """
+        dayTripDataDirs = list(dayTripDataDirs or [tripDataDir])
+        simEngine, globalData = self._initialize(
+            initialDistribution=initialDistribution,
+            totalNumBikes=totalNumBikes, racksPerStation=racksPerStation,
+            scaleArrivalRate=scaleArrivalRate, rngSeed=rngSeed,
+            tripDataDir=dayTripDataDirs[0],
+            sparseDestinations=sparseDestinations,
+            samplingMethod=samplingMethod, randomMode=randomMode,
+            mergedArrivals=mergedArrivals, felBackend=felBackend,
+            trace=trace, arrivalMode=arrivalMode)
+        statistics = globalData['statistics']
+        inventory = np.zeros(len(globalData['arrivalTimes']), dtype=int)
+        arrivalSeeds = _poissonSeedSequence(rngSeed).spawn(numDays)
+        for day in range(numDays):
+            if day > 0:
+                self._startNextDay(
+                    simEngine, globalData,
+                    dayTripDataDirs[day % len(dayTripDataDirs)],
+                    scaleArrivalRate, sparseDestinations, samplingMethod,
+                    randomMode, arrivalMode,
+                    np.random.default_rng(arrivalSeeds[day]))
+            dayStartTime = time.time()
+            simEngine.runUntil(DAY_DURATION)
+            inventory[:] = globalData['stations'].arrays()['numBikes']
+            logging.info('Day %d complete. Took %.3f seconds. Revenue: %.2f'
+                         % (day, time.time() - dayStartTime,
+                            statistics['Revenue']))
+            yield statistics, inventory
+        if globalData['trace'] is not None:
+            globalData['trace'].flush()
+
+    def _startNextDay(self, simEngine, globalData, tripDataDir,
+                      scaleArrivalRate, sparseDestinations, samplingMethod,
+                      randomMode, arrivalMode=DETERMINISTIC_ARRIVALS,
+                      arrivalSource=np.random):
+        """Moves a run paused at the end of a day to the start of the next.
+
+        Times are shifted back by a day, so that the event handlers see
+        every day as starting at time zero. Poisson arrivals of the day are
+        drawn from arrivalSource.
+        """
+        simEngine.shiftTime(DAY_DURATION)
+        globalData['stations'].arrays()['lastEvent'].fill(0)
+        for queue in globalData['dropoffQueues'].queues:
+            for customer in queue:
+                customer.startDropoffWait -= DAY_DURATION
+        waitingCustomers = []
+        for queue in globalData['pickupQueues'].queues:
+            for customer in queue:
+                customer.startPickupWait -= DAY_DURATION
+                waitingCustomers.append(customer)
+
+        # Reset the statistics in place.
+        statistics = globalData['statistics']
+        for name, value in statistics.items():
+            if isinstance(value, np.ndarray):
+                value.fill(0)
+            else:
+                statistics[name] = 0
+
+        arrivalTimes, tripDurations, destinationP, destinationSampler = (
+            self._loadTripData(tripDataDir, scaleArrivalRate,
+                               sparseDestinations, samplingMethod,
+                               arrivalMode, arrivalSource))
+        if len(arrivalTimes) != len(globalData['stations']):
+            raise ValueError('trip data in %s has %d stations, expected %d'
+                             % (tripDataDir, len(arrivalTimes),
+                                len(globalData['stations'])))
+        globalData['arrivalTimes'] = arrivalTimes
+        globalData['tripDurations'] = tripDurations
+        globalData['destinationP'] = destinationP
+        globalData['destinationSampler'] = destinationSampler
+        if randomMode == randomness.COMMON:
+            # Customers still waiting for a bike get the indices after the
+            # day's arrivals.
+            numArrivals = arrivalTimes.numArrivals()
+            for i, customer in enumerate(waitingCustomers):
+                customer.arrivalIndex = numArrivals + i
+            globalData['random'] = randomness.makeRandomStream(
+                randomMode, numCustomers=numArrivals + len(waitingCustomers))
+        _scheduleArrivals(simEngine, globalData)
+        simEngine.addFinalizer(DAY_DURATION, endSim, globalData)
+
+    def runReplications(self, numReplications, workers=None, baseSeed=None,
+                        confidenceLevel=0.95, antithetic=False,
+                        targetHalfWidth=None, metric='Revenue',
+                        minReplications=10, **runKwargs):
+        """Runs independent replications of the simulation in parallel.
+
+        Replications are distributed over a pool of worker processes. Each
+        worker loads the trip statistics once as read-only memory-mapped
+        arrays, so the data is shared through the page cache rather than
+        pickled. Replication i is seeded with the i-th child of
+        np.random.SeedSequence(baseSeed), so results do not depend on the
+        number of workers.
+
+        With antithetic variates, replications are run in pairs that share a
+        seed, the second using the antithetic variates of the first, and
+        every pair counts as one observation of its mean.
+
+        If targetHalfWidth is given, replications are run in batches of one
+        per worker until the confidence interval half-width of metric is at
+        most targetHalfWidth, and numReplications is the budget. The first n
+        replications are the same as those of a fixed run of n replications
+        with the same base seed.
+
+        Args:
+            numReplications: Number of replications, or the maximum number
+                of replications with a targetHalfWidth.
+            workers: Number of worker processes. Defaults to the number of
+                CPUs. With one worker, replications run in this process.
+            baseSeed: Entropy of the root SeedSequence. If unspecified,
+                fresh entropy is drawn.
+            confidenceLevel: Confidence level of the reported intervals.
+            antithetic: If True, replications are run in antithetic pairs
+                in randomness.COMMON mode. numReplications must be even.
+            targetHalfWidth: Half-width of the confidence interval of metric
+                at which replications stop.
+            metric: Name of the statistic checked against targetHalfWidth,
+                one of STATISTICS. Per-station statistics are checked by
+                their total over all stations.
+            minReplications: Number of observations before the half-width is
+                first checked, since the half-width estimated from very few
+                observations is unreliable.
+            runKwargs: Arguments passed to run, except rngSeed and
+                antithetic.
+
+        Returns:
+            Dictionary from statistic name to a dictionary with the keys n,
+            mean, std, halfWidth, low, high and samples (see
+            confidence.summarizeReplications). n is the number of
+            observations used.
+        """
+        if metric not in STATISTICS:
+            raise ValueError('unknown statistic %r' % metric)
+        if antithetic:
+            if numReplications % 2:
+                raise ValueError('antithetic replications come in pairs')
+            runKwargs['randomMode'] = randomness.COMMON
+        seedSequence = np.random.SeedSequence(baseSeed)
+        # Extract the data once before the workers map it.
+        load_trip_stats.loadTripStatistics(
+            runKwargs.get('tripDataDir') or load_trip_stats.TRIP_DATA_DIR,
+            sparse=runKwargs.get('sparseDestinations', False))
+
+        workers = min(workers or os.cpu_count() or 1, numReplications)
+        batchSize = numReplications
+        if targetHalfWidth is not None:
+            batchSize = workers + (workers % 2 if antithetic else 0)
+        logging.info('Running %d replications on %d workers.'
+                     % (numReplications, workers))
+        executor = None
+        if workers <= 1:
+            _initReplicationWorker(runKwargs)
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=_initReplicationWorker,
+                initargs=(runKwargs,))
+        results = []
+        try:
+            while len(results) < numReplications:
+                n = min(batchSize, numReplications - len(results))
+                if antithetic:
+                    seeds = [seed for seed in seedSequence.spawn(n // 2)
+                             for _ in range(2)]
+                    antitheticFlags = [False, True] * (n // 2)
+                else:
+                    seeds = seedSequence.spawn(n)
+                    antitheticFlags = [False] * n
+                mapReplications = executor.map if executor else map
+                results.extend(mapReplications(
+                    _runReplication, seeds, antitheticFlags))
+                summary = confidence.summarizeReplications(
+                    _pairMeans(results) if antithetic else results,
+                    confidenceLevel)
+                if targetHalfWidth is not None:
+                    interval = summary[metric]
+                    if (interval['n'] >= minReplications
+                            and interval['halfWidth'] <= targetHalfWidth):
+                        break
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        if targetHalfWidth is not None:
+            logging.info('%s half-width %.3f after %d replications.'
+                         % (metric, summary[metric]['halfWidth'],
+                            len(results)))
+        return summary
+
+
+def _poissonSeedSequence(rngSeed):
+    """Returns the SeedSequence of the Poisson arrivals of runDays.
+
+    The sequence is derived from rngSeed, an integer, a
+    np.random.SeedSequence or None for fresh entropy, by appending
+    POISSON_SPAWN_KEY to its spawn key, so it does not modify rngSeed.
+    """
+    if isinstance(rngSeed, np.random.SeedSequence):
+        return np.random.SeedSequence(
+            rngSeed.entropy,
+            spawn_key=tuple(rngSeed.spawn_key) + (POISSON_SPAWN_KEY,))
+    return np.random.SeedSequence(rngSeed, spawn_key=(POISSON_SPAWN_KEY,))
+
+
+def _pairMeans(results):
+    """Averages the statistics of consecutive pairs of replications."""
+    return [dict((name, (first[name] + second[name]) / 2.0)
+                 for name in first)
+            for first, second in zip(results[::2], results[1::2])]
+
+
+# Run arguments of the replications run by this process.
+_replicationRunKwargs = None
+
+
+def _initReplicationWorker(runKwargs):
+    """Prepares a process to run replications with the given arguments."""
+    global _replicationRunKwargs
+    _replicationRunKwargs = runKwargs
+    # Map the trip statistics once per worker.
+    load_trip_stats.loadTripStatistics(
+        runKwargs.get('tripDataDir') or load_trip_stats.TRIP_DATA_DIR,
+        sparse=runKwargs.get('sparseDestinations', False))
+
+
+def _runReplication(rngSeed, antithetic=False):
+    """Runs one replication and returns its statistics."""
+    return BikeSharingSimulation().run(
+        rngSeed=rngSeed, antithetic=antithetic, **_replicationRunKwargs)
+
 
 def main():
     """Parses command-lines args and runs the simulation."""
@@ -445,6 +1412,55 @@ def main():
         action='store', default=RACKS, help='Number of racks per station.')
     parser.add_argument('--scaleArrivalRate', dest='scaleArrivalRate',
         action='store', default=1, help='Scale factor for arrival rate.')
+    parser.add_argument('--arrivalMode', dest='arrivalMode', action='store',
+        default=DETERMINISTIC_ARRIVALS,
+        help='Customer arrival mode (deterministic or poisson).')
+    parser.add_argument('--sparseDestinations', dest='sparseDestinations',
+        action='store_true', help='Use sparse destination probabilities.')
+    parser.add_argument('--samplingMethod', dest='samplingMethod',
+        action='store', default=sampling.ALIAS,
+        help='Destination sampling method (alias or choice).')
+    parser.add_argument('--randomMode', dest='randomMode', action='store',
+        default=randomness.BATCHED,
+        help='Random number stream mode (batched, scalar or common).')
+    parser.add_argument('--felBackend', dest='felBackend', action='store',
+        default=fel.HEAP, help='FEL backend (heap, calendar or bucket).')
+    parser.add_argument('--instrument', dest='instrument',
+        action='store_true', help='Log engine instrumentation statistics.')
+    parser.add_argument('--traceDir', dest='traceDir', action='store',
+        default=None, help='Directory in which a binary trace is saved.')
+    parser.add_argument('--telemetryFile', dest='telemetryFile',
+        action='store', default=None,
+        help='Compressed .npz file in which station time series are saved.')
+    parser.add_argument('--telemetryInterval', dest='telemetryInterval',
+        action='store', default=telemetry.DEFAULT_INTERVAL,
+        help='Simulation minutes between station time series samples.')
+    parser.add_argument('--tripDataDir', dest='tripDataDir', action='store',
+        default=load_trip_stats.TRIP_DATA_DIR,
+        help='Directory of the trip statistics.')
+    # Multi-day parameters.
+    parser.add_argument('--numDays', dest='numDays', action='store',
+        default=1, help='Number of consecutive days to simulate.')
+    parser.add_argument('--dayTripDataDirs', dest='dayTripDataDirs',
+        action='store', default=None,
+        help='Comma-separated trip data directories used in turn per day.')
+    # Replication parameters.
+    parser.add_argument('--replications', dest='replications',
+        action='store', default=1, help='Number of replications.')
+    parser.add_argument('--workers', dest='workers', action='store',
+        default=None, help='Number of worker processes for replications.')
+    parser.add_argument('--baseSeed', dest='baseSeed', action='store',
+        default=None, help='Seed of the replication random streams.')
+    parser.add_argument('--antithetic', dest='antithetic',
+        action='store_true',
+        help='Run replications in antithetic pairs of common random numbers.')
+    parser.add_argument('--targetHalfWidth', dest='targetHalfWidth',
+        action='store', default=None,
+        help='Stop replications once the 95%% CI half-width of --metric is '
+             'at most this value; --replications is then the budget.')
+    parser.add_argument('--metric', dest='metric', action='store',
+        default='Revenue', choices=STATISTICS,
+        help='Statistic checked against --targetHalfWidth.')
 
     args = parser.parse_args()
 
@@ -452,11 +1468,78 @@ def main():
     logging.basicConfig(
         filename=args.logfile, level=getattr(logging, args.loglevel.upper()))
 
-    # Run the simulation.
-    BikeSharingSimulation().run(
+    runKwargs = dict(
         totalNumBikes=int(args.totalNumBikes),
         racksPerStation=int(args.racksPerStation),
-        scaleArrivalRate=float(args.scaleArrivalRate))
+        scaleArrivalRate=float(args.scaleArrivalRate),
+        tripDataDir=args.tripDataDir,
+        sparseDestinations=args.sparseDestinations,
+        samplingMethod=args.samplingMethod,
+        randomMode=args.randomMode,
+        felBackend=args.felBackend,
+        arrivalMode=args.arrivalMode)
+
+    numDays = int(args.numDays)
+    numReplications = int(args.replications)
+    if args.targetHalfWidth is not None and numReplications <= 1:
+        parser.error('--targetHalfWidth requires a budget of --replications')
+    if args.telemetryFile and (numDays > 1 or numReplications > 1):
+        parser.error('--telemetryFile requires a single run of one day')
+    if numDays > 1:
+        for option, isSet in (
+                ('--replications', numReplications > 1),
+                ('--targetHalfWidth', args.targetHalfWidth is not None),
+                ('--instrument', args.instrument)):
+            if isSet:
+                parser.error('%s cannot be used with --numDays' % option)
+        # Simulate consecutive days and report the statistics of each day.
+        days = BikeSharingSimulation().runDays(
+            numDays, rngSeed=int(args.baseSeed) if args.baseSeed else None,
+            dayTripDataDirs=(args.dayTripDataDirs.split(',')
+                             if args.dayTripDataDirs else None),
+            trace=(tracing.TraceRecorder(directory=args.traceDir)
+                   if args.traceDir else None),
+            **runKwargs)
+        print('%4s %12s %14s %10s %12s' % (
+            'day', 'Revenue', 'CustomersLost', 'BikesLost', 'BikesDocked'))
+        for day, (statistics, inventory) in enumerate(days):
+            print('%4d %12.2f %14d %10d %12d' % (
+                day, statistics['Revenue'],
+                statistics['CustomersLost'].sum(), statistics['BikesLost'],
+                inventory.sum()))
+        return
+
+    if numReplications > 1:
+        # Run independent replications and report confidence intervals.
+        summary = BikeSharingSimulation().runReplications(
+            numReplications,
+            workers=int(args.workers) if args.workers else None,
+            baseSeed=int(args.baseSeed) if args.baseSeed else None,
+            antithetic=args.antithetic,
+            targetHalfWidth=(float(args.targetHalfWidth)
+                             if args.targetHalfWidth else None),
+            metric=args.metric, **runKwargs)
+        numRuns = summary[args.metric]['n'] * (2 if args.antithetic else 1)
+        print('%d replications' % numRuns)
+        print('%-20s %14s %14s %14s' % (
+            'statistic', 'mean', 'std', '95% CI +/-'))
+        for name, stats in sorted(summary.items()):
+            print('%-20s %14.3f %14.3f %14.3f' % (
+                name, stats['mean'], stats['std'], stats['halfWidth']))
+        return
+
+    # Run the simulation.
+    recorder = None
+    if args.telemetryFile:
+        recorder = telemetry.TelemetryRecorder(float(args.telemetryInterval))
+    BikeSharingSimulation().run(
+        rngSeed=int(args.baseSeed) if args.baseSeed else None,
+        instrument=args.instrument,
+        trace=(tracing.TraceRecorder(directory=args.traceDir)
+               if args.traceDir else None),
+        telemetry=recorder, **runKwargs)
+    if recorder is not None:
+        recorder.save(args.telemetryFile)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,354 @@
+"""Optimizes the initial distribution of bikes to stations.
+
+Implements the moveOneBike heuristics of the optimize_bikes notebooks. Every
+iteration moves one bike from a station that needs fewer bikes to a station
+that needs more, judged by the statistics of the current distribution:
+
+    waitTime: From the station with the longest dropoff wait time to the
+        station with the longest pickup wait time.
+    idleTime: From the station with the longest bike idle time to the
+        station with the smallest bike idle time.
+
+Instead of a single move, an iteration can evaluate a batch of candidate
+moves (pairs of highly ranked stations) in parallel and keep the one with
+the highest revenue. Progress is checkpointed so that a run can resume.
+
+Run from the project root directory:
+`python -m simcode.src.optimize --heuristic=waitTime --numIters=5000`
+"""
+
+# Standard libs.
+import argparse
+import concurrent.futures
+import logging
+import os
+import time
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+import simcode.src.nycbike as nycbike
+import simcode.src.randomness as randomness
+
+
+# Names of the heuristics.
+WAIT_TIME = 'waitTime'
+IDLE_TIME = 'idleTime'
+
+# Statistics kept for the current distribution.
+_STATISTICS = ('Revenue', 'TimeWaitForCycle', 'TimeWaitForDropoff',
+               'IdleTime')
+
+
+def rankStations(distribution, statistics, heuristic,
+                 racksPerStation=nycbike.RACKS):
+    """Ranks the stations that should give and receive a bike.
+
+    Args:
+        distribution: Current number of bikes per station.
+        statistics: Simulation statistics of the current distribution.
+        heuristic: WAIT_TIME or IDLE_TIME.
+        racksPerStation: Number of racks per station.
+
+    Returns:
+        Tuple of (donors, receivers) arrays of station IDs, best first.
+        Donors have at least one bike and receivers have an empty rack.
+    """
+    if heuristic == WAIT_TIME:
+        donorScores = -statistics['TimeWaitForDropoff']
+        receiverScores = -statistics['TimeWaitForCycle']
+    elif heuristic == IDLE_TIME:
+        donorScores = -statistics['IdleTime']
+        receiverScores = statistics['IdleTime']
+    else:
+        raise ValueError('unknown heuristic %r' % heuristic)
+    # A stable sort breaks ties by station ID, as np.argmax and np.argmin.
+    donors = np.flatnonzero(distribution >= 1)
+    donors = donors[np.argsort(donorScores[donors], kind='stable')]
+    receivers = np.flatnonzero(distribution < racksPerStation)
+    receivers = receivers[np.argsort(receiverScores[receivers], kind='stable')]
+    return donors, receivers
+
+
+def candidateMoves(donors, receivers, batchSize):
+    """Selects the candidate moves of an iteration.
+
+    Pairs of donor and receiver ranks are enumerated by increasing sum of
+    ranks, skipping pairs whose donor is also the receiver. The first
+    candidate is the move of the single-move heuristic, unless its top
+    donor and receiver are the same station: the notebooks then make a
+    no-op move, while the next best pair is taken here.
+
+    Args:
+        donors: Donor station IDs, best first.
+        receivers: Receiver station IDs, best first.
+        batchSize: Maximum number of candidates.
+
+    Returns:
+        List of (donor, receiver) station ID tuples.
+    """
+    moves = []
+    for rankSum in range(len(donors) + len(receivers) - 1):
+        for donorRank in range(max(0, rankSum - len(receivers) + 1),
+                               min(rankSum, len(donors) - 1) + 1):
+            donor = donors[donorRank]
+            receiver = receivers[rankSum - donorRank]
+            if donor != receiver:
+                moves.append((int(donor), int(receiver)))
+                if len(moves) == batchSize:
+                    return moves
+    return moves
+
+
+# Run arguments of the evaluations run by this process.
+_evaluationRunKwargs = None
+
+
+def _initEvaluationWorker(runKwargs):
+    """Prepares a process to evaluate distributions."""
+    global _evaluationRunKwargs
+    _evaluationRunKwargs = runKwargs
+    load_trip_stats.loadTripStatistics(
+        runKwargs.get('tripDataDir') or load_trip_stats.TRIP_DATA_DIR,
+        sparse=runKwargs.get('sparseDestinations', False))
+
+
+def _evaluate(distribution, rngSeed):
+    """Runs the simulation and returns the statistics used by the search."""
+    statistics = nycbike.BikeSharingSimulation().run(
+        initialDistribution=distribution, rngSeed=rngSeed,
+        **_evaluationRunKwargs)
+    return dict((name, statistics[name]) for name in _STATISTICS)
+
+
+def _saveCheckpoint(checkpointFile, state):
+    """Saves the search state, replacing the previous checkpoint."""
+    temporaryFile = checkpointFile + '.tmp.npz'
+    np.savez(temporaryFile, **state)
+    os.replace(temporaryFile, checkpointFile)
+
+
+def _loadCheckpoint(checkpointFile):
+    """Loads a search state saved by _saveCheckpoint."""
+    with np.load(checkpointFile) as checkpoint:
+        return dict((name, checkpoint[name]) for name in checkpoint.files)
+
+
+def moveOneBike(numIters, heuristic=WAIT_TIME, initialDistribution=None,
+                batchSize=1, workers=1, seed=None, deterministic=False,
+                checkpointFile=None, checkpointEvery=100,
+                randomMode=randomness.COMMON, **runKwargs):
+    """Searches for a bike distribution with high revenue.
+
+    Every iteration evaluates batchSize candidate moves of one bike (see
+    candidateMoves) and moves to the candidate with the highest revenue.
+    With batchSize=1, this is the heuristic of the notebooks, which applies
+    the move unconditionally, except that an iteration never makes a no-op
+    move (see candidateMoves). All candidates of an iteration are evaluated
+    with the same seed, so in randomness.COMMON mode they are compared with
+    common random numbers.
+
+    Args:
+        numIters: Number of iterations (moves).
+        heuristic: WAIT_TIME or IDLE_TIME.
+        initialDistribution: Starting distribution. Defaults to the
+            almost-uniform distribution of nycbike.NUM_BIKES bikes.
+        batchSize: Number of candidate moves evaluated per iteration.
+        workers: Number of worker processes evaluating candidates.
+        seed: Seed of the simulation runs. If deterministic is False, every
+            iteration is seeded with a new child of
+            np.random.SeedSequence(seed).
+        deterministic: If True, every run uses the same seed, as in the
+            non-stochastic notebook search.
+        checkpointFile: .npz file in which the search state is saved every
+            checkpointEvery iterations. If the file exists, the search
+            resumes from it.
+        checkpointEvery: Number of iterations between checkpoints.
+        randomMode: Random stream mode of the simulation runs.
+        runKwargs: Other arguments passed to BikeSharingSimulation.run.
+
+    Returns:
+        Dictionary with the keys bestDistribution, bestRevenue,
+        distribution (after the last iteration) and revenues (revenue of
+        the distribution after each iteration, starting with the initial
+        distribution).
+    """
+    runKwargs['randomMode'] = randomMode
+    racksPerStation = runKwargs.get('racksPerStation', nycbike.RACKS)
+    # Extract the data once before the workers map it.
+    tripCountData = load_trip_stats.loadTripStatistics(
+        runKwargs.get('tripDataDir') or load_trip_stats.TRIP_DATA_DIR,
+        sparse=runKwargs.get('sparseDestinations', False))[0]
+
+    if checkpointFile is not None and os.path.exists(checkpointFile):
+        state = _loadCheckpoint(checkpointFile)
+        if str(state['heuristic']) != heuristic:
+            raise ValueError('checkpoint %s was made with heuristic %s'
+                             % (checkpointFile, state['heuristic']))
+        logging.info('Resuming from iteration %d of %s'
+                     % (state['iteration'], checkpointFile))
+    else:
+        if initialDistribution is None:
+            initialDistribution = (
+                nycbike.BikeSharingSimulation().almostUniformWithTotalSum(
+                    tripCountData.shape[0], nycbike.NUM_BIKES))
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        state = {
+            'heuristic': heuristic,
+            # Entropy may exceed 64 bits, so it is stored as a string.
+            'seed': str(seed),
+            'iteration': 0,
+            'distribution': np.array(initialDistribution, dtype=float),
+        }
+    seed = int(str(state['seed']))
+    iteration = int(state['iteration'])
+    # The initial evaluation is seeded with child 0 and iteration i with
+    # child i, so a resumed search continues with the same seeds.
+    seeds = np.random.SeedSequence(
+        seed, n_children_spawned=iteration + 1 if iteration else 0)
+
+    def nextSeed():
+        if deterministic:
+            return np.random.SeedSequence(seed)
+        return seeds.spawn(1)[0]
+
+    if workers > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_initEvaluationWorker,
+            initargs=(runKwargs,))
+        evaluate = executor.map
+    else:
+        executor = None
+        _initEvaluationWorker(runKwargs)
+        evaluate = map
+
+    try:
+        distribution = state['distribution']
+        if iteration == 0:
+            # Evaluate the initial distribution.
+            statistics = _evaluate(distribution, nextSeed())
+            revenues = [statistics['Revenue']]
+            bestDistribution = distribution.copy()
+            bestRevenue = statistics['Revenue']
+        else:
+            statistics = dict(
+                (name, state[name]) for name in _STATISTICS)
+            revenues = state['revenues'].tolist()
+            bestDistribution = state['bestDistribution']
+            bestRevenue = float(state['bestRevenue'])
+
+        startTime = time.time()
+        while iteration < numIters:
+            donors, receivers = rankStations(
+                distribution, statistics, heuristic, racksPerStation)
+            moves = candidateMoves(donors, receivers, batchSize)
+            if not moves:
+                logging.warning('No bike can be moved.')
+                break
+            candidates = []
+            for donor, receiver in moves:
+                candidate = distribution.copy()
+                candidate[donor] -= 1
+                candidate[receiver] += 1
+                candidates.append(candidate)
+            iterationSeed = nextSeed()
+            results = list(evaluate(
+                _evaluate, candidates, [iterationSeed] * len(candidates)))
+            best = int(np.argmax([result['Revenue'] for result in results]))
+            distribution, statistics = candidates[best], results[best]
+            iteration += 1
+
+            revenues.append(statistics['Revenue'])
+            if statistics['Revenue'] > bestRevenue:
+                bestRevenue = statistics['Revenue']
+                bestDistribution = distribution.copy()
+            if iteration % max(1, numIters // 10) == 0:
+                logging.info('Iteration %d: revenue %.2f, best %.2f'
+                             ' (%.2f seconds)' % (
+                                 iteration, statistics['Revenue'],
+                                 bestRevenue, time.time() - startTime))
+
+            if checkpointFile is not None and (
+                    iteration % checkpointEvery == 0
+                    or iteration == numIters):
+                state = {
+                    'heuristic': heuristic,
+                    'seed': str(seed),
+                    'iteration': iteration,
+                    'distribution': distribution,
+                    'revenues': np.array(revenues, dtype=float),
+                    'bestDistribution': bestDistribution,
+                    'bestRevenue': bestRevenue,
+                }
+                state.update(statistics)
+                _saveCheckpoint(checkpointFile, state)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return {
+        'bestDistribution': bestDistribution,
+        'bestRevenue': bestRevenue,
+        'distribution': distribution,
+        'revenues': np.array(revenues, dtype=float),
+    }
+
+
+def main():
+    """Parses command-line args and runs the optimization."""
+    parser = argparse.ArgumentParser(
+        description='Bike distribution optimization')
+    parser.add_argument('--loglevel', dest='loglevel', action='store',
+        default='WARNING', help='Level of logging output.')
+    parser.add_argument('--heuristic', dest='heuristic', action='store',
+        default=WAIT_TIME, help='Heuristic (waitTime or idleTime).')
+    parser.add_argument('--numIters', dest='numIters', action='store',
+        default=5000, help='Number of iterations.')
+    parser.add_argument('--batchSize', dest='batchSize', action='store',
+        default=1, help='Number of candidate moves per iteration.')
+    parser.add_argument('--workers', dest='workers', action='store',
+        default=1, help='Number of worker processes.')
+    parser.add_argument('--seed', dest='seed', action='store',
+        default=None, help='Seed of the simulation runs.')
+    parser.add_argument('--deterministic', dest='deterministic',
+        action='store_true', help='Use the same seed for every run.')
+    parser.add_argument('--initialDistribution', dest='initialDistribution',
+        action='store', default=None,
+        help='.npy file of the starting distribution.')
+    parser.add_argument('--checkpointFile', dest='checkpointFile',
+        action='store', default=None,
+        help='.npz file used to checkpoint and resume the search.')
+    parser.add_argument('--checkpointEvery', dest='checkpointEvery',
+        action='store', default=100,
+        help='Number of iterations between checkpoints.')
+    parser.add_argument('--output', dest='output', action='store',
+        default=None, help='.npy file of the best distribution.')
+    parser.add_argument('--tripDataDir', dest='tripDataDir', action='store',
+        default=load_trip_stats.TRIP_DATA_DIR,
+        help='Directory of the trip statistics.')
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.loglevel.upper()))
+
+    numIters = int(args.numIters)
+    result = moveOneBike(
+        numIters, heuristic=args.heuristic,
+        initialDistribution=(np.load(args.initialDistribution)
+                             if args.initialDistribution else None),
+        batchSize=int(args.batchSize), workers=int(args.workers),
+        seed=int(args.seed) if args.seed else None,
+        deterministic=args.deterministic,
+        checkpointFile=args.checkpointFile,
+        checkpointEvery=int(args.checkpointEvery),
+        tripDataDir=args.tripDataDir)
+
+    output = args.output or 'moveOneBike_%s%d.npy' % (
+        'idleTime_' if args.heuristic == IDLE_TIME else '', numIters)
+    np.save(output, result['bestDistribution'])
+    print('best revenue %.2f, saved to %s' % (result['bestRevenue'], output))
+
+
+if __name__ == '__main__':
+    main()
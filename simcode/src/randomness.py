@@ -0,0 +1,172 @@
+"""Uniform random number streams consumed by the simulation event handlers.
+
+Handlers draw the variates of a trip through a stream's tripVariates()
+method. The scalar stream makes one NumPy call per variate, while the
+batched stream pre-draws variates in blocks. Both consume the underlying
+generator in the order of the trips, so for a given seed they produce
+identical simulations.
+
+The common stream instead assigns fixed variates to every customer in the
+arrival schedule. Runs with the same seed then give each customer the same
+trip outcome even if the scenarios differ (common random numbers), which
+reduces the variance of the estimated difference between scenarios.
+"""
+
+# Third-party libs.
+import numpy as np
+
+
+# Names of the available stream modes.
+SCALAR = 'scalar'
+BATCHED = 'batched'
+COMMON = 'common'
+
+# Number of uniform variates used per trip: destination and crash.
+VARIATES_PER_TRIP = 2
+
+# Number of variates drawn per block by the batched stream.
+DEFAULT_BLOCK_SIZE = 4096
+
+
+def _sourceState(source):
+    """Returns a picklable stand-in for a stream's generator.
+
+    The np.random module cannot be copied or pickled. It is replaced by
+    None, and its state is saved separately by the caller if needed (see
+    BikeSharingSimulation.snapshot).
+    """
+    return None if source is np.random else source
+
+
+def _restoreSource(source):
+    """Inverse of _sourceState."""
+    return np.random if source is None else source
+
+
+class ScalarRandomStream(object):
+    """Draws every variate with a separate call to the generator."""
+
+    def __init__(self, source=np.random):
+        """Creates the stream.
+
+        Args:
+            source: Generator with a random(size=None) method, such as the
+                np.random module, a RandomState or a Generator.
+        """
+        self.source = source
+        self.random = source.random
+
+    def __getstate__(self):
+        return {'source': _sourceState(self.source)}
+
+    def __setstate__(self, state):
+        self.__init__(_restoreSource(state['source']))
+
+    def tripVariates(self, customerIndex):
+        """Returns the destination and crash variates of a trip.
+
+        Variates are drawn in trip order, so customerIndex is ignored.
+        """
+        random = self.random
+        return random(), random()
+
+
+class BatchedRandomStream(object):
+    """Pre-draws variates in blocks that are refilled lazily."""
+
+    def __init__(self, source=np.random, blockSize=DEFAULT_BLOCK_SIZE):
+        """Creates the stream.
+
+        Args:
+            source: Generator with a random(size=None) method, such as the
+                np.random module, a RandomState or a Generator.
+            blockSize: Number of variates drawn per block.
+        """
+        self.source = source
+        self.blockSize = blockSize
+        self._block = iter(())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['source'] = _sourceState(self.source)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.source = _restoreSource(state['source'])
+
+    def random(self):
+        """Returns the next uniform variate in [0, 1)."""
+        for u in self._block:
+            return u
+        self._block = iter(self.source.random(self.blockSize).tolist())
+        return next(self._block)
+
+    def tripVariates(self, customerIndex):
+        """Returns the destination and crash variates of a trip.
+
+        Variates are drawn in trip order, so customerIndex is ignored.
+        """
+        random = self.random
+        return random(), random()
+
+
+class CommonRandomStream(object):
+    """Assigns fixed trip variates to every customer index.
+
+    The variates of all customers are drawn up front, so the outcome of a
+    customer's trip does not depend on the trips taken before it.
+    """
+
+    def __init__(self, numCustomers, source=np.random, antithetic=False):
+        """Creates the stream.
+
+        Args:
+            numCustomers: Number of customer indices.
+            source: Generator with a random(size=None) method.
+            antithetic: If True, every variate u is replaced by its
+                antithetic variate 1 - u (0 is kept, so that variates stay
+                in [0, 1)). A run paired with an otherwise identical
+                non-antithetic run gives negatively correlated results.
+        """
+        variates = source.random((numCustomers, VARIATES_PER_TRIP))
+        if antithetic:
+            variates = (1.0 - variates) % 1.0
+        self.antithetic = antithetic
+        self._variates = variates.tolist()
+
+    def __deepcopy__(self, memo):
+        # The variates are never modified, so copies share them.
+        return self
+
+    def tripVariates(self, customerIndex):
+        """Returns the destination and crash variates of a customer's trip.
+
+        Args:
+            customerIndex: Index of the customer in the arrival schedule.
+        """
+        return self._variates[customerIndex]
+
+
+def makeRandomStream(mode=BATCHED, source=np.random,
+                     blockSize=DEFAULT_BLOCK_SIZE, numCustomers=0,
+                     antithetic=False):
+    """Creates a uniform random number stream.
+
+    Args:
+        mode: Stream mode, either SCALAR, BATCHED or COMMON.
+        source: Generator with a random(size=None) method.
+        blockSize: Number of variates drawn per block in BATCHED mode.
+        numCustomers: Number of customer indices in COMMON mode.
+        antithetic: If True, COMMON mode uses antithetic variates.
+
+    Returns:
+        Random stream instance.
+    """
+    if mode == SCALAR:
+        return ScalarRandomStream(source)
+    if mode == BATCHED:
+        return BatchedRandomStream(source, blockSize)
+    if mode == COMMON:
+        return CommonRandomStream(numCustomers, source, antithetic)
+    raise ValueError('unknown random stream mode %r' % mode)
@@ -0,0 +1,174 @@
+"""Destination samplers used by the bike sharing simulation.
+
+A sampler maps a (start station, timeframe) pair and a uniform random
+variate in [0, 1) to a destination station. Drawing the variate outside the
+sampler keeps the consumption of the random number stream independent of
+the sampling method.
+"""
+
+# Standard libs.
+import array
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+
+
+# Names of the available sampling methods.
+CHOICE = 'choice'
+ALIAS = 'alias'
+
+
+class ChoiceSampler(object):
+    """Samples destinations by inverse CDF, computed on every draw.
+
+    For dense probabilities this reproduces np.random.choice exactly: for the
+    same uniform variate it returns the same destination.
+    """
+
+    def __init__(self, destinationP):
+        self.destinationP = destinationP
+        self.isSparse = isinstance(
+            destinationP, load_trip_stats.SparseDestinationP)
+
+    def sample(self, stationID, timeframe, u):
+        """Selects a destination using a uniform variate."""
+        if self.isSparse:
+            return self.destinationP.sample(stationID, timeframe, u)
+        cdf = np.cumsum(self.destinationP[stationID][timeframe])
+        if cdf[-1] <= 0:
+            raise ValueError(
+                'no destinations for station %d in timeframe %d'
+                % (stationID, timeframe))
+        cdf /= cdf[-1]
+        return int(cdf.searchsorted(u, side='right'))
+
+
+class AliasSampler(object):
+    """Samples destinations in constant time using Walker alias tables.
+
+    One table is built for every (station, timeframe) row, over the
+    destinations with non-zero probability only. The tables are stored back
+    to back in flat arrays indexed by row offsets.
+    """
+
+    def __init__(self, offsets, destinations, prob, alias, numTimeframes):
+        self.offsets = offsets
+        self.destinations = destinations
+        self.prob = prob
+        self.alias = alias
+        self.numTimeframes = numTimeframes
+
+    @classmethod
+    def fromDestinationP(cls, destinationP):
+        """Builds alias tables from dense or sparse destination probabilities.
+
+        Args:
+            destinationP: Dense (stations x timeframes x stations) array or
+                SparseDestinationP.
+
+        Returns:
+            AliasSampler instance.
+        """
+        if not isinstance(destinationP, load_trip_stats.SparseDestinationP):
+            destinationP = load_trip_stats.SparseDestinationP.fromDense(
+                destinationP)
+        offsets = destinationP.offsets.tolist()
+        rowProbs = destinationP.probs.astype(np.float64)
+        destinations = array.array('i', destinationP.indices.tolist())
+        prob = array.array('d', bytes(8 * len(rowProbs)))
+        alias = array.array('i', destinations)
+        for r in range(len(offsets) - 1):
+            start, end = offsets[r], offsets[r + 1]
+            if end > start:
+                cls._buildTable(
+                    rowProbs[start:end], start, destinations, prob, alias)
+        return cls(array.array('q', offsets), destinations, prob, alias,
+                   destinationP.shape[1])
+
+    @staticmethod
+    def _buildTable(p, start, destinations, prob, alias):
+        """Builds the alias table of one row in place (Vose's method)."""
+        n = len(p)
+        scaled = (p * (n / p.sum())).tolist()
+        small = [i for i, q in enumerate(scaled) if q < 1.0]
+        large = [i for i, q in enumerate(scaled) if q >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large[-1]
+            prob[start + s] = scaled[s]
+            alias[start + s] = destinations[start + l]
+            scaled[l] -= 1.0 - scaled[s]
+            if scaled[l] < 1.0:
+                small.append(large.pop())
+        # Remaining entries are only off from 1 due to rounding errors.
+        for i in small + large:
+            prob[start + i] = 1.0
+
+    def sample(self, stationID, timeframe, u):
+        """Selects a destination using a uniform variate.
+
+        A single variate selects both the table column (integer part of
+        u * n) and the coin flip against its probability (fractional part).
+        """
+        r = stationID * self.numTimeframes + timeframe
+        start = self.offsets[r]
+        n = self.offsets[r + 1] - start
+        if n == 0:
+            raise ValueError(
+                'no destinations for station %d in timeframe %d'
+                % (stationID, timeframe))
+        x = u * n
+        i = int(x)
+        if x - i < self.prob[start + i]:
+            return self.destinations[start + i]
+        return self.alias[start + i]
+
+    def sampleMany(self, stationIDs, timeframe, u):
+        """Selects destinations for many trips at once.
+
+        Args:
+            stationIDs: Integer array of start stations.
+            timeframe: Timeframe of all the trips.
+            u: Array of uniform variates, one per trip.
+
+        Returns:
+            Integer array of destinations, identical to calling sample() on
+            every trip.
+        """
+        offsets = np.frombuffer(self.offsets, dtype=np.int64)
+        r = np.asarray(stationIDs) * self.numTimeframes + timeframe
+        start = offsets[r]
+        n = offsets[r + 1] - start
+        if np.any(n == 0):
+            stationID = np.asarray(stationIDs)[np.argmin(n)]
+            raise ValueError(
+                'no destinations for station %d in timeframe %d'
+                % (stationID, timeframe))
+        x = u * n
+        i = x.astype(np.int64)
+        entries = start + i
+        return np.where(
+            x - i < np.frombuffer(self.prob, dtype=np.float64)[entries],
+            np.frombuffer(self.destinations, dtype=np.int32)[entries],
+            np.frombuffer(self.alias, dtype=np.int32)[entries])
+
+
+def makeSampler(destinationP, method=ALIAS):
+    """Creates a destination sampler.
+
+    Args:
+        destinationP: Dense (stations x timeframes x stations) array or
+            SparseDestinationP.
+        method: Sampling method, either CHOICE or ALIAS.
+
+    Returns:
+        Sampler instance.
+    """
+    if method == CHOICE:
+        return ChoiceSampler(destinationP)
+    if method == ALIAS:
+        return AliasSampler.fromDestinationP(destinationP)
+    raise ValueError('unknown sampling method %r' % method)
@@ -0,0 +1,204 @@
+"""Time series of the station states in the bike sharing simulation.
+
+A TelemetryRecorder samples the number of bikes and empty racks and the
+lengths of the pickup and dropoff queues of every station at a fixed
+interval of simulation time. Samples are taken by a recurring engine event,
+so the event handlers do no extra work, and are stored in preallocated
+(samples x stations) arrays, which can be saved as a compressed .npz file.
+
+Run from the project root directory to print the stations that ran out of
+bikes or racks for the longest time:
+`python -m simcode.src.telemetry [telemetry file]`
+"""
+
+# Standard libs.
+import argparse
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.engine as engine
+
+
+# Default simulation time between samples, in minutes.
+DEFAULT_INTERVAL = 5.0
+
+# Default number of samples converted to arrays at a time.
+DEFAULT_BLOCK_SIZE = 32
+
+# Names of the recorded series, in sample order.
+SERIES = ('numBikes', 'numRacks', 'pickupQueue', 'dropoffQueue')
+
+# Priority of the sample events, so that a sample reflects all events at
+# its timestamp with the default priority.
+SAMPLE_PRIORITY = 1
+
+
+class TelemetryRecorder(object):
+    """Records the state of all stations at a fixed sampling interval.
+
+    Samples are appended to a list and copied into the preallocated arrays
+    one block at a time, so that taking a sample only copies the station
+    table columns and the queue lengths.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL,
+                 blockSize=DEFAULT_BLOCK_SIZE):
+        """Creates an empty recorder.
+
+        Args:
+            interval: Simulation time between samples.
+            blockSize: Number of samples per block.
+        """
+        self.interval = float(interval)
+        self.blockSize = blockSize
+        # Number of samples copied into the arrays.
+        self.numSamples = 0
+        self.times = None
+        self.series = None
+        self._pending = []
+
+    def start(self, simEngine, stations, pickupQueues, dropoffQueues,
+              endTime):
+        """Schedules the samples of a simulation run.
+
+        Samples are taken at times 0, interval, 2 * interval, ... up to
+        endTime. The arrays are allocated when the first sample is taken,
+        so the station tables may still be empty.
+
+        Args:
+            simEngine: Engine of the run.
+            stations: nycbike.StationTable of the stations.
+            pickupQueues: nycbike.QueueTable of the pickup queues.
+            dropoffQueues: nycbike.QueueTable of the dropoff queues.
+            endTime: Simulation time of the last sample.
+        """
+        self._stations = stations
+        self._pickupQueues = pickupQueues
+        self._dropoffQueues = dropoffQueues
+        self._maxSamples = int(endTime // self.interval) + 1
+        self.numSamples = 0
+        self.times = None
+        self.series = None
+        self._pending = []
+        simEngine.scheduleAt(0, Sample, self, SAMPLE_PRIORITY)
+
+    def sample(self, simTime):
+        """Takes a sample of all stations.
+
+        Returns:
+            True if more samples remain to be taken.
+        """
+        if self.series is None:
+            numStations = len(self._stations)
+            self.times = np.zeros(self._maxSamples)
+            self.series = dict(
+                (name, np.zeros((self._maxSamples, numStations),
+                                dtype=np.int32))
+                for name in SERIES)
+        columns = self._stations.arrays()
+        pending = self._pending
+        pending.append((
+            simTime,
+            columns['numBikes'].copy(),
+            columns['numRacks'].copy(),
+            self._pickupQueues.lengths(),
+            self._dropoffQueues.lengths()))
+        numTaken = self.numSamples + len(pending)
+        if len(pending) >= self.blockSize or numTaken == self._maxSamples:
+            self.flush()
+        return numTaken < self._maxSamples
+
+    def flush(self):
+        """Copies the pending samples into the arrays."""
+        if not self._pending:
+            return
+        start = self.numSamples
+        end = start + len(self._pending)
+        columns = list(zip(*self._pending))
+        self._pending = []
+        self.times[start:end] = columns[0]
+        for name, column in zip(SERIES, columns[1:]):
+            self.series[name][start:end] = column
+        self.numSamples = end
+
+    def arrays(self):
+        """Returns the recorded time series.
+
+        Returns:
+            Dictionary with the sample times under 'times', and a
+            (samples x stations) integer array for every name in SERIES.
+        """
+        self.flush()
+        arrays = {'times': self.times[:self.numSamples]}
+        for name in SERIES:
+            arrays[name] = self.series[name][:self.numSamples]
+        return arrays
+
+    def save(self, filename):
+        """Saves the recorded time series as a compressed .npz file.
+
+        Args:
+            filename: Path of the file.
+        """
+        np.savez_compressed(filename, **self.arrays())
+
+
+@engine.eventHandler('recorder')
+def Sample(simEngine, recorder):
+    """Samples the station states and schedules the next sample."""
+    if recorder.sample(simEngine.simTime):
+        simEngine.scheduleAt(simEngine.simTime + recorder.interval, Sample,
+                             recorder, SAMPLE_PRIORITY)
+
+
+def loadTelemetry(filename):
+    """Loads time series saved by TelemetryRecorder.save.
+
+    Returns:
+        Dictionary of arrays, as returned by TelemetryRecorder.arrays.
+    """
+    with np.load(filename) as data:
+        return dict((name, data[name]) for name in data.files)
+
+
+def shortageTimes(arrays):
+    """Computes how long every station had no bikes or no empty racks.
+
+    Every sample counts for the interval up to the next sample.
+
+    Args:
+        arrays: Dictionary of arrays, as returned by
+            TelemetryRecorder.arrays.
+
+    Returns:
+        Tuple of (noBikes, noRacks) arrays with the time per station.
+    """
+    intervals = np.diff(arrays['times'], append=arrays['times'][-1])
+    noBikes = intervals.dot(arrays['numBikes'] <= 0)
+    noRacks = intervals.dot(arrays['numRacks'] <= 0)
+    return noBikes, noRacks
+
+
+def main():
+    """Parses command-line args and prints the station shortages."""
+    parser = argparse.ArgumentParser(description='Station telemetry reader')
+    parser.add_argument('filename', help='Telemetry .npz file.')
+    parser.add_argument('--numStations', dest='numStations', action='store',
+        default=10, help='Number of stations printed.')
+    args = parser.parse_args()
+
+    arrays = loadTelemetry(args.filename)
+    noBikes, noRacks = shortageTimes(arrays)
+    print('%8s %16s %16s %16s' % (
+        'station', 'no bikes (min)', 'no racks (min)', 'first empty'))
+    for stationID in np.argsort(-noBikes)[:int(args.numStations)]:
+        empty = np.flatnonzero(arrays['numBikes'][:, stationID] <= 0)
+        print('%8d %16.1f %16.1f %16s' % (
+            stationID, noBikes[stationID], noRacks[stationID],
+            '%.1f' % arrays['times'][empty[0]] if len(empty) else '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""Binary trace of customer events in the bike sharing simulation.
+
+Event handlers record fixed-width trace records instead of formatting log
+messages. Records are kept in a preallocated ring buffer, or written to a
+directory as chunked .npy files, and are rendered as the human-readable
+simulation trace on demand.
+
+Run from the project root directory to print a recorded trace:
+`python -m simcode.src.tracing [trace directory]`
+"""
+
+# Standard libs.
+import argparse
+import glob
+import logging
+import os
+
+# Third-party libs.
+import numpy as np
+
+
+# Trace record kinds.
+NO_BIKE = 0
+PICKUP = 1
+DROPOFF_AFTER_WAIT = 2
+REFUND = 3
+NO_RACK = 4
+RETURN = 5
+PICKUP_AFTER_WAIT = 6
+CUSTOMER_LOST = 7
+BIKE_LOST = 8
+
+# Fixed-width trace record. stationID is the station where the event occurs
+# (for BIKE_LOST, the destination the customer never reached) and endID is
+# the destination of a PICKUP. value is the ride end time of a PICKUP, or
+# the wait time of a DROPOFF_AFTER_WAIT, PICKUP_AFTER_WAIT or CUSTOMER_LOST.
+TRACE_DTYPE = np.dtype([
+    ('time', np.float64),
+    ('kind', np.uint8),
+    ('customerID', np.int64),
+    ('stationID', np.int32),
+    ('endID', np.int32),
+    ('value', np.float64),
+])
+
+# Record field indices.
+_TIME, _KIND, _CUSTOMER, _STATION, _END, _VALUE = range(6)
+
+# Message template and the fields that fill it for each record kind.
+_MESSAGES = {
+    NO_BIKE: (
+        '\t(customer %d) Damn! where are all the bikes at station %d, the time is %.3f',
+        (_CUSTOMER, _STATION, _TIME)),
+    PICKUP: (
+        '\t(customer %d) yay! i got a bike from %d at time %.3f n im going to %d n will reach at %.3f',
+        (_CUSTOMER, _STATION, _TIME, _END, _VALUE)),
+    DROPOFF_AFTER_WAIT: (
+        '\t(customer %d) finally i can return my bike at stn %d after waiting for %.3f having arrived at %.3f',
+        (_CUSTOMER, _STATION, _VALUE, _TIME)),
+    REFUND: (
+        '\t(customer %d) at least i got my refund for waiting too long to return the bike',
+        (_CUSTOMER,)),
+    NO_RACK: (
+        '\t(customer %d) damn there are no empty racks at station %d at time %.3f',
+        (_CUSTOMER, _STATION, _TIME)),
+    RETURN: (
+        '\t(customer %d) perfecto! i reached my destination %d at time %.3f, my journey is complete',
+        (_CUSTOMER, _STATION, _TIME)),
+    PICKUP_AFTER_WAIT: (
+        '\t(customer %d) finally i get my ride at stn %d after waiting for %.3f having arrived at %.3f',
+        (_CUSTOMER, _STATION, _VALUE, _TIME)),
+    CUSTOMER_LOST: (
+        '\t(customer %d) @#$%%! u wasted my time! i waited for %.3f minutes for a bike at stn %d, i dont want it anymore',
+        (_CUSTOMER, _VALUE, _STATION)),
+    BIKE_LOST: (
+        '\t(customer %d) oops! the bike was lost or damaged and I never reached stn %d',
+        (_CUSTOMER, _STATION)),
+}
+
+# Every event records exactly one of these kinds first, so the kind
+# identifies the handler that processed the event.
+_EVENT_HANDLERS = {
+    NO_BIKE: 'Arrival',
+    PICKUP: 'Arrival',
+    NO_RACK: 'RideEnd',
+    RETURN: 'RideEnd',
+    BIKE_LOST: 'RideCrash',
+}
+
+# Default number of records kept in memory by a TraceRecorder.
+DEFAULT_CAPACITY = 1 << 20
+
+# Default number of records converted to an array at a time.
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+# Filename pattern of the chunks of a trace directory.
+CHUNK_FILENAME = 'trace_%06d.npy'
+
+
+class TraceRecorder(object):
+    """Records trace records in binary form.
+
+    Records are appended to a list and converted to TRACE_DTYPE arrays one
+    chunk at a time. Without a directory, the chunks are copied into a
+    preallocated ring buffer that keeps the most recent capacity records.
+    With a directory, every chunk is saved as a .npy file.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, directory=None,
+                 chunkSize=DEFAULT_CHUNK_SIZE):
+        """Creates an empty trace.
+
+        Args:
+            capacity: Number of records kept in memory. Ignored if directory
+                is specified.
+            directory: Directory in which the chunks are saved. It is
+                created if it does not exist.
+            chunkSize: Number of records per chunk.
+        """
+        self.directory = directory
+        self.chunkSize = chunkSize
+        # Total number of records, including records no longer buffered.
+        self.numRecords = 0
+        self._pending = []
+        self._numChunks = 0
+        if directory is None:
+            self._buffer = np.empty(capacity, dtype=TRACE_DTYPE)
+        else:
+            self._buffer = None
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+
+    def record(self, time, kind, customerID, stationID, endID=-1, value=0.0):
+        """Appends a trace record.
+
+        Args:
+            time: Simulation time of the event.
+            kind: Record kind, e.g. PICKUP.
+            customerID: ID of the customer.
+            stationID: ID of the station where the event occurs.
+            endID: ID of the destination station of a PICKUP.
+            value: Ride end time or wait time (see TRACE_DTYPE).
+        """
+        pending = self._pending
+        pending.append((time, kind, customerID, stationID, endID, value))
+        if len(pending) >= self.chunkSize:
+            self.flush()
+
+    def flush(self):
+        """Converts the pending records to a chunk and stores it."""
+        if not self._pending:
+            return
+        chunk = np.array(self._pending, dtype=TRACE_DTYPE)
+        self._pending = []
+        numChunkRecords = len(chunk)
+        if self._buffer is None:
+            np.save(os.path.join(
+                self.directory, CHUNK_FILENAME % self._numChunks), chunk)
+        else:
+            capacity = len(self._buffer)
+            start = self.numRecords
+            if numChunkRecords > capacity:
+                # Only the end of the chunk fits in the buffer.
+                start += numChunkRecords - capacity
+                chunk = chunk[-capacity:]
+            # Copy the chunk, wrapping around the end of the buffer.
+            offset = start % capacity
+            head = min(len(chunk), capacity - offset)
+            self._buffer[offset:offset + head] = chunk[:head]
+            self._buffer[:len(chunk) - head] = chunk[head:]
+        self._numChunks += 1
+        self.numRecords += numChunkRecords
+
+    def records(self):
+        """Returns the recorded trace.
+
+        Returns:
+            TRACE_DTYPE array of the records in the order they were
+            recorded. In memory, only the most recent capacity records are
+            returned.
+        """
+        self.flush()
+        if self._buffer is None:
+            return loadTrace(self.directory)
+        capacity = len(self._buffer)
+        if self.numRecords <= capacity:
+            return self._buffer[:self.numRecords].copy()
+        offset = self.numRecords % capacity
+        return np.concatenate((self._buffer[offset:], self._buffer[:offset]))
+
+
+class LoggingTrace(object):
+    """Trace that logs every record as a debug message when it is recorded.
+
+    This reproduces the debug output of the simulation, interleaved with
+    the engine's debug messages.
+    """
+
+    def record(self, time, kind, customerID, stationID, endID=-1, value=0.0):
+        """Logs a trace record. See TraceRecorder.record."""
+        logging.debug(formatRecord(
+            (time, kind, customerID, stationID, endID, value)))
+
+    def flush(self):
+        """Does nothing, as records are never buffered."""
+        pass
+
+
+def loadTrace(directory):
+    """Loads a trace saved by a TraceRecorder.
+
+    Args:
+        directory: Directory of the trace chunks.
+
+    Returns:
+        TRACE_DTYPE array of the records in the order they were recorded.
+    """
+    filenames = sorted(glob.glob(
+        os.path.join(directory, CHUNK_FILENAME.replace('%06d', '*'))))
+    if not filenames:
+        return np.empty(0, dtype=TRACE_DTYPE)
+    return np.concatenate([np.load(filename) for filename in filenames])
+
+
+def formatRecord(record):
+    """Returns the human-readable message of a trace record.
+
+    Args:
+        record: TRACE_DTYPE record or a tuple with the same fields.
+    """
+    template, fields = _MESSAGES[int(record[_KIND])]
+    return template % tuple(record[field] for field in fields)
+
+
+def renderTrace(records, eventHeaders=True):
+    """Renders trace records as the simulation's debug log text.
+
+    Args:
+        records: Sequence of TRACE_DTYPE records.
+        eventHeaders: If True, every event starts with the engine's
+            'T=<time>, <handler>' line.
+
+    Yields:
+        Lines of the trace, without line terminators.
+    """
+    for record in records:
+        if eventHeaders:
+            handlerName = _EVENT_HANDLERS.get(int(record[_KIND]))
+            if handlerName is not None:
+                yield 'T=%.2f, %s' % (record[_TIME], handlerName)
+        yield formatRecord(record)
+
+
+def main():
+    """Parses command-line args and prints a recorded trace."""
+    parser = argparse.ArgumentParser(description='Simulation trace reader')
+    parser.add_argument('directory', help='Directory of the trace chunks.')
+    parser.add_argument('--noEventHeaders', dest='eventHeaders',
+        action='store_false', help='Omit the per-event header lines.')
+    args = parser.parse_args()
+
+    for line in renderTrace(loadTrace(args.directory), args.eventHeaders):
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
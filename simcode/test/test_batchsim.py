@@ -0,0 +1,161 @@
+"""Tests for the batched time-stepped simulation."""
+
+# Standard libs.
+import os
+import shutil
+import tempfile
+import unittest
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.batchsim as batchsim
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+import simcode.test.test_nycbike as test_nycbike
+
+
+class TestBatchedSimulation(unittest.TestCase):
+    """Unit tests for the batched simulation."""
+
+    def setUp(self):
+        """Writes the simulation test data to a temporary directory."""
+        self.tripDataDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tripDataDir)
+        self.addCleanup(load_trip_stats.clearTripStatisticsCache)
+        testData = test_nycbike.TestBikeSharingSimulation
+        for filename, array in (
+                (load_trip_stats.TRIP_COUNT_FILENAME,
+                 np.array(testData.TEST_TRIP_COUNT_DATA)),
+                (load_trip_stats.TRIP_DURATION_FILENAME,
+                 testData.TEST_TRIP_DURATIONS),
+                (load_trip_stats.DESTINATION_PROBS_FILENAME,
+                 testData.TEST_DEST_PROBS)):
+            np.save(os.path.join(self.tripDataDir, filename), array)
+        self.simulation = batchsim.BatchedSimulation.fromTripData(
+            self.tripDataDir, racksPerStation=3, timeStep=0.25)
+
+    def test_scenarioStreams(self):
+        """Tests that every scenario consumes its own generator in order."""
+        seeds = np.random.SeedSequence(0).spawn(2)
+        streams = batchsim._ScenarioStreams(seeds, blockSize=4)
+        taken = [[], []]
+        rng = np.random.RandomState(0)
+        for _ in range(50):
+            counts = rng.randint(0, 7, size=2)
+            variates = streams.take(counts)
+            taken[0].extend(variates[:counts[0]])
+            taken[1].extend(variates[counts[0]:])
+        for seed, variates in zip(seeds, taken):
+            np.testing.assert_array_equal(
+                np.random.default_rng(seed).random(len(variates)), variates)
+
+    def test_waitingQueues(self):
+        """Tests the aging and removal of waiting customers."""
+        queues = batchsim._WaitingQueues(numAges=2, size=3)
+        queues.join(0, np.array([1, 0, 2]))
+        queues.age(0)
+        queues.join(1, np.array([1]), np.array([0]))
+        queues.age(1)
+        queues.join(2, np.array([3, 0, 0]))
+        np.testing.assert_array_equal([5, 0, 2], queues.numWaiting)
+
+        # Customers at station 0 have waited 2, 1 and 0 steps.
+        lost, waitSteps = queues.removeOlder(2, np.array([0, 2]), 2)
+        np.testing.assert_array_equal([1, 2], lost)
+        np.testing.assert_array_equal([2, 4], waitSteps)
+        served, waitSteps, servedOld = queues.serve(
+            2, np.array([0]), np.array([2]), maxAge=1)
+        np.testing.assert_array_equal([2], served)
+        np.testing.assert_array_equal([1], waitSteps)
+        np.testing.assert_array_equal([0], servedOld)
+        np.testing.assert_array_equal([2, 0, 0], queues.numWaiting)
+
+    def test_run_shapes(self):
+        """Tests the shapes of batched and single runs."""
+        statistics = self.simulation.run(
+            np.array([[2, 0, 1], [1, 1, 1]]), rngSeeds=0)
+        self.assertEqual((2,), statistics['Revenue'].shape)
+        self.assertEqual((2,), statistics['BikesLost'].shape)
+        for name in ('TimeWaitForDropoff', 'TimeWaitForCycle',
+                     'CustomersLost', 'IdleTime'):
+            self.assertEqual((2, 3), statistics[name].shape)
+
+        statistics = self.simulation.run(np.array([2, 0, 1]), rngSeeds=[0])
+        self.assertEqual((), np.shape(statistics['Revenue']))
+        self.assertEqual((3,), statistics['IdleTime'].shape)
+
+    def test_run_scenariosIndependentOfBatch(self):
+        """Tests that a scenario's results only depend on its seed."""
+        batch = self.simulation.run(
+            np.array([[2, 0, 1], [0, 3, 0]]), rngSeeds=[5, 6],
+            scaleArrivalRates=[20, 10])
+        single = self.simulation.run(
+            np.array([0, 3, 0]), rngSeeds=[6], scaleArrivalRates=10)
+        for name, value in single.items():
+            np.testing.assert_array_equal(value, batch[name][1])
+
+    def test_run_scaleArrivalRates(self):
+        """Tests per-scenario arrival rate scale factors."""
+        statistics = self.simulation.run(
+            np.array([[2, 0, 1], [2, 0, 1]]), rngSeeds=0,
+            scaleArrivalRates=[0, 20])
+        self.assertEqual(0, statistics['Revenue'][0])
+        self.assertEqual(0, statistics['CustomersLost'][0].sum())
+        self.assertGreater(statistics['Revenue'][1], 0)
+
+    def test_compareWithSimulation(self):
+        """Tests the approximation error against the event simulation."""
+        comparison = batchsim.compareWithSimulation(
+            self.simulation, np.array([[2, 0, 1], [0, 3, 0]]),
+            numReplications=20, tripDataDir=self.tripDataDir,
+            racksPerStation=3, scaleArrivalRate=20)
+        for name, tolerance in (('Revenue', 0.03), ('CustomersLost', 0.05),
+                                ('IdleTime', 0.03),
+                                ('TimeWaitForCycle', 0.1),
+                                ('TimeWaitForDropoff', 0.1)):
+            self.assertLess(
+                np.abs(comparison[name]['relativeError']).max(), tolerance,
+                name)
+        self._assertBikesLostWithinInterval(comparison)
+
+    def test_compareWithSimulation_fullStations(self):
+        """Tests the dropoff waits at stations that run out of racks."""
+        # With fewer racks per station than bikes, customers wait to drop
+        # off their bikes.
+        simulation = batchsim.BatchedSimulation.fromTripData(
+            self.tripDataDir, racksPerStation=2, timeStep=0.25)
+        comparison = batchsim.compareWithSimulation(
+            simulation, np.array([[2, 0, 1], [1, 1, 1]]),
+            numReplications=20, tripDataDir=self.tripDataDir,
+            racksPerStation=2, scaleArrivalRate=20)
+        self.assertTrue(
+            np.all(comparison['TimeWaitForDropoff']['simulation'] > 0))
+        self.assertLess(np.abs(
+            comparison['TimeWaitForDropoff']['relativeError']).max(), 0.1)
+        self._assertBikesLostWithinInterval(comparison)
+
+    def _assertBikesLostWithinInterval(self, comparison):
+        """Helper method used to bound the error of the lost bikes.
+
+        Bikes are rarely lost, so the error of the mean is bounded by twice
+        the half-width of the confidence interval of the simulated mean.
+        """
+        result = comparison['BikesLost']
+        self.assertTrue(np.all(np.abs(result['relativeError'])
+                               <= 2 * result['relativeHalfWidth']))
+
+    def test_compareWithSimulation_idleStations(self):
+        """Tests the idle time of stations that keep their bikes."""
+        # At low demand, most bikes stay docked until the end of the day,
+        # so most of the idle time is counted after the last event.
+        comparison = batchsim.compareWithSimulation(
+            self.simulation, np.array([[2, 0, 1], [0, 3, 0]]),
+            numReplications=20, tripDataDir=self.tripDataDir,
+            racksPerStation=3, scaleArrivalRate=1)
+        self.assertLess(
+            np.abs(comparison['IdleTime']['relativeError']).max(), 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+"""Tests for building the trip statistics from trip CSV files."""
+
+# Standard libs.
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.data.trip_statistics.build_trip_stats as build_trip_stats
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+
+
+class TestBuildTripStatistics(unittest.TestCase):
+    """Unit tests for the streaming trip statistics builder."""
+
+    # Trips used in tests, as (start station, start time, end station,
+    # duration in seconds). Station 519 is only a destination.
+    TEST_TRIPS = [
+        ('72', '2018-01-01 00:10:00.1000', '79', 600),
+        ('79', '2018-01-01 00:20:00.2000', '72', 300),
+        ('72', '2018-01-01 09:00:00.0000', '519', 1200),
+        ('72', '2018-01-01 00:40:00.0000', '79', 900),
+        ('NULL', '2018-01-01 05:00:00.0000', '79', 60),
+        ('79', '2018-01-02 09:30:00.0000', '79', 120),
+        ('72', '2018-01-02 23:59:59.9000', '72', 240),
+    ]
+
+    def setUp(self):
+        """Writes the test trips to a CSV file in a temporary directory."""
+        self.tempDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempDir)
+        self.addCleanup(load_trip_stats.clearTripStatisticsCache)
+        self.csvFilename = self._writeTrips('trips.csv', self.TEST_TRIPS)
+
+    def _writeTrips(self, filename, trips):
+        """Helper method used to write trips to a CSV file."""
+        filename = os.path.join(self.tempDir, filename)
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow(['tripduration', 'starttime', 'stoptime',
+                             'start station id', 'start station name',
+                             'end station id', 'end station name'])
+            for startID, startTime, endID, duration in trips:
+                writer.writerow([duration, startTime, '', startID, 'name',
+                                 endID, 'name'])
+        return filename
+
+    def _expectedStatistics(self):
+        """Helper method used to compute the statistics as the notebook."""
+        stationIDs = ['72', '79', '519']
+        counts = np.zeros((3, 24, 3))
+        durations = [[[] for _ in range(3)] for _ in range(3)]
+        for startID, startTime, endID, duration in self.TEST_TRIPS:
+            if startID == 'NULL':
+                continue
+            start = stationIDs.index(startID)
+            end = stationIDs.index(endID)
+            counts[start, int(startTime[11:13]), end] += 1
+            durations[start][end].append(duration / 60.0)
+        tripCountData = np.rint(counts.sum(axis=2) / 2.0).astype(int)
+        tripDurations = np.array(
+            [[np.mean(d) if d else np.nan for d in row]
+             for row in durations])
+        totals = counts.sum(axis=2, keepdims=True)
+        destinationP = np.where(totals > 0, counts / np.maximum(totals, 1), 0)
+        return tripCountData, tripDurations, destinationP
+
+    def test_buildTripStatistics(self):
+        """Tests the dense statistics against the notebook's method."""
+        tripDataDir = os.path.join(self.tempDir, 'stats')
+        # Small chunks split the trips of a station between chunks.
+        accumulator = build_trip_stats.buildTripStatistics(
+            [self.csvFilename], tripDataDir, chunkSize=2)
+        self.assertEqual(['72', '79', '519'],
+                         accumulator.stationIDs.tolist())
+
+        expected = self._expectedStatistics()
+        actual = load_trip_stats.loadTripStatistics(tripDataDir)
+        np.testing.assert_array_equal(expected[0], actual[0])
+        np.testing.assert_allclose(expected[1], actual[1])
+        np.testing.assert_allclose(expected[2], actual[2])
+
+    def test_buildTripStatistics_sparse(self):
+        """Tests writing sparse destination probabilities from a zip."""
+        zipFilename = os.path.join(self.tempDir, 'trips.zip')
+        with zipfile.ZipFile(zipFilename, 'w') as zipRef:
+            zipRef.write(self.csvFilename, 'trips.csv')
+        tripDataDir = os.path.join(self.tempDir, 'stats')
+        build_trip_stats.buildTripStatistics(
+            [zipFilename], tripDataDir, sparse=True, numDays=1)
+        self.assertFalse(os.path.exists(os.path.join(
+            tripDataDir, load_trip_stats.DESTINATION_PROBS_FILENAME)))
+
+        expected = self._expectedStatistics()
+        tripCountData, _, destinationP = load_trip_stats.loadTripStatistics(
+            tripDataDir, sparse=True)
+        # Counts are not averaged over one day.
+        self.assertEqual(2, tripCountData[0][0])
+        np.testing.assert_allclose(
+            expected[2], destinationP.toDense(), rtol=1e-6)
+
+    def test_buildTripStatistics_incremental(self):
+        """Tests folding months into saved accumulators."""
+        # The second month has a new station and lacks station 519.
+        secondTrips = [
+            ('79', '2018-02-01 07:00:00.0000', '3002', 420),
+            ('79', '2018-02-01 07:30:00.0000', '72', 360),
+        ]
+        secondMonth = self._writeTrips('february.csv', secondTrips)
+        allTrips = self._writeTrips('all.csv',
+                                    self.TEST_TRIPS + secondTrips)
+        expectedDir = os.path.join(self.tempDir, 'expected')
+        expected = build_trip_stats.buildTripStatistics(
+            [allTrips], expectedDir)
+
+        # Months are folded in one at a time, in worker processes, or
+        # merged from accumulators.
+        tripDataDir = os.path.join(self.tempDir, 'stats')
+        accumulatorFile = os.path.join(self.tempDir, 'accumulator.npz')
+        build_trip_stats.buildTripStatistics(
+            [self.csvFilename], tripDataDir, accumulatorFile=accumulatorFile)
+        incremental = build_trip_stats.buildTripStatistics(
+            [secondMonth], tripDataDir, accumulatorFile=accumulatorFile)
+        parallel = build_trip_stats.buildTripStatistics(
+            [self.csvFilename, secondMonth],
+            os.path.join(self.tempDir, 'parallel'), workers=2)
+        merged = build_trip_stats.accumulateFile(self.csvFilename)
+        merged.merge(build_trip_stats.accumulateFile(secondMonth))
+        for accumulator in (incremental, parallel, merged,
+                            build_trip_stats.TripStatisticsAccumulator.load(
+                                accumulatorFile)):
+            self.assertEqual(['72', '79', '519', '3002'],
+                             accumulator.stationIDs.tolist())
+            np.testing.assert_array_equal(
+                expected.destinationCounts, accumulator.destinationCounts)
+            np.testing.assert_allclose(
+                expected.tripDurations(), accumulator.tripDurations())
+            self.assertEqual(expected.days, accumulator.days)
+
+        for filename in (load_trip_stats.TRIP_COUNT_FILENAME,
+                         load_trip_stats.DESTINATION_PROBS_FILENAME,
+                         build_trip_stats.STATION_IDS_FILENAME):
+            np.testing.assert_array_equal(
+                np.load(os.path.join(expectedDir, filename)),
+                np.load(os.path.join(tripDataDir, filename)))
+
+    def test_buildTripStatistics_stationIDMap(self):
+        """Tests that rebuilds keep the station numbers of earlier builds."""
+        tripDataDir = os.path.join(self.tempDir, 'stats')
+        build_trip_stats.buildTripStatistics(
+            [self.csvFilename], tripDataDir)
+        # Station 519 is numbered first in this month.
+        month = self._writeTrips('month.csv', [
+            ('519', '2018-03-01 07:00:00.0000', '80', 420)])
+        accumulator = build_trip_stats.buildTripStatistics(
+            [month], tripDataDir)
+        self.assertEqual(['72', '79', '519', '80'],
+                         accumulator.stationIDs.tolist())
+        tripCountData = np.load(os.path.join(
+            tripDataDir, load_trip_stats.TRIP_COUNT_FILENAME))
+        self.assertEqual(1, tripCountData[2][7])
+        self.assertEqual(0, tripCountData[:2].sum())
+
+    def test_readTripChunks_newerFormat(self):
+        """Tests computing durations from the start and stop times."""
+        filename = os.path.join(self.tempDir, 'newer.csv')
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['ride_id', 'started_at', 'ended_at',
+                             'start_station_id', 'end_station_id'])
+            writer.writerow(['a', '2021-06-01 08:00:00', '2021-06-01 08:12:30',
+                             '5329.03', '6140.05'])
+            writer.writerow(['b', '2021-06-01 08:05:00', '2021-06-01 08:06:00',
+                             '', '6140.05'])
+        chunks = list(build_trip_stats.readTripChunks([filename]))
+        self.assertEqual(1, len(chunks))
+        self.assertEqual(['5329.03'], chunks[0]['startID'].tolist())
+        np.testing.assert_array_equal([750.0], chunks[0]['duration'])
+
+    def test_mapStationIDs(self):
+        """Tests mapping station IDs to station numbers."""
+        stationIDs = np.array(['72', '519', '79'])
+        np.testing.assert_array_equal(
+            [2, 0, 1, 2], build_trip_stats.mapStationIDs(
+                stationIDs, np.array(['79', '72', '519', '79'])))
+        self.assertRaises(ValueError, build_trip_stats.mapStationIDs,
+                          stationIDs, np.array(['80']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+"""Tests for the replication confidence intervals."""
+
+# Standard libs.
+import unittest
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.confidence as confidence
+
+
+class TestConfidence(unittest.TestCase):
+    """Unit tests for the confidence interval helpers."""
+
+    def test_tQuantile(self):
+        """Tests t quantiles against tabulated values."""
+        for p, df, expected in (
+                (0.975, 1, 12.7062), (0.975, 2, 4.3027), (0.975, 3, 3.1824),
+                (0.975, 9, 2.2622), (0.975, 29, 2.0452), (0.95, 10, 1.8125),
+                (0.995, 20, 2.8453), (0.025, 9, -2.2622)):
+            self.assertAlmostEqual(
+                expected, confidence.tQuantile(p, df),
+                delta=0.002 * abs(expected))
+
+    def test_confidenceInterval(self):
+        """Tests the interval of the mean."""
+        interval = confidence.confidenceInterval([1.0, 2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(5, interval['n'])
+        self.assertAlmostEqual(3.0, interval['mean'])
+        self.assertAlmostEqual(np.sqrt(2.5), interval['std'])
+        self.assertAlmostEqual(
+            2.7764 * np.sqrt(2.5) / np.sqrt(5), interval['halfWidth'],
+            places=2)
+        self.assertAlmostEqual(
+            interval['mean'] - interval['halfWidth'], interval['low'])
+
+        # One sample has no interval.
+        self.assertTrue(np.isnan(confidence.confidenceInterval([1])['std']))
+
+    def test_summarizeReplications(self):
+        """Tests that per-station statistics are summarized by their sum."""
+        results = [
+            {'Revenue': 10, 'IdleTime': np.array([1.0, 2.0])},
+            {'Revenue': 20, 'IdleTime': np.array([3.0, 4.0])},
+        ]
+        summary = confidence.summarizeReplications(results)
+        self.assertEqual(15, summary['Revenue']['mean'])
+        self.assertEqual([3.0, 7.0], list(summary['IdleTime']['samples']))
+
+
+if __name__ == '__main__':
+    unittest.main()
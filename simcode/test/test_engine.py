@@ -1,7 +1,11 @@
 """Tests for the DiscreteEventSimulationEngine."""
 
+import os
+import shutil
+import tempfile
 import unittest
 import simcode.src.engine as engine
+import simcode.src.fel as fel
 
 
 def MockEvent(simEngine, **kwargs):
@@ -9,6 +13,13 @@ def MockEvent(simEngine, **kwargs):
     kwargs['data']['processed'] = True
 
 
+@engine.eventHandler('log', 'name')
+def MockPayloadEvent(simEngine, payload):
+    """Payload event handler used for unit testing purposes."""
+    log, name = payload
+    log.append((simEngine.currentTime(), name))
+
+
 class TestDiscreteEventSimulationEngine(unittest.TestCase):
     """Unit tests for DiscreteEventSimulationEngine."""
 
@@ -107,6 +118,235 @@ class TestDiscreteEventSimulationEngine(unittest.TestCase):
         self.assertEqual(
             earlierTestEvent.timestamp, self.simEngine.currentTime())
 
+    def test_scheduleAt_tieBreaking(self):
+        """Tests ordering of payload events with equal timestamps."""
+        log = []
+        self.simEngine.scheduleAt(5, MockPayloadEvent, (log, 'first'))
+        self.simEngine.scheduleAt(5, MockPayloadEvent, (log, 'second'))
+        self.simEngine.scheduleAt(5, MockPayloadEvent, (log, 'urgent'),
+                                  priority=-1)
+        self.simEngine.scheduleAt(1, MockPayloadEvent, (log, 'earliest'))
+        self.simEngine.scheduleAt(5, MockPayloadEvent, (log, 'third'))
+
+        self.simEngine.runSimulation()
+
+        # Events are processed by timestamp, then priority, then in the
+        # order in which they were scheduled.
+        self.assertEqual(
+            [(1, 'earliest'), (5, 'urgent'), (5, 'first'), (5, 'second'),
+             (5, 'third')], log)
+        self.assertEqual(5, self.simEngine.numEventsProcessed)
+
+    def test_FEL_payloadEvents(self):
+        """Tests that payload events are presented as DiscreteEvents."""
+        log = []
+        self.simEngine.scheduleAt(3, MockPayloadEvent, (log, 'event'))
+
+        events = self.simEngine.FEL
+        self.assertEqual(1, len(events))
+        self.assertEqual(MockPayloadEvent, events[0].handler)
+        self.assertEqual(3, events[0].timestamp)
+        self.assertEqual(
+            {'log': log, 'name': 'event'}, events[0].handlerKwargs)
+
+    def test_attachStream(self):
+        """Tests merging a presorted event stream with the FEL."""
+        log = []
+        self.simEngine.scheduleAt(2, MockPayloadEvent, (log, 'fel-2'))
+        self.simEngine.scheduleAt(4, MockPayloadEvent, (log, 'fel-4'))
+        self.simEngine.attachStream(
+            [1, 2, 4, 6], MockPayloadEvent,
+            [(log, 'stream-1'), (log, 'stream-2'), (log, 'stream-4'),
+             (log, 'stream-6')])
+
+        # Stream events never enter the FEL.
+        self.assertEqual(2, len(self.simEngine.FEL))
+        self.simEngine.runSimulation(maxEvents=3)
+        self.assertEqual(
+            [(1, 'stream-1'), (2, 'stream-2'), (2, 'fel-2')], log)
+
+        # Stream events precede FEL events with the same timestamp.
+        self.simEngine.runSimulation()
+        self.assertEqual(
+            [(1, 'stream-1'), (2, 'stream-2'), (2, 'fel-2'),
+             (4, 'stream-4'), (4, 'fel-4'), (6, 'stream-6')], log)
+        self.assertEqual(6, self.simEngine.currentTime())
+
+
+    def test_runSimulation_untilTime(self):
+        """Tests pausing the simulation at a given time."""
+        log = []
+        for timestamp in (1, 5, 12):
+            self.simEngine.scheduleAt(
+                timestamp, MockPayloadEvent, (log, 'fel'))
+        self.simEngine.attachStream(
+            [3, 5, 14], MockPayloadEvent,
+            [(log, 'stream'), (log, 'stream'), (log, 'stream')])
+
+        # Events at the pause time are processed.
+        self.simEngine.runSimulation(untilTime=5)
+        self.assertEqual(
+            [(1, 'fel'), (3, 'stream'), (5, 'stream'), (5, 'fel')], log)
+        self.assertEqual(5, self.simEngine.currentTime())
+
+        # The clock advances to the pause time without events.
+        self.simEngine.runSimulation(untilTime=10)
+        self.assertEqual(4, len(log))
+        self.assertEqual(10, self.simEngine.currentTime())
+
+        self.simEngine.runSimulation()
+        self.assertEqual([(12, 'fel'), (14, 'stream')], log[4:])
+
+    def test_runUntil_finalizers(self):
+        """Tests that finalizers follow all events at the horizon."""
+        log = []
+
+        @engine.eventHandler('log', 'name')
+        def scheduleAtSameTime(simEngine, payload):
+            # An event scheduled at the horizon precedes the finalizer.
+            simEngine.scheduleAt(simEngine.simTime, MockPayloadEvent,
+                                 (payload[0], 'late'), priority=100)
+        self.simEngine.addFinalizer(10, MockPayloadEvent, (log, 'final'))
+        self.simEngine.scheduleAt(10, scheduleAtSameTime, (log, None))
+        self.simEngine.scheduleAt(15, MockPayloadEvent, (log, 'after'))
+
+        self.assertTrue(self.simEngine.runUntil(10))
+        self.assertEqual([(10, 'late'), (10, 'final')], log)
+        self.assertEqual(15, self.simEngine.nextEventTime())
+
+        # The clock advances to the horizon when no events remain.
+        self.assertTrue(self.simEngine.runUntil(20))
+        self.assertEqual((15, 'after'), log[-1])
+        self.assertEqual(20, self.simEngine.currentTime())
+        self.assertEqual(None, self.simEngine.nextEventTime())
+
+    def test_pause(self):
+        """Tests pausing a run from a handler and resuming it in slices."""
+        log = []
+
+        @engine.eventHandler('log', 'name')
+        def pauseEvent(simEngine, payload):
+            payload[0].append((simEngine.simTime, 'pause'))
+            simEngine.pause()
+        for timestamp in range(1, 10):
+            self.simEngine.scheduleAt(timestamp, MockPayloadEvent,
+                                      (log, 'fel'))
+        self.simEngine.attachStream([2.5, 7.5], MockPayloadEvent,
+                                    [(log, 'stream'), (log, 'stream')])
+        self.simEngine.scheduleAt(3, pauseEvent, (log, None), priority=1)
+
+        # The run stops after the pausing event.
+        self.assertFalse(self.simEngine.runUntil(8))
+        self.assertEqual((3, 'pause'), log[-1])
+        self.assertEqual(3, self.simEngine.currentTime())
+
+        # The run resumes in slices, which end when no events remain.
+        slices = self.simEngine.runSlices(2)
+        self.assertEqual(5, next(slices))
+        self.assertEqual((5, 'fel'), log[-1])
+        self.assertEqual(6, self.simEngine.nextEventTime())
+        self.assertEqual([7, 9], list(self.simEngine.runSlices(2)))
+        self.assertEqual(12, len(log))
+        self.assertEqual([t for t, _ in log], sorted(t for t, _ in log))
+
+    def test_shiftTime(self):
+        """Tests moving the time origin of a paused simulation."""
+        customFEL = fel.BucketFEL(bucketWidth=5.0, numBuckets=16)
+        for backend in (fel.HEAP, fel.BUCKET, customFEL):
+            log = []
+            simEngine = engine.DiscreteEventSimulationEngine(backend)
+            for timestamp, name in ((5, 'a'), (12, 'b'), (12, 'c'),
+                                    (30, 'd')):
+                simEngine.scheduleAt(
+                    timestamp, MockPayloadEvent, (log, name))
+            simEngine.attachStream(
+                [3, 20], MockPayloadEvent, [(log, 'e'), (log, 'f')])
+            simEngine.runSimulation(untilTime=10)
+            simEngine.shiftTime(10)
+            self.assertEqual(0, simEngine.currentTime())
+
+            # Pending events keep their order.
+            simEngine.runSimulation()
+            self.assertEqual(
+                [(3, 'e'), (5, 'a'), (2, 'b'), (2, 'c'), (10, 'f'),
+                 (20, 'd')], log)
+        # A configured backend keeps its configuration.
+        self.assertIs(customFEL, simEngine._fel)
+        self.assertEqual(5.0, customFEL._width)
+        self.assertEqual(16, len(customFEL._buckets))
+
+    def test_snapshot(self):
+        """Tests forking, saving and loading snapshots."""
+        log = []
+        shared = ['read-only']
+        for timestamp in (1, 5):
+            self.simEngine.scheduleAt(
+                timestamp, MockPayloadEvent, (log, 'fel'))
+        self.simEngine.attachStream(
+            [3, 7], MockPayloadEvent, [(log, 'stream'), (log, 'stream')])
+        self.simEngine.runSimulation(untilTime=4)
+        snapshot = engine.Snapshot(
+            self.simEngine, {'log': log, 'shared': shared}, shared=[shared],
+            metadata={'name': 'test'})
+        self.assertEqual(4, snapshot.simTime)
+
+        # Forks are independent copies, except for the shared objects.
+        for _ in range(2):
+            simEngine, state = snapshot.fork()
+            self.assertIs(shared, state['shared'])
+            simEngine.runSimulation()
+            self.assertEqual(
+                [(1, 'fel'), (3, 'stream'), (5, 'fel'), (7, 'stream')],
+                state['log'])
+        self.assertEqual(2, len(log))
+
+        tempDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempDir)
+        filename = os.path.join(tempDir, 'snapshot.pkl')
+        snapshot.save(filename)
+        otherShared = ['reloaded']
+        loaded = engine.Snapshot.load(
+            filename, lambda metadata: [otherShared])
+        self.assertEqual({'name': 'test'}, loaded.metadata)
+        self.assertEqual(4, loaded.simTime)
+        simEngine, state = loaded.fork()
+        self.assertIs(otherShared, state['shared'])
+        simEngine.runSimulation()
+        self.assertEqual(4, len(state['log']))
+        self.assertRaises(ValueError, engine.Snapshot.load, filename, [])
+
+    def test_instrumentation(self):
+        """Tests the per-handler and throughput statistics."""
+        # Instrumentation is disabled by default.
+        self.assertIsNone(self.simEngine.instrumentation)
+        instrumentation = self.simEngine.enableInstrumentation(
+            windowDuration=10)
+
+        log = []
+        data = {'processed': False}
+        for timestamp in (1, 5, 12):
+            self.simEngine.scheduleAt(
+                timestamp, MockPayloadEvent, (log, 'fel'))
+        self.simEngine.schedule(engine.DiscreteEvent(MockEvent, 25, data=data))
+        self.simEngine.attachStream(
+            [3, 14], MockPayloadEvent, [(log, 'stream'), (log, 'stream')])
+        self.simEngine.runSimulation()
+        self.assertTrue(data['processed'])
+
+        report = instrumentation.report()
+        self.assertEqual(6, report['numEvents'])
+        # The FEL size is sampled after each event, so the high-water mark
+        # excludes the first event popped.
+        self.assertEqual(3, report['felHighWaterMark'])
+        self.assertEqual({'MockPayloadEvent', 'MockEvent'},
+                         set(report['handlers']))
+        self.assertEqual(5, report['handlers']['MockPayloadEvent']['count'])
+        self.assertEqual(1, report['handlers']['MockEvent']['count'])
+        self.assertAlmostEqual(
+            1.0, sum(h['fraction'] for h in report['handlers'].values()))
+        self.assertEqual([0, 10, 20], list(report['windows'].start))
+        self.assertEqual([3, 2, 1], list(report['windows'].numEvents))
+        self.assertTrue((report['windows'].wallTime >= 0).all())
 
 if __name__ == '__main__':
     unittest.main()
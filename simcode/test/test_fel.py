@@ -0,0 +1,119 @@
+"""Tests for the future event list backends."""
+
+# Standard libs.
+import random
+import unittest
+
+# App libs.
+import simcode.src.fel as fel
+
+
+BACKENDS = (fel.HEAP, fel.CALENDAR, fel.BUCKET)
+
+
+def _randomWorkload(seed, numOperations=5000):
+    """Returns a random sequence of FEL operations.
+
+    Each operation is either an entry to push or None for a pop. Timestamps
+    are drawn from a few scales and include duplicates and negative values.
+    """
+    rng = random.Random(seed)
+    operations = []
+    size = 0
+    now = 0.0
+    for seq in range(numOperations):
+        if size and rng.random() < 0.45:
+            operations.append(None)
+            size -= 1
+            continue
+        scale = rng.choice((0.01, 1.0, 100.0, 10000.0))
+        if rng.random() < 0.2:
+            # Equal timestamps are broken by priority and then by seq.
+            timestamp = float(int(now))
+        elif rng.random() < 0.05:
+            timestamp = -rng.random() * scale
+        else:
+            timestamp = now + rng.random() * scale
+        operations.append((timestamp, rng.randint(-2, 2), seq, None, None))
+        size += 1
+        now += rng.random()
+    return operations
+
+
+class TestFELBackends(unittest.TestCase):
+    """Unit tests for the FEL backends."""
+
+    def test_backends_popInTupleOrder(self):
+        """Tests that all backends pop entries in increasing tuple order."""
+        for seed in range(5):
+            operations = _randomWorkload(seed)
+            for backend in BACKENDS:
+                eventList = fel.makeFEL(backend)
+                reference = []
+                for operation in operations:
+                    if operation is None:
+                        self.assertEqual(min(reference), eventList.first())
+                        entry = eventList.pop()
+                        self.assertEqual(min(reference), entry)
+                        reference.remove(entry)
+                    else:
+                        eventList.push(operation)
+                        reference.append(operation)
+                    self.assertEqual(len(reference), len(eventList))
+                self.assertEqual(sorted(reference),
+                                 sorted(eventList.entries()))
+                # Drain the remaining entries.
+                drained = [eventList.pop() for _ in range(len(eventList))]
+                self.assertEqual(sorted(reference), drained)
+
+    def test_backends_nonMonotonicPushes(self):
+        """Tests pushing entries earlier than the last popped entry."""
+        for backend in BACKENDS:
+            eventList = fel.makeFEL(backend)
+            for seq, timestamp in enumerate([5000.0, 10.0, 20.0, 3.5]):
+                eventList.push((timestamp, 0, seq, None, None))
+            self.assertEqual(3.5, eventList.pop()[0])
+            eventList.push((1.0, 0, 4, None, None))
+            eventList.push((15000.0, 0, 5, None, None))
+            self.assertEqual([1.0, 10.0, 20.0, 5000.0, 15000.0],
+                             [eventList.pop()[0] for _ in range(5)])
+
+    def test_backends_empty(self):
+        """Tests first and pop on an empty FEL."""
+        for backend in BACKENDS:
+            eventList = fel.makeFEL(backend)
+            self.assertIsNone(eventList.first())
+            self.assertEqual(0, len(eventList))
+            self.assertRaises(IndexError, eventList.pop)
+
+    def test_backends_clear(self):
+        """Tests that clearing a FEL keeps its configuration."""
+        for backend in BACKENDS + (
+                fel.BucketFEL(bucketWidth=5.0, numBuckets=16),):
+            eventList = fel.makeFEL(backend)
+            for seq, timestamp in enumerate([1000.0, 10.0, 20.0, 3.5]):
+                eventList.push((timestamp, 0, seq, None, None))
+            eventList.pop()
+            eventList.clear()
+            self.assertEqual(0, len(eventList))
+            self.assertIsNone(eventList.first())
+            for seq, timestamp in enumerate([8.0, 2.0, 500.0]):
+                eventList.push((timestamp, 0, seq, None, None))
+            self.assertEqual([2.0, 8.0, 500.0],
+                             [eventList.pop()[0] for _ in range(3)])
+        # The bucket width and number of buckets are unchanged.
+        self.assertEqual(5.0, eventList._width)
+        self.assertEqual(16, len(eventList._buckets))
+
+    def test_makeFEL(self):
+        """Tests creating FELs by name and from instances."""
+        self.assertIsInstance(fel.makeFEL(fel.HEAP), fel.HeapFEL)
+        self.assertIsInstance(fel.makeFEL(fel.CALENDAR), fel.CalendarQueueFEL)
+        self.assertIsInstance(fel.makeFEL(fel.BUCKET), fel.BucketFEL)
+        eventList = fel.BucketFEL(bucketWidth=10.0)
+        self.assertIs(eventList, fel.makeFEL(eventList))
+        self.assertRaises(ValueError, fel.makeFEL, 'unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""Tests for the fluid surrogate model."""
+
+# Standard libs.
+import unittest
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+import simcode.src.fluid as fluid
+import simcode.test.test_nycbike as test_nycbike
+
+
+class TestFluidModel(unittest.TestCase):
+    """Unit tests for the fluid model."""
+
+    def setUp(self):
+        """Builds a model of the simulation test data."""
+        self.testData = test_nycbike.TestBikeSharingSimulation
+        self.model = self._model(self.testData.TEST_DEST_PROBS)
+
+    def _model(self, destinationP, **kwargs):
+        """Helper method used to build a model of the test data."""
+        kwargs.setdefault('racksPerStation', 3)
+        kwargs.setdefault('scaleArrivalRate', 20)
+        return fluid.FluidModel(
+            np.array(self.testData.TEST_TRIP_COUNT_DATA),
+            self.testData.TEST_TRIP_DURATIONS, destinationP, **kwargs)
+
+    def test_evaluate_shapes(self):
+        """Tests the shapes of batched and single evaluations."""
+        statistics = self.model.evaluate(np.array([[2, 0, 1], [1, 1, 1]]))
+        self.assertEqual((2,), statistics['Revenue'].shape)
+        self.assertEqual((2,), statistics['BikesLost'].shape)
+        for name in ('TimeWaitForDropoff', 'TimeWaitForCycle',
+                     'CustomersLost', 'IdleTime'):
+            self.assertEqual((2, 3), statistics[name].shape)
+
+        statistics = self.model.evaluate(np.array([2, 0, 1]))
+        self.assertEqual((), np.shape(statistics['Revenue']))
+        self.assertEqual((3,), statistics['IdleTime'].shape)
+
+    def test_evaluate_batchMatchesSingle(self):
+        """Tests that batching and chunking do not change the estimates."""
+        distributions = fluid.randomDistributions(
+            5, 3, totalNumBikes=5, racksPerStation=3,
+            rng=np.random.RandomState(1))
+        batch = self.model.evaluate(distributions, chunkSize=2)
+        for i, distribution in enumerate(distributions):
+            single = self.model.evaluate(distribution)
+            for name, value in single.items():
+                np.testing.assert_allclose(value, batch[name][i])
+
+    def test_evaluate_sparseMatchesDense(self):
+        """Tests the model with sparse destination probabilities."""
+        sparseModel = self._model(load_trip_stats.SparseDestinationP.fromDense(
+            self.testData.TEST_DEST_PROBS))
+        distributions = np.array([[2, 0, 1], [0, 3, 0]])
+        dense = self.model.evaluate(distributions)
+        sparse = sparseModel.evaluate(distributions)
+        # Sparse probabilities are stored in single precision.
+        for name, value in dense.items():
+            np.testing.assert_allclose(value, sparse[name], rtol=1e-5)
+
+    def test_evaluate_bounds(self):
+        """Tests that the model never creates bikes or racks."""
+        # One timeframe, so that every ride docks before the end of the day.
+        model = fluid.FluidModel(
+            np.array([[600.0], [600.0], [0.0]]),
+            self.testData.TEST_TRIP_DURATIONS,
+            self.testData.TEST_DEST_PROBS[:, :1, :], racksPerStation=3,
+            bikeLossProb=0.0)
+        statistics = model.evaluate(np.array([2.0, 1.0, 0.0]))
+        self.assertEqual(0, statistics['BikesLost'])
+        self.assertGreater(statistics['Revenue'], 0)
+        dayLength = model.numSteps * model.timeStep
+        # Idle bikes never exceed the racks of a station or the bikes.
+        self.assertTrue(np.all(statistics['IdleTime'] <= 3 * dayLength))
+        self.assertLessEqual(statistics['IdleTime'].sum(), 3 * dayLength)
+        for name, value in statistics.items():
+            self.assertTrue(np.all(value >= 0), name)
+
+    def test_randomDistributions(self):
+        """Tests the totals and rack limits of random distributions."""
+        distributions = fluid.randomDistributions(
+            50, 4, totalNumBikes=10, racksPerStation=3, concentration=0.1,
+            rng=np.random.RandomState(0))
+        self.assertEqual((50, 4), distributions.shape)
+        np.testing.assert_array_equal(10, distributions.sum(axis=1))
+        self.assertLessEqual(distributions.max(), 3)
+
+    def test_rankCorrelation(self):
+        """Tests the Spearman rank correlation."""
+        self.assertAlmostEqual(
+            1.0, fluid.rankCorrelation([1, 2, 10], [0.1, 5, 6]))
+        self.assertAlmostEqual(
+            -1.0, fluid.rankCorrelation([1, 2, 10], [6, 5, 0.1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+"""Tests for loading and caching the Citi Bike trip statistics."""
+
+# Standard libs.
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+
+
+class TestLoadTripStatistics(unittest.TestCase):
+    """Unit tests for the trip statistics cache."""
+
+    def setUp(self):
+        """Writes small trip statistics files to a temporary directory."""
+        load_trip_stats.clearTripStatisticsCache()
+        self.tripDataDir = tempfile.mkdtemp()
+        self.tripCountData = np.array([[1, 2], [3, 4]])
+        self.tripDurations = np.array([[0.0, 1.5], [2.5, 0.0]])
+        self.destinationP = np.array([
+            [[0.0, 1.0], [0.0, 1.0]],
+            [[1.0, 0.0], [1.0, 0.0]],
+        ])
+        self._writeFiles()
+
+    def tearDown(self):
+        """Removes the temporary directory and clears the cache."""
+        load_trip_stats.clearTripStatisticsCache()
+        shutil.rmtree(self.tripDataDir)
+
+    def _writeFiles(self):
+        """Helper method used to save the test statistics."""
+        for filename, array in (
+                (load_trip_stats.TRIP_COUNT_FILENAME, self.tripCountData),
+                (load_trip_stats.TRIP_DURATION_FILENAME, self.tripDurations),
+                (load_trip_stats.DESTINATION_PROBS_FILENAME,
+                 self.destinationP)):
+            np.save(os.path.join(self.tripDataDir, filename), array)
+
+    def test_loadTripStatistics_cached(self):
+        """Tests that statistics are loaded once and memory-mapped."""
+        stats = load_trip_stats.loadTripStatistics(self.tripDataDir)
+        np.testing.assert_array_equal(self.tripCountData, stats[0])
+        np.testing.assert_array_equal(self.tripDurations, stats[1])
+        np.testing.assert_array_equal(self.destinationP, stats[2])
+
+        # The arrays are read-only memory maps.
+        for array in stats:
+            self.assertTrue(isinstance(array, np.memmap))
+            self.assertFalse(array.flags.writeable)
+
+        # The second call returns the cached arrays.
+        self.assertTrue(
+            stats is load_trip_stats.loadTripStatistics(self.tripDataDir))
+
+        # Clearing the cache forces a reload.
+        load_trip_stats.clearTripStatisticsCache()
+        self.assertFalse(
+            stats is load_trip_stats.loadTripStatistics(self.tripDataDir))
+
+    def test_loadTripStatistics_noCache(self):
+        """Tests loading statistics without the cache."""
+        stats = load_trip_stats.loadTripStatistics(
+            self.tripDataDir, useCache=False)
+        self.assertFalse(isinstance(stats[0], np.memmap))
+        self.assertFalse(
+            stats is load_trip_stats.loadTripStatistics(
+                self.tripDataDir, useCache=False))
+
+    def test_loadTripStatistics_modifiedFiles(self):
+        """Tests that modified files invalidate the cache."""
+        stats = load_trip_stats.loadTripStatistics(self.tripDataDir)
+        artifact = load_trip_stats.getDerivedArtifact(
+            self.tripDataDir, 'test', 1, lambda: ['artifact'])
+
+        # The trip counts are regenerated on disk.
+        self.tripCountData = self.tripCountData * 2
+        self._writeFiles()
+        countPath = os.path.join(
+            self.tripDataDir, load_trip_stats.TRIP_COUNT_FILENAME)
+        mtime = os.stat(countPath).st_mtime_ns + 10 ** 9
+        os.utime(countPath, ns=(mtime, mtime))
+
+        reloaded = load_trip_stats.loadTripStatistics(self.tripDataDir)
+        self.assertFalse(stats is reloaded)
+        np.testing.assert_array_equal(self.tripCountData, reloaded[0])
+        # Derived artifacts are recomputed.
+        self.assertFalse(artifact is load_trip_stats.getDerivedArtifact(
+            self.tripDataDir, 'test', 1, lambda: ['artifact']))
+
+    def test_loadTripStatistics_extractMissingFiles(self):
+        """Tests extracting the files missing from a fresh checkout."""
+        # The archive holds all files, but only the trip counts are
+        # present, as in a fresh checkout of the repository.
+        with zipfile.ZipFile(os.path.join(
+                self.tripDataDir, load_trip_stats.TRIP_STATS_ZIP_FILENME),
+                'w') as zipRef:
+            for filename in (load_trip_stats.TRIP_COUNT_FILENAME,
+                             load_trip_stats.TRIP_DURATION_FILENAME,
+                             load_trip_stats.DESTINATION_PROBS_FILENAME):
+                zipRef.write(
+                    os.path.join(self.tripDataDir, filename), filename)
+        for filename in (load_trip_stats.TRIP_DURATION_FILENAME,
+                         load_trip_stats.DESTINATION_PROBS_FILENAME):
+            os.remove(os.path.join(self.tripDataDir, filename))
+
+        stats = load_trip_stats.loadTripStatistics(self.tripDataDir)
+        np.testing.assert_array_equal(self.tripCountData, stats[0])
+        np.testing.assert_array_equal(self.tripDurations, stats[1])
+        np.testing.assert_array_equal(self.destinationP, stats[2])
+
+    def test_getDerivedArtifact_lruEviction(self):
+        """Tests that derived artifacts are evicted least recently used."""
+        calls = []
+
+        def factory(value):
+            calls.append(value)
+            return [value]
+
+        cacheSize = load_trip_stats.DERIVED_CACHE_SIZE
+        for value in range(cacheSize):
+            load_trip_stats.getDerivedArtifact(
+                self.tripDataDir, 'test', value, lambda: factory(value))
+        self.assertEqual(cacheSize, len(calls))
+
+        # Cached artifacts are not recomputed. Accessing the first artifact
+        # makes it the most recently used.
+        load_trip_stats.getDerivedArtifact(
+            self.tripDataDir, 'test', 0, lambda: factory(0))
+        self.assertEqual(cacheSize, len(calls))
+
+        # A new artifact evicts the least recently used one.
+        load_trip_stats.getDerivedArtifact(
+            self.tripDataDir, 'test', cacheSize, lambda: factory(cacheSize))
+        load_trip_stats.getDerivedArtifact(
+            self.tripDataDir, 'test', 0, lambda: factory(0))
+        self.assertEqual(cacheSize + 1, len(calls))
+        load_trip_stats.getDerivedArtifact(
+            self.tripDataDir, 'test', 1, lambda: factory(1))
+        self.assertEqual(cacheSize + 2, len(calls))
+
+
+class TestSparseDestinationP(unittest.TestCase):
+    """Unit tests for the sparse destination probabilities format."""
+
+    # Destination probabilites used in tests.
+    # Entry [i][j][k] is the probability of choosing station k as the
+    # destination from station i during time frame j.
+    TEST_DEST_PROBS = np.array([
+        [[0.0, 0.0, 1.0], [0.0, 0.4, 0.6]],
+        [[0.3, 0.0, 0.7], [0.0, 0.0, 0.0]],
+        [[0.5, 0.5, 0.0], [0.5, 0.5, 0.0]],
+    ])
+
+    def test_fromDense(self):
+        """Tests conversion between dense and sparse probabilities."""
+        sparseP = load_trip_stats.SparseDestinationP.fromDense(
+            self.TEST_DEST_PROBS)
+        self.assertEqual(self.TEST_DEST_PROBS.shape, sparseP.shape)
+        # Only non-zero probabilities are stored.
+        self.assertEqual(9, len(sparseP.probs))
+        self.assertEqual(np.int16, sparseP.indices.dtype)
+        self.assertEqual(np.float32, sparseP.probs.dtype)
+
+        indices, probs = sparseP.row(0, 1)
+        np.testing.assert_array_equal([1, 2], indices)
+        np.testing.assert_allclose([0.4, 0.6], probs)
+        # Rows without trips are empty.
+        self.assertEqual(0, len(sparseP.row(1, 1)[0]))
+
+        np.testing.assert_allclose(
+            self.TEST_DEST_PROBS, sparseP.toDense(), rtol=1e-6)
+
+    def test_sample(self):
+        """Tests selecting destinations from the sparse probabilities."""
+        sparseP = load_trip_stats.SparseDestinationP.fromDense(
+            self.TEST_DEST_PROBS)
+        # The uniform variate selects destinations by cumulative probability.
+        self.assertEqual(2, sparseP.sample(0, 0, 0.99))
+        self.assertEqual(1, sparseP.sample(0, 1, 0.1))
+        self.assertEqual(2, sparseP.sample(0, 1, 0.5))
+        self.assertEqual(0, sparseP.sample(2, 0, 0.25))
+        self.assertEqual(1, sparseP.sample(2, 0, 0.75))
+        # There is no destination for rows without trips.
+        self.assertRaises(ValueError, sparseP.sample, 1, 1, 0.5)
+
+    def test_convertToSparse(self):
+        """Tests converting the zipped dense statistics."""
+        tripDataDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tripDataDir)
+        load_trip_stats.clearTripStatisticsCache()
+        self.addCleanup(load_trip_stats.clearTripStatisticsCache)
+
+        # Only the zip archive of the dense statistics exists.
+        with zipfile.ZipFile(os.path.join(
+                tripDataDir, load_trip_stats.TRIP_STATS_ZIP_FILENME),
+                'w') as zipRef:
+            for filename, array in (
+                    (load_trip_stats.TRIP_COUNT_FILENAME, np.ones((3, 2))),
+                    (load_trip_stats.TRIP_DURATION_FILENAME, np.ones((3, 3))),
+                    (load_trip_stats.DESTINATION_PROBS_FILENAME,
+                     self.TEST_DEST_PROBS)):
+                path = os.path.join(tripDataDir, filename)
+                np.save(path, array)
+                zipRef.write(path, filename)
+                os.remove(path)
+
+        tripCountData, tripDurations, destinationP = (
+            load_trip_stats.loadTripStatistics(tripDataDir, sparse=True))
+        self.assertTrue(
+            isinstance(destinationP, load_trip_stats.SparseDestinationP))
+        np.testing.assert_allclose(
+            self.TEST_DEST_PROBS, destinationP.toDense(), rtol=1e-6)
+        # The dense probabilities were never extracted.
+        self.assertFalse(os.path.exists(os.path.join(
+            tripDataDir, load_trip_stats.DESTINATION_PROBS_FILENAME)))
+        self.assertTrue(os.path.exists(os.path.join(
+            tripDataDir, load_trip_stats.SPARSE_DESTINATION_PROBS_FILENAME)))
+
+
+if __name__ == '__main__':
+    unittest.main()
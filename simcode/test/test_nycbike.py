@@ -1,14 +1,25 @@
 """Tests for the Citi Bike Sharing simulation application."""
 
 # Standard libs.
+import copy
+import logging
+import os
+import shutil
+import tempfile
 import unittest
 
 # Third-party libs.
 import numpy as np
 
 # App libs.
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
 import simcode.src.engine as engine
+import simcode.src.fel as fel
 import simcode.src.nycbike as nycbike
+import simcode.src.randomness as randomness
+import simcode.src.sampling as sampling
+import simcode.src.telemetry as telemetry
+import simcode.src.tracing as tracing
 
 
 class TestBikeSharingSimulation(unittest.TestCase):
@@ -60,12 +71,15 @@ class TestBikeSharingSimulation(unittest.TestCase):
 
     def _initGlobalData(self, numStations, initEntities=True):
         # Global data structures.
-        stations = []
-        pickupQueues = []
-        dropoffQueues = []
+        stations = nycbike.StationTable()
+        pickupQueues = nycbike.QueueTable()
+        dropoffQueues = nycbike.QueueTable()
         if initEntities:
             stations, pickupQueues, dropoffQueues = self._initEntities(
                 self.TEST_NUM_STATIONS)
+            stations = nycbike.StationTable(stations)
+            pickupQueues = nycbike.QueueTable(pickupQueues)
+            dropoffQueues = nycbike.QueueTable(dropoffQueues)
 
         # Simulation statistics used in tests.
         statistics = {
@@ -84,16 +98,429 @@ class TestBikeSharingSimulation(unittest.TestCase):
             'pickupQueues': pickupQueues,
             'dropoffQueues': dropoffQueues,
             # Citi bike dataset statistics.
-            'arrivalTimes': self.TEST_TRIP_COUNT_DATA,
+            'arrivalTimes': nycbike.ArrivalSchedule.fromLists(
+                self.TEST_TRIP_COUNT_DATA),
+            'mergedArrivals': False,
             'tripDurations': self.TEST_TRIP_DURATIONS,
             'destinationP': self.TEST_DEST_PROBS,
+            'destinationSampler': sampling.makeSampler(self.TEST_DEST_PROBS),
+            'random': randomness.makeRandomStream(randomness.SCALAR),
             # Simulation statistics.
             'statistics': statistics,
+            'trace': None,
             # Constants.
             'bikeLossProb': 0.0,  # use zero for testing
         }
         return TEST_GLOBAL_DATA
 
+    def test_stationTable(self):
+        """Tests that stations are views of the station table columns."""
+        stations = nycbike.StationTable([nycbike.Station(0, 5, 2)])
+        stations.extend(4, [1, 4])
+        self.assertEqual(3, len(stations))
+        self.assertEqual([2, 1, 4], [s.numBikes for s in stations])
+        self.assertEqual([3, 3, 0], [s.numRacks for s in stations])
+        self.assertEqual(2, stations[2].stationID)
+        self.assertRaises(AssertionError, stations.extend, 4, [5])
+
+        # Views and columns share the state.
+        stations[1].numBikes -= 1
+        stations.numRacks[1] += 1
+        stations[0].lastEvent = 10
+        arrays = stations.arrays()
+        np.testing.assert_array_equal([2, 0, 4], arrays['numBikes'])
+        np.testing.assert_array_equal([3, 4, 0], arrays['numRacks'])
+
+        # Idle time is counted for all stations at once.
+        idleTime = np.zeros(3)
+        stations.accumulateIdleTime(idleTime, 20)
+        np.testing.assert_array_equal([20, 0, 80], idleTime)
+        np.testing.assert_array_equal([20, 20, 20], arrays['lastEvent'])
+        del arrays
+
+        # Copies have their own state.
+        copied = copy.deepcopy(stations)
+        copied[0].numBikes = 0
+        self.assertEqual(2, stations[0].numBikes)
+        self.assertEqual([0, 0, 4], list(copied.numBikes))
+
+    def test_queueTable(self):
+        """Tests that queues are views of the queue table deques."""
+        queues = nycbike.QueueTable([nycbike.Queue()])
+        queues.extend(2)
+        customers = [nycbike.Customer() for _ in range(3)]
+        queues[0].put(customers[0])
+        queues.queues[2].extend(customers[1:])
+        np.testing.assert_array_equal([1, 0, 2], queues.lengths())
+        self.assertTrue(customers[2] in queues[2])
+
+        # Copies keep the order of the customers in every queue.
+        copied = copy.deepcopy(queues)
+        np.testing.assert_array_equal([1, 0, 2], copied.lengths())
+        self.assertEqual([customers[1].customerID, customers[2].customerID],
+                         [c.customerID for c in copied.queues[2]])
+        copied[2].remove()
+        self.assertEqual(2, len(queues[2]))
+
+    def test_computeArrivalTimes(self):
+        """Tests that arrivals are spaced evenly within timeframes."""
+        schedule = nycbike.BikeSharingSimulation().computeArrivalTimes(
+            np.array(self.TEST_TRIP_COUNT_DATA))
+        self.assertEqual(self.TEST_NUM_STATIONS, len(schedule))
+        self.assertEqual(
+            np.sum(self.TEST_TRIP_COUNT_DATA), len(schedule.times))
+
+        # Timeframes are quarterly (360 minutes).
+        expectedTimes = [0, 90, 180, 270, 360, 720, 900, 1080, 1200, 1320]
+        self.assertEqual(10, schedule.numRemaining(0))
+        actualTimes = []
+        while schedule.numRemaining(0) > 0:
+            actualTimes.append(schedule.nextArrival(0)[0])
+        np.testing.assert_allclose(expectedTimes, actualTimes)
+        # All arrivals at the station have been consumed.
+        self.assertEqual(None, schedule.nextArrival(0))
+
+        # Other stations and copies of the schedule are unaffected.
+        self.assertEqual(11, schedule.numRemaining(1))
+        self.assertEqual(10, schedule.copy().numRemaining(0))
+        self.assertEqual(0.0, schedule.copy().nextArrival(0)[0])
+
+    def test_computePoissonArrivalTimes(self):
+        """Tests that Poisson arrivals are sorted within their timeframes."""
+        arrivalRates = np.array([[400.0, 0, 100.0, 0], [0, 0, 0, 0],
+                                 [0.5, 0.5, 0.5, 0.5]])
+        np.random.seed(0)
+        schedule = nycbike.BikeSharingSimulation().computePoissonArrivalTimes(
+            arrivalRates)
+        np.random.seed(0)
+        expectedCounts = np.random.poisson(arrivalRates)
+        self.assertEqual(3, len(schedule))
+        self.assertEqual(expectedCounts.sum(), schedule.numArrivals())
+        self.assertEqual(0, schedule.numRemaining(1))
+
+        # Timeframes are quarterly (360 minutes).
+        times = schedule.times[:schedule.offsets[1]]
+        self.assertTrue(np.all(np.diff(times) >= 0))
+        np.testing.assert_array_equal(
+            expectedCounts[0],
+            np.bincount((times // 360).astype(int), minlength=4))
+        # Arrivals are uniform within the timeframe.
+        self.assertAlmostEqual(180, times[times < 360].mean(), delta=30)
+        self.assertTrue(np.all(np.diff(schedule.times[schedule.offsets[2]:])
+                               >= 0))
+
+    def test_run_poissonArrivals(self):
+        """Tests that Poisson arrivals are drawn per seed."""
+        results = [self._runTestSimulation(
+            nycbike.BikeSharingSimulation(), rngSeed=rngSeed,
+            arrivalMode=nycbike.POISSON_ARRIVALS)
+            for rngSeed in (0, 0, 1)]
+        for key in results[0]:
+            np.testing.assert_array_equal(results[0][key], results[1][key])
+        self.assertNotEqual(results[0]['Revenue'], results[2]['Revenue'])
+        self.assertRaises(
+            ValueError, self._runTestSimulation,
+            nycbike.BikeSharingSimulation(), arrivalMode='uniform')
+
+    def test_arrivalSchedule_mergedStream(self):
+        """Tests that the merged stream matches the arrival priorities."""
+        schedule = nycbike.ArrivalSchedule.fromLists(
+            [[0, 5, 10], [0, 2, 10], [7]])
+        times, stationIDs = schedule.mergedStream()
+        # Arrivals are sorted by time and simultaneous arrivals by station.
+        np.testing.assert_array_equal([0, 0, 2, 5, 7, 10, 10], times)
+        np.testing.assert_array_equal([0, 1, 1, 0, 2, 0, 1], stationIDs)
+
+        # Arrivals consumed per station are ordered by priority exactly as
+        # in the merged stream.
+        arrivals = []
+        for stationID in range(len(schedule)):
+            while schedule.numRemaining(stationID) > 0:
+                t, priority = schedule.nextArrival(stationID)
+                arrivals.append((t, priority, stationID))
+        arrivals.sort()
+        self.assertEqual(list(stationIDs), [a[2] for a in arrivals])
+        # Priorities are negative so that arrivals precede other events
+        # with the same timestamp.
+        self.assertTrue(all(a[1] < 0 for a in arrivals))
+
+    def test_arrivalSchedule_arrive(self):
+        """Tests that customers are indexed by station and arrival order."""
+        schedule = nycbike.ArrivalSchedule.fromLists([[0, 5], [], [1, 2, 3]])
+        self.assertEqual(5, schedule.numArrivals())
+        self.assertEqual(2, schedule.arrive(2))
+        self.assertEqual(0, schedule.arrive(0))
+        self.assertEqual(3, schedule.arrive(2))
+        # Copies restart the indices.
+        self.assertEqual(2, schedule.copy().arrive(2))
+
+    def test_run_commonRandomNumbers(self):
+        """Tests the common random number mode."""
+        results = [self._runTestSimulation(
+            nycbike.BikeSharingSimulation(), randomMode=randomness.COMMON)
+            for _ in range(2)]
+        for key in results[0]:
+            np.testing.assert_array_equal(results[0][key], results[1][key])
+        self.assertRaises(
+            ValueError, self._runTestSimulation,
+            nycbike.BikeSharingSimulation(), antithetic=True)
+
+        # Antithetic pairs count as one observation.
+        summary = self._runTestSimulation(
+            nycbike.BikeSharingSimulation(), numReplications=4, workers=1,
+            baseSeed=0, antithetic=True)
+        self.assertEqual(2, summary['Revenue']['n'])
+
+    def test_run_mergedArrivals(self):
+        """Tests that merging arrivals into a stream gives equal results."""
+        results = []
+        for mergedArrivals in (False, True):
+            simulation = nycbike.BikeSharingSimulation()
+            results.append(self._runTestSimulation(
+                simulation, mergedArrivals=mergedArrivals))
+        for key in results[0]:
+            np.testing.assert_array_equal(results[0][key], results[1][key])
+        self.assertTrue(results[0]['Revenue'] > 0)
+
+    def test_run_felBackends(self):
+        """Tests that all FEL backends give equal results."""
+        results = []
+        for felBackend in (fel.HEAP, fel.CALENDAR, fel.BUCKET):
+            simulation = nycbike.BikeSharingSimulation()
+            results.append(self._runTestSimulation(
+                simulation, mergedArrivals=False, felBackend=felBackend))
+        for result in results[1:]:
+            for key in results[0]:
+                np.testing.assert_array_equal(results[0][key], result[key])
+
+    def test_run_traceMatchesDebugLog(self):
+        """Tests that a rendered binary trace reproduces the debug log."""
+        # Both runs number their customers from zero.
+        nycbike.Customer.currentCustomerID = 0
+        trace = tracing.TraceRecorder(chunkSize=16)
+        tracedResults = self._runTestSimulation(
+            nycbike.BikeSharingSimulation(), trace=trace)
+
+        nycbike.Customer.currentCustomerID = 0
+        with self.assertLogs(level=logging.DEBUG) as logs:
+            loggedResults = self._runTestSimulation(
+                nycbike.BikeSharingSimulation())
+        debugMessages = [record.getMessage() for record in logs.records
+                         if record.levelno == logging.DEBUG]
+        # The trace has no record of the Initialize event and of the endSim
+        # finalizer.
+        self.assertEqual('T=-1.00, Initialize', debugMessages[0])
+        debugMessages.remove('T=1440.00, endSim')
+        self.assertEqual(debugMessages[1:],
+                         list(tracing.renderTrace(trace.records())))
+
+        for key in tracedResults:
+            np.testing.assert_array_equal(
+                tracedResults[key], loggedResults[key])
+        kinds = trace.records()['kind']
+        self.assertEqual(tracedResults['Revenue'], nycbike.TRIP_COST * (
+            np.sum(kinds == tracing.PICKUP) - np.sum(kinds == tracing.REFUND)))
+
+    def test_run_snapshot(self):
+        """Tests that resuming a snapshot completes the same run."""
+        simulation = nycbike.BikeSharingSimulation()
+        nycbike.Customer.currentCustomerID = 0
+        expected = self._runTestSimulation(simulation)
+
+        nycbike.Customer.currentCustomerID = 0
+        runKwargs = dict(
+            racksPerStation=3, scaleArrivalRate=20, rngSeed=0,
+            tripDataDir=self._saveTestTripData(),
+            initialDistribution=np.array([2, 0, 1]))
+        snapshot = simulation.snapshot(600, **runKwargs)
+        self.assertEqual(600, snapshot.simTime)
+        # A snapshot can be resumed several times.
+        for _ in range(2):
+            results = simulation.resume(snapshot)
+            for key in expected:
+                np.testing.assert_array_equal(expected[key], results[key])
+
+        filename = os.path.join(runKwargs['tripDataDir'], 'snapshot.pkl')
+        snapshot.save(filename)
+        loaded = nycbike.BikeSharingSimulation.loadSnapshot(filename)
+        results = simulation.resume(loaded)
+        for key in expected:
+            np.testing.assert_array_equal(expected[key], results[key])
+
+        # Interventions only change the fork they are applied to.
+        def loseAllBikes(simEngine, globalData):
+            globalData['bikeLossProb'] = 1.0
+        results = simulation.resume(snapshot, intervention=loseAllBikes)
+        self.assertGreater(results['BikesLost'], expected['BikesLost'])
+        results = simulation.resume(snapshot)
+        self.assertEqual(expected['BikesLost'], results['BikesLost'])
+
+    def test_runDays(self):
+        """Tests carrying the simulation state over several days."""
+        simulation = nycbike.BikeSharingSimulation()
+        expected = self._runTestSimulation(simulation)
+
+        runKwargs = dict(
+            racksPerStation=3, scaleArrivalRate=20, rngSeed=0,
+            tripDataDir=self._saveTestTripData(),
+            initialDistribution=np.array([2, 0, 1]))
+        days = simulation.runDays(4, **runKwargs)
+        statistics, inventory = next(days)
+        # The first day is the same as a single day run.
+        for key in expected:
+            np.testing.assert_array_equal(expected[key], statistics[key])
+
+        # With more racks than bikes, no customer waits to drop off a bike,
+        # so the bikes are at stations, in rides or lost.
+        days = simulation.runDays(4, **dict(
+            runKwargs, racksPerStation=31,
+            initialDistribution=np.array([10, 10, 10])))
+        bikesLost = 0
+        for statistics, inventory in days:
+            self.assertGreater(statistics['Revenue'], 0)
+            bikesLost += statistics['BikesLost']
+            numRides = sum(
+                1 for entry in simulation.simEngine._fel.entries()
+                if entry[3] is nycbike.RideEnd)
+            self.assertEqual(30, inventory.sum() + numRides + bikesLost)
+
+        # Days with other trip data must have the same stations.
+        otherTripDataDir = self._saveTestTripData()
+        np.save(os.path.join(otherTripDataDir,
+                             load_trip_stats.TRIP_COUNT_FILENAME),
+                np.ones((2, 2)))
+        days = simulation.runDays(
+            2, dayTripDataDirs=[runKwargs.pop('tripDataDir'),
+                                otherTripDataDir], **runKwargs)
+        next(days)
+        self.assertRaises(ValueError, next, days)
+
+    def test_runDays_poissonArrivals(self):
+        """Tests that the random modes agree on days of Poisson arrivals."""
+        runKwargs = dict(
+            racksPerStation=3, scaleArrivalRate=20, rngSeed=0,
+            tripDataDir=self._saveTestTripData(),
+            initialDistribution=np.array([2, 0, 1]),
+            arrivalMode=nycbike.POISSON_ARRIVALS)
+        results = {}
+        for randomMode in (randomness.SCALAR, randomness.BATCHED):
+            days = nycbike.BikeSharingSimulation().runDays(
+                3, randomMode=randomMode, **runKwargs)
+            results[randomMode] = [
+                copy.deepcopy(statistics) for statistics, _ in days]
+        for scalar, batched in zip(results[randomness.SCALAR],
+                                   results[randomness.BATCHED]):
+            for key in scalar:
+                np.testing.assert_array_equal(scalar[key], batched[key])
+        # Every day draws new arrivals.
+        self.assertNotEqual(results[randomness.SCALAR][1]['Revenue'],
+                            results[randomness.SCALAR][2]['Revenue'])
+
+    def test_run_telemetry(self):
+        """Tests that sampling the stations does not change the results."""
+        expected = self._runTestSimulation(nycbike.BikeSharingSimulation())
+        recorder = telemetry.TelemetryRecorder(interval=60)
+        results = self._runTestSimulation(
+            nycbike.BikeSharingSimulation(), telemetry=recorder)
+        for key in expected:
+            np.testing.assert_array_equal(expected[key], results[key])
+
+        arrays = recorder.arrays()
+        np.testing.assert_array_equal(
+            np.arange(0, nycbike.DAY_DURATION + 1, 60), arrays['times'])
+        self.assertEqual((25, 3), arrays['numBikes'].shape)
+        # Bikes are only lost, never created.
+        self.assertTrue(np.all(arrays['numBikes'].sum(axis=1) <= 3))
+        # Every rack holds a bike or is empty.
+        np.testing.assert_array_equal(
+            3, arrays['numBikes'] + arrays['numRacks'])
+        self.assertTrue(np.any(arrays['pickupQueue']))
+
+    def test_runReplications(self):
+        """Tests that replications do not depend on the number of workers."""
+        summaries = [self._runTestSimulation(
+            nycbike.BikeSharingSimulation(), numReplications=4,
+            workers=workers, baseSeed=3) for workers in (1, 2)]
+        for name in summaries[0]:
+            np.testing.assert_array_equal(
+                summaries[0][name]['samples'], summaries[1][name]['samples'])
+        revenue = summaries[0]['Revenue']
+        self.assertEqual(4, revenue['n'])
+        # Replications use independent random streams.
+        self.assertGreater(len(set(revenue['samples'])), 1)
+        self.assertTrue(revenue['low'] < revenue['mean'] < revenue['high'])
+
+    def _runTestSimulation(self, simulation, numReplications=None,
+                           workers=None, baseSeed=None, **runKwargs):
+        """Helper method used to run the simulation on the test data.
+
+        If numReplications is specified, the replications are run with
+        runReplications instead of a single run seeded with 0.
+        """
+        tripDataDir = self._saveTestTripData()
+        # Few bikes and racks make customers wait for pickup and dropoff.
+        runKwargs.setdefault('initialDistribution', np.array([2, 0, 1]))
+        if numReplications is not None:
+            return simulation.runReplications(
+                numReplications, workers=workers, baseSeed=baseSeed,
+                racksPerStation=3, scaleArrivalRate=20,
+                tripDataDir=tripDataDir, **runKwargs)
+        runKwargs.setdefault('rngSeed', 0)
+        return simulation.run(
+            racksPerStation=3, scaleArrivalRate=20, tripDataDir=tripDataDir,
+            **runKwargs)
+
+    def test_runReplications_targetHalfWidth(self):
+        """Tests stopping replications at a target half-width."""
+        fixed = self._runTestSimulation(
+            nycbike.BikeSharingSimulation(), numReplications=12, workers=1,
+            baseSeed=3)
+        halfWidth = fixed['Revenue']['halfWidth']
+
+        # A loose target stops after the minimum number of replications,
+        # which are the first replications of the fixed run.
+        summary = self._runTestSimulation(
+            nycbike.BikeSharingSimulation(), numReplications=12, workers=2,
+            baseSeed=3, targetHalfWidth=10 * halfWidth, minReplications=4)
+        self.assertEqual(4, summary['Revenue']['n'])
+        np.testing.assert_array_equal(
+            fixed['Revenue']['samples'][:4], summary['Revenue']['samples'])
+        self.assertLessEqual(summary['Revenue']['halfWidth'], 10 * halfWidth)
+
+        # An unreachable target uses the whole budget.
+        summary = self._runTestSimulation(
+            nycbike.BikeSharingSimulation(), numReplications=12, workers=1,
+            baseSeed=3, targetHalfWidth=0, metric='CustomersLost',
+            minReplications=4)
+        self.assertEqual(12, summary['CustomersLost']['n'])
+
+        # Antithetic pairs count as one observation.
+        summary = self._runTestSimulation(
+            nycbike.BikeSharingSimulation(), numReplications=12, workers=1,
+            baseSeed=3, antithetic=True, targetHalfWidth=float('inf'),
+            minReplications=2)
+        self.assertEqual(2, summary['Revenue']['n'])
+
+        # Unknown statistics are rejected before any replication runs.
+        self.assertRaises(
+            ValueError, nycbike.BikeSharingSimulation().runReplications, 12,
+            targetHalfWidth=1.0, metric='revenue')
+
+    def _saveTestTripData(self):
+        """Helper method used to save the test data to a trip data dir."""
+        tripDataDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tripDataDir)
+        self.addCleanup(load_trip_stats.clearTripStatisticsCache)
+        for filename, array in (
+                (load_trip_stats.TRIP_COUNT_FILENAME,
+                 np.array(self.TEST_TRIP_COUNT_DATA)),
+                (load_trip_stats.TRIP_DURATION_FILENAME,
+                 self.TEST_TRIP_DURATIONS),
+                (load_trip_stats.DESTINATION_PROBS_FILENAME,
+                 self.TEST_DEST_PROBS)):
+            np.save(os.path.join(tripDataDir, filename), array)
+        return tripDataDir
+
     def test_initializeEvent(self):
         """Tests the Initialize event."""
         self.globalData = self._initGlobalData(
@@ -107,9 +534,9 @@ class TestBikeSharingSimulation(unittest.TestCase):
         self.simEngine.schedule(initEvent)
 
         # Stations are not yet initialized.
-        self.assertEqual([], self.globalData['stations'])
-        self.assertEqual([], self.globalData['pickupQueues'])
-        self.assertEqual([], self.globalData['dropoffQueues'])
+        self.assertEqual(0, len(self.globalData['stations']))
+        self.assertEqual(0, len(self.globalData['pickupQueues']))
+        self.assertEqual(0, len(self.globalData['dropoffQueues']))
         # Arrival events are not yet scheduled.
         self.assertEqual([initEvent], self.simEngine.FEL)
 
@@ -129,6 +556,25 @@ class TestBikeSharingSimulation(unittest.TestCase):
         self.assertTrue(len(self.simEngine.FEL) > 0)
 
 
+    def test_endSimEvent(self):
+        """Tests that the endSim finalizer counts idle time to the end."""
+        self.globalData = self._initGlobalData(
+            self.TEST_NUM_STATIONS, initEntities=True)
+        stations = self.globalData['stations']
+        stations[0].lastEvent = 1000
+
+        # The finalizer runs at the end of the day although no events remain.
+        self.simEngine.addFinalizer(
+            nycbike.DAY_DURATION, nycbike.endSim, self.globalData)
+        self.assertTrue(self.simEngine.runUntil(nycbike.DAY_DURATION))
+
+        idleTime = self.globalData['statistics']['IdleTime']
+        self.assertEqual(15 * (nycbike.DAY_DURATION - 1000), idleTime[0])
+        for stationID in range(1, self.TEST_NUM_STATIONS):
+            self.assertEqual(15 * nycbike.DAY_DURATION, idleTime[stationID])
+        for station in stations:
+            self.assertEqual(nycbike.DAY_DURATION, station.lastEvent)
+
     def test_arrivalEvent_bikesAvailable(self):
         """Tests the Arrival event when bikes are available."""
         currentTime = 100
@@ -198,6 +644,33 @@ class TestBikeSharingSimulation(unittest.TestCase):
             testStationID, scheduledArrivals[0].handlerKwargs['stationID'])
 
 
+    def test_arrivalEvent_sparseDestinations(self):
+        """Tests the Arrival event with sparse destination probabilities."""
+        self.globalData = self._initGlobalData(
+            self.TEST_NUM_STATIONS, initEntities=True)
+        self.globalData['destinationP'] = (
+            load_trip_stats.SparseDestinationP.fromDense(
+                self.TEST_DEST_PROBS))
+        self.globalData['destinationSampler'] = sampling.makeSampler(
+            self.globalData['destinationP'])
+        # There are no further arrivals at the station.
+        self.globalData['arrivalTimes'] = nycbike.ArrivalSchedule.fromLists(
+            [[] for _ in range(self.TEST_NUM_STATIONS)])
+
+        # The simulation time is 00:00, so we expect station 2 to be chosen
+        # as the destination from station 0.
+        testStationID = 0
+        expectedDestID = 2
+        nycbike.Arrival(self.simEngine, globalData=self.globalData,
+                        stationID=testStationID)
+
+        # A RideEnd event was scheduled at the destination.
+        self.assertEqual(1, len(self.simEngine.FEL))
+        rideEndEvent = self.simEngine.FEL[0]
+        self.assertEqual(nycbike.RideEnd, rideEndEvent.handler)
+        self.assertEqual(
+            expectedDestID, rideEndEvent.handlerKwargs['customer'].endID)
+
     def test_arrivalEvent_noBikesAvailable(self):
         """Tests the Arrival event when no bikes are available."""
         self.globalData = self._initGlobalData(
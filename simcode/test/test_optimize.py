@@ -0,0 +1,105 @@
+"""Tests for the bike distribution optimizer."""
+
+# Standard libs.
+import os
+import shutil
+import tempfile
+import unittest
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+import simcode.src.optimize as optimize
+import simcode.test.test_nycbike as test_nycbike
+
+
+class TestOptimize(unittest.TestCase):
+    """Unit tests for the moveOneBike optimizer."""
+
+    def setUp(self):
+        """Writes the simulation test data to a temporary directory."""
+        self.tripDataDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tripDataDir)
+        self.addCleanup(load_trip_stats.clearTripStatisticsCache)
+        testData = test_nycbike.TestBikeSharingSimulation
+        for filename, array in (
+                (load_trip_stats.TRIP_COUNT_FILENAME,
+                 np.array(testData.TEST_TRIP_COUNT_DATA)),
+                (load_trip_stats.TRIP_DURATION_FILENAME,
+                 testData.TEST_TRIP_DURATIONS),
+                (load_trip_stats.DESTINATION_PROBS_FILENAME,
+                 testData.TEST_DEST_PROBS)):
+            np.save(os.path.join(self.tripDataDir, filename), array)
+
+    def _moveOneBike(self, numIters, **kwargs):
+        """Helper method used to optimize on the test data."""
+        kwargs.setdefault('initialDistribution', np.array([2.0, 0.0, 1.0]))
+        return optimize.moveOneBike(
+            numIters, racksPerStation=3, scaleArrivalRate=20,
+            tripDataDir=self.tripDataDir, **kwargs)
+
+    def test_rankStations(self):
+        """Tests the station rankings of both heuristics."""
+        distribution = np.array([0, 2, 3, 1])
+        statistics = {
+            'TimeWaitForDropoff': np.array([9.0, 1.0, 5.0, 5.0]),
+            'TimeWaitForCycle': np.array([4.0, 7.0, 0.0, 7.0]),
+            'IdleTime': np.array([3.0, 1.0, 2.0, 0.0]),
+        }
+        # Station 0 has no bike to give and station 2 no empty rack.
+        donors, receivers = optimize.rankStations(
+            distribution, statistics, optimize.WAIT_TIME, racksPerStation=3)
+        self.assertEqual([2, 3, 1], list(donors))
+        self.assertEqual([1, 3, 0], list(receivers))
+
+        donors, receivers = optimize.rankStations(
+            distribution, statistics, optimize.IDLE_TIME, racksPerStation=3)
+        self.assertEqual([2, 1, 3], list(donors))
+        self.assertEqual([3, 1, 0], list(receivers))
+
+        self.assertRaises(ValueError, optimize.rankStations,
+                          distribution, statistics, 'unknown')
+
+    def test_candidateMoves(self):
+        """Tests that candidates are ordered by rank and skip no-ops."""
+        self.assertEqual([(5, 6)],
+                         optimize.candidateMoves([5, 6], [6, 5], 1))
+        self.assertEqual(
+            [(5, 6), (5, 7), (6, 5), (6, 7)],
+            optimize.candidateMoves([5, 6], [6, 5, 7], 10))
+
+    def test_moveOneBike(self):
+        """Tests that every iteration moves one bike."""
+        result = self._moveOneBike(4, batchSize=2, seed=3)
+        self.assertEqual(5, len(result['revenues']))
+        self.assertEqual(3, result['distribution'].sum())
+        self.assertEqual(3, result['bestDistribution'].sum())
+        self.assertTrue((result['distribution'] >= 0).all())
+        self.assertTrue((result['distribution'] <= 3).all())
+        self.assertEqual(result['revenues'].max(), result['bestRevenue'])
+
+    def test_moveOneBike_resume(self):
+        """Tests that a resumed search continues the same trajectory."""
+        expected = self._moveOneBike(5, batchSize=2, seed=3)
+
+        checkpointFile = os.path.join(self.tripDataDir, 'checkpoint.npz')
+        self._moveOneBike(
+            3, batchSize=2, seed=3, checkpointFile=checkpointFile,
+            checkpointEvery=2)
+        # The initial distribution is restored from the checkpoint.
+        result = self._moveOneBike(
+            5, batchSize=2, seed=3, checkpointFile=checkpointFile,
+            initialDistribution=np.array([1.0, 1.0, 1.0]))
+        np.testing.assert_array_equal(expected['revenues'], result['revenues'])
+        np.testing.assert_array_equal(
+            expected['bestDistribution'], result['bestDistribution'])
+
+        self.assertRaises(
+            ValueError, self._moveOneBike, 6, heuristic=optimize.IDLE_TIME,
+            checkpointFile=checkpointFile)
+
+
+if __name__ == '__main__':
+    unittest.main()
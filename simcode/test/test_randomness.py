@@ -0,0 +1,117 @@
+"""Tests for the uniform random number streams."""
+
+# Standard libs.
+import copy
+import pickle
+import unittest
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.randomness as randomness
+
+
+class TestRandomStreams(unittest.TestCase):
+    """Unit tests for the scalar and batched random streams."""
+
+    def test_batchedStream_matchesScalarStream(self):
+        """Tests that both modes draw the same variates for a seed."""
+        np.random.seed(7)
+        scalarStream = randomness.makeRandomStream(randomness.SCALAR)
+        expected = [scalarStream.random() for _ in range(1000)]
+
+        np.random.seed(7)
+        # A small block size forces several refills.
+        batchedStream = randomness.makeRandomStream(
+            randomness.BATCHED, blockSize=64)
+        actual = [batchedStream.random() for _ in range(1000)]
+        self.assertEqual(expected, actual)
+
+    def test_batchedStream_refillsLazily(self):
+        """Tests that blocks are only drawn when needed."""
+        rng = np.random.RandomState(0)
+        stream = randomness.BatchedRandomStream(rng, blockSize=10)
+        stateBefore = rng.get_state()[2]
+        # Creating the stream does not draw any variates.
+        self.assertEqual(stateBefore, rng.get_state()[2])
+
+        stream.random()
+        stateAfterFirstBlock = rng.get_state()[2]
+        self.assertNotEqual(stateBefore, stateAfterFirstBlock)
+        # The rest of the block is consumed without drawing.
+        for _ in range(9):
+            stream.random()
+        self.assertEqual(stateAfterFirstBlock, rng.get_state()[2])
+        # The next variate draws a new block.
+        stream.random()
+        self.assertNotEqual(stateAfterFirstBlock, rng.get_state()[2])
+
+    def test_batchedStream_generatorSource(self):
+        """Tests drawing variates from a NumPy Generator."""
+        expected = np.random.default_rng(3).random(100).tolist()
+        stream = randomness.makeRandomStream(
+            randomness.BATCHED, source=np.random.default_rng(3),
+            blockSize=30)
+        self.assertEqual(expected, [stream.random() for _ in range(100)])
+
+    def test_tripVariates_drawnInTripOrder(self):
+        """Tests that sequential streams ignore the customer index."""
+        expected = np.random.default_rng(5).random(4).tolist()
+        stream = randomness.makeRandomStream(
+            randomness.SCALAR, source=np.random.default_rng(5))
+        self.assertEqual(
+            expected,
+            list(stream.tripVariates(7)) + list(stream.tripVariates(0)))
+
+    def test_commonStream_fixedPerCustomer(self):
+        """Tests that customers get the same variates in any order."""
+        variates = np.random.default_rng(1).random((10, 2))
+        stream = randomness.makeRandomStream(
+            randomness.COMMON, source=np.random.default_rng(1),
+            numCustomers=10)
+        for customerIndex in (9, 0, 4, 0):
+            self.assertEqual(list(variates[customerIndex]),
+                             list(stream.tripVariates(customerIndex)))
+
+    def test_commonStream_antithetic(self):
+        """Tests that antithetic variates mirror the common variates."""
+        stream = randomness.CommonRandomStream(
+            1000, source=np.random.default_rng(2))
+        antitheticStream = randomness.CommonRandomStream(
+            1000, source=np.random.default_rng(2), antithetic=True)
+        for customerIndex in range(1000):
+            u = np.array(stream.tripVariates(customerIndex))
+            v = np.array(antitheticStream.tripVariates(customerIndex))
+            np.testing.assert_allclose(np.where(u > 0, 1.0, 0.0), u + v)
+            self.assertTrue(((0 <= v) & (v < 1)).all())
+
+    def test_batchedStream_copyContinuesSequence(self):
+        """Tests that copied streams continue from the same variate."""
+        stream = randomness.BatchedRandomStream(
+            np.random.default_rng(2), blockSize=8)
+        for _ in range(5):
+            stream.random()
+        streamCopies = [copy.deepcopy(stream),
+                        pickle.loads(pickle.dumps(stream))]
+        # Copies do not share the generator.
+        expected = [stream.random() for _ in range(20)]
+        for streamCopy in streamCopies:
+            self.assertEqual(
+                expected, [streamCopy.random() for _ in range(20)])
+
+        # Streams of the np.random module are copied by reference to it.
+        streamCopy = copy.deepcopy(
+            randomness.makeRandomStream(randomness.BATCHED))
+        self.assertIs(np.random, streamCopy.source)
+        streamCopy = copy.deepcopy(
+            randomness.makeRandomStream(randomness.SCALAR))
+        self.assertIs(np.random, streamCopy.source)
+
+    def test_makeRandomStream_unknownMode(self):
+        """Tests that unknown stream modes are rejected."""
+        self.assertRaises(ValueError, randomness.makeRandomStream, 'unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""Tests for the destination samplers."""
+
+# Standard libs.
+import unittest
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.data.trip_statistics.load_trip_stats as load_trip_stats
+import simcode.src.sampling as sampling
+
+
+class TestSamplers(unittest.TestCase):
+    """Unit tests for the destination samplers."""
+
+    # Destination probabilites used in tests.
+    # Entry [i][j][k] is the probability of choosing station k as the
+    # destination from station i during time frame j.
+    TEST_DEST_PROBS = np.array([
+        [[0.0, 0.0, 1.0, 0.0], [0.1, 0.2, 0.3, 0.4]],
+        [[0.3, 0.0, 0.7, 0.0], [0.0, 0.0, 0.0, 0.0]],
+        [[0.5, 0.5, 0.0, 0.0], [0.05, 0.0, 0.05, 0.9]],
+        [[0.25, 0.25, 0.25, 0.25], [0.0, 0.0, 0.0, 1.0]],
+    ])
+
+    def _sampleFrequencies(self, sampler, stationID, timeframe, numSamples):
+        """Helper method used to estimate destination probabilities."""
+        rng = np.random.RandomState(0)
+        destinations = [sampler.sample(stationID, timeframe, u)
+                        for u in rng.random_sample(numSamples)]
+        return np.bincount(
+            destinations, minlength=self.TEST_DEST_PROBS.shape[2]) / float(
+            numSamples)
+
+    def test_choiceSampler_matchesRandomChoice(self):
+        """Tests that the choice sampler reproduces np.random.choice."""
+        sampler = sampling.makeSampler(self.TEST_DEST_PROBS, sampling.CHOICE)
+        numStations = self.TEST_DEST_PROBS.shape[0]
+        np.random.seed(1)
+        expected = [np.random.choice(numStations, p=self.TEST_DEST_PROBS[0][1])
+                    for _ in range(200)]
+        np.random.seed(1)
+        actual = [sampler.sample(0, 1, np.random.random())
+                  for _ in range(200)]
+        self.assertEqual(expected, actual)
+
+    def test_aliasSampler_distribution(self):
+        """Tests that alias tables preserve the destination probabilities."""
+        for destinationP in (
+                self.TEST_DEST_PROBS,
+                load_trip_stats.SparseDestinationP.fromDense(
+                    self.TEST_DEST_PROBS)):
+            sampler = sampling.makeSampler(destinationP, sampling.ALIAS)
+            for stationID, timeframe in ((0, 0), (0, 1), (2, 1), (3, 0)):
+                frequencies = self._sampleFrequencies(
+                    sampler, stationID, timeframe, 20000)
+                np.testing.assert_allclose(
+                    self.TEST_DEST_PROBS[stationID][timeframe], frequencies,
+                    atol=0.015)
+
+    def test_aliasSampler_zeroProbability(self):
+        """Tests that destinations with zero probability are never chosen."""
+        sampler = sampling.makeSampler(self.TEST_DEST_PROBS, sampling.ALIAS)
+        # Every column of the table is hit by evenly spaced variates.
+        for u in np.linspace(0, 1, 1000, endpoint=False):
+            self.assertNotEqual(1, sampler.sample(2, 1, u))
+            self.assertEqual(2, sampler.sample(0, 0, u))
+
+    def test_aliasSampler_sampleMany(self):
+        """Tests that batch sampling matches sampling one trip at a time."""
+        sampler = sampling.makeSampler(self.TEST_DEST_PROBS, sampling.ALIAS)
+        rng = np.random.RandomState(0)
+        stationIDs = np.array([0, 2, 3, 0, 2, 3, 3])
+        for timeframe in (0, 1):
+            u = rng.random_sample(len(stationIDs))
+            expected = [sampler.sample(stationID, timeframe, v)
+                        for stationID, v in zip(stationIDs, u)]
+            self.assertEqual(
+                expected,
+                list(sampler.sampleMany(stationIDs, timeframe, u)))
+        self.assertRaises(ValueError, sampler.sampleMany,
+                          np.array([0, 1]), 1, np.array([0.5, 0.5]))
+
+    def test_samplers_noDestinations(self):
+        """Tests sampling from a row without destinations."""
+        for method in (sampling.CHOICE, sampling.ALIAS):
+            sampler = sampling.makeSampler(self.TEST_DEST_PROBS, method)
+            self.assertRaises(ValueError, sampler.sample, 1, 1, 0.5)
+
+    def test_makeSampler_unknownMethod(self):
+        """Tests that unknown sampling methods are rejected."""
+        self.assertRaises(
+            ValueError, sampling.makeSampler, self.TEST_DEST_PROBS, 'unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""Tests for the station time series telemetry."""
+
+# Standard libs.
+import os
+import shutil
+import tempfile
+import unittest
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.engine as engine
+import simcode.src.nycbike as nycbike
+import simcode.src.telemetry as telemetry
+
+
+class TestTelemetry(unittest.TestCase):
+    """Unit tests for the TelemetryRecorder."""
+
+    def setUp(self):
+        """Sets up before each test method."""
+        self.simEngine = engine.DiscreteEventSimulationEngine()
+        self.stations = nycbike.StationTable()
+        self.pickupQueues = nycbike.QueueTable()
+        self.dropoffQueues = nycbike.QueueTable()
+
+    def _addStations(self, simEngine, payload):
+        """Event handler used to create the stations after scheduling."""
+        for stationID in range(2):
+            self.stations.append(nycbike.Station(stationID, 5, 2))
+            self.pickupQueues.append(nycbike.Queue())
+            self.dropoffQueues.append(nycbike.Queue())
+
+    def _pickup(self, simEngine, payload):
+        """Event handler used to take a bike from the first station."""
+        self.stations[0].numBikes -= 1
+        self.stations[0].numRacks += 1
+        self.pickupQueues[1].put(nycbike.Customer())
+
+    def test_recorder(self):
+        """Tests sampling at a fixed interval in blocks."""
+        recorder = telemetry.TelemetryRecorder(interval=10, blockSize=2)
+        recorder.start(self.simEngine, self.stations, self.pickupQueues,
+                       self.dropoffQueues, endTime=45)
+        self.simEngine.scheduleAt(-1, self._addStations)
+        # Samples follow the events at their timestamp.
+        self.simEngine.scheduleAt(10, self._pickup)
+        self.simEngine.scheduleAt(25, self._pickup)
+        self.simEngine.runSimulation()
+
+        arrays = recorder.arrays()
+        np.testing.assert_array_equal([0, 10, 20, 30, 40], arrays['times'])
+        np.testing.assert_array_equal(
+            [[2, 2], [1, 2], [1, 2], [0, 2], [0, 2]], arrays['numBikes'])
+        np.testing.assert_array_equal(5 - arrays['numBikes'],
+                                      arrays['numRacks'])
+        np.testing.assert_array_equal(
+            [0, 1, 1, 2, 2], arrays['pickupQueue'][:, 1])
+        self.assertFalse(np.any(arrays['dropoffQueue']))
+
+        # Save and reload the time series.
+        tempDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempDir)
+        filename = os.path.join(tempDir, 'telemetry.npz')
+        recorder.save(filename)
+        loaded = telemetry.loadTelemetry(filename)
+        self.assertEqual(set(arrays), set(loaded))
+        for name in arrays:
+            np.testing.assert_array_equal(arrays[name], loaded[name])
+
+    def test_shortageTimes(self):
+        """Tests the time stations spend without bikes or racks."""
+        arrays = {
+            'times': np.array([0.0, 10.0, 20.0, 30.0]),
+            'numBikes': np.array([[0, 3], [0, 0], [2, 0], [1, 1]]),
+            'numRacks': np.array([[3, 0], [3, 3], [1, 3], [2, 2]]),
+        }
+        noBikes, noRacks = telemetry.shortageTimes(arrays)
+        np.testing.assert_array_equal([20.0, 20.0], noBikes)
+        np.testing.assert_array_equal([0.0, 10.0], noRacks)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""Tests for the binary simulation trace."""
+
+# Standard libs.
+import logging
+import shutil
+import tempfile
+import unittest
+
+# Third-party libs.
+import numpy as np
+
+# App libs.
+import simcode.src.tracing as tracing
+
+
+def _recordAll(trace, numRecords):
+    """Records numRecords PICKUP records with increasing customer IDs."""
+    for customerID in range(numRecords):
+        trace.record(float(customerID), tracing.PICKUP, customerID,
+                     customerID % 7, customerID % 5, customerID + 10.5)
+
+
+class TestTraceRecorder(unittest.TestCase):
+    """Unit tests for TraceRecorder and the trace reader."""
+
+    def test_ringBuffer(self):
+        """Tests that the ring buffer keeps the most recent records."""
+        trace = tracing.TraceRecorder(capacity=10, chunkSize=4)
+        _recordAll(trace, 7)
+        records = trace.records()
+        self.assertEqual(tracing.TRACE_DTYPE, records.dtype)
+        self.assertEqual(list(range(7)), list(records['customerID']))
+
+        # The buffer wraps around.
+        _recordAll(trace, 16)
+        self.assertEqual(23, trace.numRecords)
+        self.assertEqual(list(range(6, 16)),
+                         list(trace.records()['customerID']))
+
+    def test_ringBuffer_chunkLargerThanCapacity(self):
+        """Tests a chunk that does not fit in the ring buffer."""
+        trace = tracing.TraceRecorder(capacity=3, chunkSize=8)
+        _recordAll(trace, 10)
+        self.assertEqual([7, 8, 9], list(trace.records()['customerID']))
+
+    def test_directory(self):
+        """Tests saving the trace in chunked .npy files."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        trace = tracing.TraceRecorder(directory=directory, chunkSize=4)
+        _recordAll(trace, 10)
+        trace.flush()
+
+        records = tracing.loadTrace(directory)
+        self.assertEqual(list(range(10)), list(records['customerID']))
+        np.testing.assert_array_equal(records, trace.records())
+        self.assertEqual(10.5, records[0]['value'])
+
+    def test_renderTrace(self):
+        """Tests rendering records as the debug log text."""
+        trace = tracing.TraceRecorder()
+        trace.record(12.5, tracing.RETURN, 3, 1)
+        trace.record(12.5, tracing.CUSTOMER_LOST, 4, 1, value=6.25)
+        trace.record(13.0, tracing.BIKE_LOST, 5, 2)
+        self.assertEqual([
+            'T=12.50, RideEnd',
+            '\t(customer 3) perfecto! i reached my destination 1 at time 12.500, my journey is complete',
+            '\t(customer 4) @#$%! u wasted my time! i waited for 6.250 minutes for a bike at stn 1, i dont want it anymore',
+            'T=13.00, RideCrash',
+            '\t(customer 5) oops! the bike was lost or damaged and I never reached stn 2',
+        ], list(tracing.renderTrace(trace.records())))
+        self.assertEqual(3, len(list(tracing.renderTrace(
+            trace.records(), eventHeaders=False))))
+
+    def test_loggingTrace(self):
+        """Tests that LoggingTrace logs the formatted records."""
+        trace = tracing.LoggingTrace()
+        with self.assertLogs(level=logging.DEBUG) as logs:
+            trace.record(1.0, tracing.NO_BIKE, 2, 3)
+        self.assertEqual(
+            ['\t(customer 2) Damn! where are all the bikes at station 3, the time is 1.000'],
+            [record.getMessage() for record in logs.records])
+
+
+if __name__ == '__main__':
+    unittest.main()